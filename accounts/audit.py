@@ -0,0 +1,182 @@
+"""
+Groups and permissions of a user at any point in time.
+
+User, Group and Permission rows are versioned by simple_history; the
+many-to-many memberships between them (user groups, user permissions,
+group permissions) are recorded as MembershipChange rows by the
+m2m_changed receivers in accounts.signals. take_checkpoint(), run
+weekly from celery beat and by manage.py checkpoint_memberships, copies
+every membership set to MembershipCheckpoint rows, so as_of() only
+replays the changes after the last checkpoint before the date asked
+for. It costs at most nine queries whatever the length of the history:
+
+    state = as_of(user.pk, datetime(2018, 3, 1, tzinfo=timezone.utc))
+    state.groups, state.permissions
+
+Memberships before the first checkpoint are only known from the
+changes recorded since this module was deployed, so a checkpoint is
+taken on deployment.
+"""
+import itertools
+from collections import namedtuple
+from operator import itemgetter
+
+from django.contrib.auth.models import Group, Permission
+from django.db import connections, router, transaction
+from django.db.models import Max
+from django.utils import timezone
+from simple_history.models import HistoricalRecords
+
+from accounts.models import (
+    MembershipChange,
+    MembershipCheckpoint,
+    MembershipKind,
+    User,
+)
+
+CHUNK_SIZE = 2000
+
+AccessState = namedtuple('AccessState', (
+    'user', 'groups', 'permissions', 'is_active', 'is_admin', 'is_superuser'))
+
+
+def through_kinds():
+    """{through model: MembershipKind}."""
+    return {field.remote_field.through: kind
+            for kind, field in MembershipKind.fields().items()}
+
+
+def current_user():
+    """The user of the request being served, as simple_history knows it."""
+    user = getattr(getattr(HistoricalRecords.thread, 'request', None),
+                   'user', None)
+    return user if user is not None and user.is_authenticated else None
+
+
+def record_change(through, instance, action, reverse, pk_set):
+    """Records an m2m_changed signal of a tracked through model."""
+    kind = through_kinds().get(through)
+    if kind is None:
+        return
+    field = MembershipKind.fields()[kind]
+    if action == 'pre_clear':
+        column, other = field.m2m_field_name(), field.m2m_reverse_field_name()
+        if reverse:
+            column, other = other, column
+        pk_set = set(through._default_manager.filter(**{
+            '%s_id' % (column,): instance.pk,
+        }).values_list('%s_id' % (other,), flat=True))
+        added = False
+    elif action in ('post_add', 'post_remove'):
+        added = action == 'post_add'
+    else:
+        return
+    changed_at, changed_by = timezone.now(), current_user()
+    MembershipChange.objects.bulk_create([MembershipChange(
+        kind=kind, source_id=pk if reverse else instance.pk,
+        target_id=instance.pk if reverse else pk, added=added,
+        changed_at=changed_at, changed_by=changed_by,
+    ) for pk in sorted(pk_set or ())])
+
+
+def take_checkpoint(chunk_size=CHUNK_SIZE):
+    """Copies every membership set; returns the checkpoint time."""
+    taken_at = timezone.now()
+    with transaction.atomic(using=router.db_for_write(MembershipCheckpoint)):
+        for kind, field in MembershipKind.fields().items():
+            source = '%s_id' % (field.m2m_field_name(),)
+            target = '%s_id' % (field.m2m_reverse_field_name(),)
+            rows = field.remote_field.through._default_manager.order_by(
+                source, target).values_list(source, target).iterator()
+            checkpoints = (MembershipCheckpoint(
+                kind=kind, source_id=pk, taken_at=taken_at,
+                target_ids=','.join(str(other) for _, other in targets),
+            ) for pk, targets in itertools.groupby(rows, key=itemgetter(0)))
+            while True:
+                batch = list(itertools.islice(checkpoints, chunk_size))
+                if not batch:
+                    break
+                MembershipCheckpoint.objects.bulk_create(batch)
+    return taken_at
+
+
+def latest_versions(model, pks, when, related=(), unversioned=False):
+    """
+    {pk: newest history row of `model` at `when`}, one query; objects
+    deleted by then are left out. With `unversioned`, objects without
+    any history row (permissions are created by migrate, in bulk) are
+    taken as they are now, at the cost of a second query.
+    """
+    history_model = model.history.model
+    history = history_model._default_manager.using(
+        router.db_for_read(history_model)).select_related(*related)
+    rows = history.filter(id__in=pks, history_date__lte=when).order_by(
+        'id', '-history_date', '-history_id')
+    if connections[rows.db].features.can_distinct_on_fields:
+        rows = rows.distinct('id')
+    latest = {}
+    for row in rows:
+        latest.setdefault(row.id, row)
+    missing = set(pks) - set(latest)
+    if unversioned and missing:
+        latest.update(model._default_manager.select_related(*related).filter(
+            pk__in=missing).exclude(pk__in=history.filter(
+                id__in=missing).values('id')).in_bulk())
+    return {pk: row for pk, row in latest.items()
+            if getattr(row, 'history_type', None) != '-'}
+
+
+def memberships(kinds, sources, when, checkpoint):
+    """{(kind, source): set of targets} at `when`, replayed from
+    `checkpoint`; two queries."""
+    state = {(kind, source): set() for kind in kinds for source in sources}
+    if not state:
+        return state
+    if checkpoint is not None:
+        for row in MembershipCheckpoint.objects.filter(
+                taken_at=checkpoint, kind__in=kinds, source_id__in=sources):
+            state[row.kind, row.source_id] = row.targets()
+    changes = MembershipChange.objects.filter(
+        kind__in=kinds, source_id__in=sources, changed_at__lte=when)
+    if checkpoint is not None:
+        changes = changes.filter(changed_at__gt=checkpoint)
+    for kind, source, target, added in changes.order_by(
+            'changed_at', 'pk').values_list(
+                'kind', 'source_id', 'target_id', 'added'):
+        if added:
+            state[kind, source].add(target)
+        else:
+            state[kind, source].discard(target)
+    return state
+
+
+def as_of(user_pk, when):
+    """The AccessState of a user at `when`, or None if the user did not
+    exist then. groups is {pk: name}, permissions a frozenset of
+    'app_label.codename', as User.get_all_permissions() returns."""
+    user = latest_versions(User, [user_pk], when).get(user_pk)
+    if user is None:
+        return None
+    checkpoint = MembershipCheckpoint.objects.filter(
+        taken_at__lte=when).aggregate(latest=Max('taken_at'))['latest']
+    direct = memberships(
+        (MembershipKind.USER_GROUP, MembershipKind.USER_PERMISSION),
+        [user_pk], when, checkpoint)
+    groups = latest_versions(
+        Group, direct[MembershipKind.USER_GROUP, user_pk], when)
+    granted = memberships((MembershipKind.GROUP_PERMISSION,), list(groups),
+                          when, checkpoint)
+    permission_pks = direct[MembershipKind.USER_PERMISSION, user_pk].union(
+        *granted.values())
+    permissions = latest_versions(Permission, permission_pks, when,
+                                  related=('content_type',), unversioned=True)
+    return AccessState(
+        user=user,
+        groups={pk: row.name for pk, row in groups.items()},
+        permissions=frozenset(
+            '%s.%s' % (row.content_type.app_label, row.codename)
+            for row in permissions.values()),
+        is_active=user.is_active,
+        is_admin=any(row.is_admin for row in groups.values()),
+        is_superuser=any(row.name == 'superuser' for row in groups.values()),
+    )
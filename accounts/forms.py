@@ -1,6 +1,7 @@
 """Accounts forms module."""
 from math import floor
 from django import forms
+from django.db import transaction
 from django.db.models import Q
 from django.contrib.auth import forms as auth_forms
 from django.contrib.auth import password_validation
@@ -28,6 +29,7 @@ from crispy_forms.layout import (
 from accounts.models import AreaCode, PhoneNumber, NationalId, Profile, User, reduce_to_alphanum
 from accounts.tokens import verify_token_generator, reset_token_generator
 from admin_console.models import CityTown, Address
+from common.validation import TRUSTED
 
 EIGHTEEN_YEARS_AGO = (timezone.now() - timezone.timedelta(days=((365*18)+5))
                       ).date()
@@ -269,14 +271,18 @@ class RegistrationForm(forms.ModelForm):
             # import pdb; pdb.set_trace()
             user = super(RegistrationForm, self).save(commit=False)
             user.set_password(self.cleaned_data["password1"])
-            if commit:
-                user.save()
-            NationalId.objects.create(
-                id_type=self.cleaned_data['national_id_type'],
-                id_number=self.cleaned_data['national_id_number'],
-                user=user,
-                is_verified=False
-            )
+            # The user, its profile, email address and national ID (and
+            # their history rows) are written in one transaction.
+            with transaction.atomic():
+                # is_valid() already validated the user; clean() still runs.
+                if commit:
+                    user.save(validation=TRUSTED)
+                NationalId.objects.create(
+                    id_type=self.cleaned_data['national_id_type'],
+                    id_number=self.cleaned_data['national_id_number'],
+                    user=user,
+                    is_verified=False
+                )
             email = self.cleaned_data['email']
             username = self.cleaned_data['username']
             for user in self.get_inactive_users(username):
@@ -0,0 +1,19 @@
+"""Copies every group and permission membership for accounts.audit."""
+from django.core.management.base import BaseCommand
+
+from accounts.audit import take_checkpoint
+from accounts.models import MembershipCheckpoint
+
+
+class Command(BaseCommand):
+    help = ('Writes a checkpoint of all user groups, user permissions and '
+            'group permissions, from which accounts.audit.as_of() replays '
+            'later changes. Run once on deployment; celery beat runs it '
+            'weekly.')
+
+    def handle(self, *args, **options):
+        taken_at = take_checkpoint()
+        self.stdout.write(self.style.SUCCESS(
+            ' %s membership sets saved at %s' % (
+                MembershipCheckpoint.objects.filter(taken_at=taken_at).count(),
+                taken_at.isoformat())))
@@ -0,0 +1,51 @@
+"""Adds many users to groups and takes them out of others at once."""
+from django.contrib.auth.models import Group
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.memberships import change_memberships, select_users
+
+
+class Command(BaseCommand):
+    help = ('Puts the users given (by username, in a file of one username '
+            'per line, or as the members of a group) in the --add groups '
+            'and takes them out of the --remove groups, in one transaction.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('usernames', nargs='*')
+        parser.add_argument('--file', help='File of usernames, one per line.')
+        parser.add_argument('--members-of', action='append', default=[],
+                            metavar='GROUP',
+                            help='Also every member of GROUP; may be '
+                                 'repeated.')
+        parser.add_argument('--add', action='append', default=[],
+                            metavar='GROUP', help='May be repeated.')
+        parser.add_argument('--remove', action='append', default=[],
+                            metavar='GROUP', help='May be repeated.')
+
+    def groups(self, names):
+        groups = Group.objects.in_bulk(names, field_name='name')
+        unknown = set(names) - set(groups)
+        if unknown:
+            raise CommandError('Unknown groups: %s.' % (
+                ', '.join(sorted(unknown)),))
+        return [groups[name] for name in names]
+
+    def handle(self, *args, **options):
+        if not options['add'] and not options['remove']:
+            raise CommandError('Give at least one --add or --remove group.')
+        usernames = list(options['usernames'])
+        if options['file']:
+            with open(options['file']) as names:
+                usernames.extend(line.strip() for line in names
+                                 if line.strip())
+        try:
+            user_pks = select_users(usernames,
+                                    self.groups(options['members_of']))
+            report = change_memberships(user_pks,
+                                        add=self.groups(options['add']),
+                                        remove=self.groups(options['remove']))
+        except ValueError as error:
+            raise CommandError(error)
+        self.stdout.write(self.style.SUCCESS(
+            ' %s users: %s memberships added, %s removed.' % (
+                len(user_pks), report.added, report.removed)))
@@ -0,0 +1,40 @@
+"""Prints the groups and permissions a user had at a given time."""
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from accounts.audit import as_of
+from accounts.models import User
+
+
+class Command(BaseCommand):
+    help = ('Prints the groups and permissions USERNAME had at WHEN '
+            '(YYYY-MM-DD or an ISO datetime, in the current time zone).')
+
+    def add_arguments(self, parser):
+        parser.add_argument('username')
+        parser.add_argument('when')
+
+    def handle(self, *args, **options):
+        when = parse_datetime(options['when'])
+        if when is None and parse_date(options['when']) is not None:
+            when = parse_datetime(options['when'] + 'T23:59:59.999999')
+        if when is None:
+            raise CommandError('%s is not a date.' % (options['when'],))
+        if timezone.is_naive(when):
+            when = timezone.make_aware(when)
+        # Also finds users renamed or deleted since.
+        user_pk = User.history.filter(username=options['username']).values_list(
+            'id', flat=True).first()
+        state = user_pk and as_of(user_pk, when)
+        if not state:
+            raise CommandError('%s did not exist at %s.' % (
+                options['username'], when.isoformat()))
+        self.stdout.write(' %s at %s%s' % (
+            options['username'], when.isoformat(),
+            '' if state.is_active else ' (inactive)'))
+        self.stdout.write(' Groups: %s' % (
+            ', '.join(sorted(state.groups.values())) or '-',))
+        self.stdout.write(' Permissions:')
+        for permission in sorted(state.permissions):
+            self.stdout.write('  %s' % (permission,))
@@ -0,0 +1,43 @@
+"""Prunes history rows per settings.HISTORY_RETENTION."""
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.template.defaultfilters import filesizeformat
+
+from common.retention import prune
+
+
+class Command(BaseCommand):
+    help = ('Deletes the history rows settings.HISTORY_RETENTION does not '
+            'keep, one short transaction per chunk, and reports the rows '
+            'and the (estimated) space freed per model.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('models', nargs='*', metavar='app_label.Model',
+                            help='Only prune the history of these models.')
+        parser.add_argument('--chunk-size', type=int,
+                            default=settings.HISTORY_PRUNE_CHUNK_SIZE)
+        parser.add_argument('--pause', type=float, default=0,
+                            help='Seconds to sleep between chunks.')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only report what would be deleted.')
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        verb = 'would be deleted' if options['dry_run'] else 'deleted'
+        total_rows, total_bytes = 0, 0
+        for report in prune(dry_run=options['dry_run'],
+                            labels=options['models'],
+                            chunk_size=options['chunk_size'],
+                            pause=options['pause']):
+            size = ('unknown size' if report.reclaimed_bytes is None else
+                    filesizeformat(report.reclaimed_bytes))
+            self.stdout.write(' %s: %s of %s rows %s (%s)' % (
+                report.label, report.deleted, report.rows, verb, size))
+            total_rows += report.deleted
+            total_bytes += report.reclaimed_bytes or 0
+        self.stdout.write(self.style.SUCCESS(
+            ' %s history rows %s, about %s, in %.1fs' % (
+                total_rows, verb, filesizeformat(total_bytes),
+                time.perf_counter() - start)))
@@ -0,0 +1,92 @@
+"""
+Group membership changes for many users at once.
+
+change_memberships() adds users to groups and takes them out of others
+with set-based statements on the User.groups through table, in one
+transaction. Per group and CHUNK_SIZE users it runs one SELECT of the
+current members, then one INSERT of the missing ones or one DELETE of
+the present ones. Only real changes are written and recorded for
+accounts.audit, with one bulk insert of MembershipChange rows per group
+and chunk, and the permission bitsets of the users changed are dropped
+once for the whole batch. m2m_changed is not sent.
+
+e.g.:
+    employee, candidate = Group.objects.get(...), Group.objects.get(...)
+    change_memberships(user_pks, add=[employee], remove=[candidate])
+"""
+from collections import namedtuple
+
+from django.db import router, transaction
+
+from accounts import permission_bits
+from accounts.audit import record_change
+from accounts.models import User
+
+CHUNK_SIZE = 500
+
+MembershipReport = namedtuple('MembershipReport', ('added', 'removed'))
+
+
+def member_pks(through, group, user_pks, using):
+    return set(through._default_manager.using(using).filter(
+        group_id=group.pk, user_id__in=user_pks).values_list(
+            'user_id', flat=True))
+
+
+def change_memberships(user_pks, add=(), remove=(), chunk_size=CHUNK_SIZE):
+    """
+    Puts the users `user_pks` in the groups `add` and takes them out of
+    the groups `remove`; returns a MembershipReport of the number of
+    memberships added and removed.
+    """
+    add, remove = list(add), list(remove)
+    both = {group.pk for group in add} & {group.pk for group in remove}
+    if both:
+        raise ValueError('Groups cannot be both added and removed: %s.' % (
+            ', '.join(group.name for group in add if group.pk in both),))
+    through = User.groups.through
+    using = router.db_for_write(through)
+    user_pks = sorted(set(user_pks))
+    changed, added, removed = set(), 0, 0
+    with transaction.atomic(using=using):
+        for start in range(0, len(user_pks), chunk_size):
+            chunk = user_pks[start:start + chunk_size]
+            for group in add:
+                members = member_pks(through, group, chunk, using)
+                new = [pk for pk in chunk if pk not in members]
+                if not new:
+                    continue
+                through._default_manager.using(using).bulk_create([
+                    through(group_id=group.pk, user_id=pk) for pk in new])
+                record_change(through, group, 'post_add', True, new)
+                changed.update(new)
+                added += len(new)
+            for group in remove:
+                gone = sorted(member_pks(through, group, chunk, using))
+                if not gone:
+                    continue
+                through._default_manager.using(using).filter(
+                    group_id=group.pk, user_id__in=gone).delete()
+                record_change(through, group, 'post_remove', True, gone)
+                changed.update(gone)
+                removed += len(gone)
+        if changed:
+            permission_bits.invalidate_users(changed)
+    return MembershipReport(added, removed)
+
+
+def select_users(usernames=(), members_of=()):
+    """pks of the users named `usernames` and of the members of the
+    groups `members_of`, one query; raises ValueError naming unknown
+    usernames."""
+    usernames = set(usernames)
+    queryset = User.objects.none()
+    if usernames:
+        queryset = User.objects.filter(username__in=usernames)
+    if members_of:
+        queryset = queryset | User.objects.filter(groups__in=members_of)
+    found = dict(queryset.order_by().distinct().values_list('pk', 'username'))
+    unknown = usernames - set(found.values())
+    if unknown:
+        raise ValueError('Unknown users: %s.' % (', '.join(sorted(unknown)),))
+    return sorted(found)
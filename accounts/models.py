@@ -9,11 +9,14 @@ from django.contrib.auth.models import (
     GroupManager,
     Permission
 )
-from django.db import models
+from django.db import IntegrityError, models, router, transaction
 from django.utils.text import slugify
 from django.utils.translation import gettext_lazy as _
 from simple_history import register
-from simple_history.models import HistoricalRecords
+
+from accounts.permission_bits import permission_bits
+from common.history import BufferedHistoricalRecords
+from common.validation import validate
 
 
 def user_directory_path(instance, filename):
@@ -78,25 +81,80 @@ Group.add_to_class('is_supervisor', models.BooleanField(default=False))
 Group.add_to_class('is_admin', models.BooleanField(default=False))
 # Group.add_to_class('history', HistoricalRecords())
 # simple_history register Groups and Permissions
-register(Group)
-register(Permission)
+register(Group, records_class=BufferedHistoricalRecords)
+register(Permission, records_class=BufferedHistoricalRecords)
 
-class EmailAddressManager(models.Manager):
-    """Custom manager for email addresses."""
-    def set_as_primary(self, email, user=None):
+class PrimaryContactManager(models.Manager):
+    """
+    Base manager for contact models holding at most one primary row per
+    user, which a partial unique index on (user_id) WHERE is_primary
+    enforces (see accounts.signals.create_primary_contact_indexes).
+    """
+    lookup_field = None
+
+    def resolve(self, contact, user=None):
+        """Accepts an instance, a pk or the value of lookup_field."""
+        if isinstance(contact, int):
+            return self.get_queryset().get(pk=contact)
+        if isinstance(contact, str):
+            lookup = {self.lookup_field: contact}
+            if user is not None:
+                lookup['user'] = user
+            return self.get_queryset().get(**lookup)
+        return contact
+
+    def set_as_primary(self, contact, user=None):
         """
-        Sets an email as primary for a particular user.
+        Makes contact its user's primary one. Passing the instance saves
+        the lookup. Unique indexes are checked row by row, so the current
+        primary is un-flagged before the new one is flagged, both in one
+        transaction; a concurrent switch for the same user fails on the
+        index instead of leaving two primaries.
         """
-        if isinstance(email, int):
-            email = self.get_queryset().get(pk=email)
-        if isinstance(email, str):
-            email = self.get_queryset().get(email=email)
-        if user is None:
-            user = email.user
-        user.email_addresses.all().update(is_primary=False)
-        self.get_queryset().filter(pk=email.pk).update(is_primary=True)
-        User.objects.filter(pk=user.pk).update(email=email.email)
-        return email
+        contact = self.resolve(contact, user)
+        user_id = user.pk if user is not None else contact.user_id
+        with transaction.atomic(using=self.db):
+            (self.get_queryset()
+             .filter(user_id=user_id, is_primary=True)
+             .exclude(pk=contact.pk)
+             .update(is_primary=False))
+            self.get_queryset().filter(pk=contact.pk).update(is_primary=True)
+            self.primary_changed(contact, user_id)
+        contact.is_primary = True
+        return contact
+
+    def primary_changed(self, contact, user_id):
+        """Hook for denormalized copies of the primary contact."""
+
+
+def save_contact(contact, save, *args, **kwargs):
+    """
+    Saves an EmailAddress or PhoneNumber through `save`. A new contact
+    becomes primary when its user has none yet, which an existence probe
+    decides; if a concurrent insert wins that race the partial unique
+    index rejects this one, and it is stored as a secondary contact.
+    """
+    if not contact._state.adding or contact.is_primary:
+        return save(*args, **kwargs)
+    manager = type(contact)._default_manager
+    if manager.filter(user_id=contact.user_id, is_primary=True).exists():
+        return save(*args, **kwargs)
+    contact.is_primary = True
+    try:
+        with transaction.atomic(using=kwargs.get('using') or
+                                router.db_for_write(type(contact))):
+            return save(*args, **kwargs)
+    except IntegrityError:
+        contact.is_primary = False
+        return save(*args, **kwargs)
+
+
+class EmailAddressManager(PrimaryContactManager):
+    """Custom manager for email addresses."""
+    lookup_field = 'email'
+
+    def primary_changed(self, contact, user_id):
+        User.objects.filter(pk=user_id).update(email=contact.email)
 
 
 class EmailAddress(models.Model):
@@ -118,7 +176,7 @@ class EmailAddress(models.Model):
                           related_name='%(app_label)s_%(class)s_modified_by',
                           on_delete=models.SET_NULL, null=True,
                           blank=True))
-    history = HistoricalRecords()
+    history = BufferedHistoricalRecords()
 
     objects = EmailAddressManager()
 
@@ -126,10 +184,9 @@ class EmailAddress(models.Model):
         return '%s: %s' % (self.user.username, self.email,)
 
     def save(self, *args, **kwargs):
-        if self.user.email_addresses.count() == 0:
-            self.is_primary = True
-        self.full_clean()
-        super(EmailAddress, self).save(*args, **kwargs)
+        validate(self, kwargs.pop('validation', None),
+                 kwargs.get('update_fields'))
+        save_contact(self, super(EmailAddress, self).save, *args, **kwargs)
 
 
 class ModGroupManager(models.Manager):
@@ -187,7 +244,7 @@ class AreaCode(models.Model):
                           related_name='%(app_label)s_%(class)s_modified_by',
                           on_delete=models.SET_NULL, null=True,
                           blank=True))
-    history = HistoricalRecords()
+    history = BufferedHistoricalRecords()
     PREFIX_CHOICES = [
         (i, c) for i, c in zip(
             list(range(len(PREFIX_CHOICES))), PREFIX_CHOICES)]
@@ -205,7 +262,8 @@ class AreaCode(models.Model):
         return self.code
 
     def save(self, *args, **kwargs):
-        self.full_clean()
+        validate(self, kwargs.pop('validation', None),
+                 kwargs.get('update_fields'))
         return super(AreaCode, self).save(*args, **kwargs)
 
     def clean(self, *args, **kwargs):
@@ -228,20 +286,8 @@ class AreaCode(models.Model):
         self.modified_by = value
 
 
-class PhoneNumberManager(models.Manager):
-    def set_as_primary(self, phone_number, user=None):
-        """
-        Sets an phone number as primary for a particular user.
-        """
-        if isinstance(phone_number, int):
-            phone_number = self.get_queryset().get(pk=phone_number)
-        if isinstance(phone_number, str):
-            phone_number = self.get_queryset().get(phone_number=phone_number)
-        if user is None:
-            user = phone_number.user
-        user.phone_numbers.all().update(is_primary=False)
-        self.get_queryset().filter(pk=phone_number.pk).update(is_primary=True)
-        return phone_number
+class PhoneNumberManager(PrimaryContactManager):
+    lookup_field = 'phone_number'
 
 
 class PhoneNumber(models.Model):
@@ -262,7 +308,7 @@ class PhoneNumber(models.Model):
         blank=False,
         null=False
     )
-    history = HistoricalRecords()
+    history = BufferedHistoricalRecords()
     modified_by = (
         models.ForeignKey(settings.AUTH_USER_MODEL,
                           related_name='%(app_label)s_%(class)s_modified_by',
@@ -274,10 +320,9 @@ class PhoneNumber(models.Model):
         return '(%s)%s-%s' % (self.area_code, self.phone_number[:3], self.phone_number[3:])
 
     def save(self, *args, **kwargs):
-        if self.user.phone_numbers.count() == 0:
-            self.is_primary = True
-        self.full_clean()
-        super(PhoneNumber, self).save(*args, **kwargs)
+        validate(self, kwargs.pop('validation', None),
+                 kwargs.get('update_fields'))
+        save_contact(self, super(PhoneNumber, self).save, *args, **kwargs)
 
     def clean(self, *args, **kwargs):
         self.phone_number = reduce_to_alphanum(self.phone_number)
@@ -348,7 +393,7 @@ class User(AbstractBaseUser, PermissionsMixin):
     is_verified = models.BooleanField(default=False)
     employee_status = models.IntegerField(choices=EMPLOYEE_STATUS_CHOICES,
                                           default=NEVER_EMPLOYED)
-    history = HistoricalRecords()
+    history = BufferedHistoricalRecords()
 
     objects = CustomUserManager()
 
@@ -363,7 +408,8 @@ class User(AbstractBaseUser, PermissionsMixin):
         super(User, self).clean(*args, **kwargs)
 
     def save(self, *args, **kwargs):
-        self.full_clean()
+        validate(self, kwargs.pop('validation', None),
+                 kwargs.get('update_fields'))
         super(User, self).save(*args, **kwargs)
 
     def get_full_name(self):
@@ -377,13 +423,30 @@ class User(AbstractBaseUser, PermissionsMixin):
         """Return user's username."""
         return self.username
 
-    # def has_perm(self, perm, obj=None):
-    #     if not self.is_admin:
+    # Checks without an object are bit tests on the permissions compiled
+    # by accounts.permission_bits; object permissions go through the
+    # backends.
+
+    def has_perm(self, perm, obj=None):
+        if obj is not None:
+            return super(User, self).has_perm(perm, obj)
+        return self.is_active and permission_bits(self).has_perm(perm)
+
+    def has_perms(self, perm_list, obj=None):
+        if obj is not None:
+            return super(User, self).has_perms(perm_list, obj)
+        return self.is_active and permission_bits(self).has_perms(perm_list)
 
-    #     return True
+    def has_module_perms(self, app_label):
+        return self.is_active and permission_bits(self).has_module_perms(
+            app_label)
 
-    # def has_module_perms(self, app_label):
-    #     return True
+    def get_all_permissions(self, obj=None):
+        if obj is not None:
+            return super(User, self).get_all_permissions(obj)
+        if not self.is_active:
+            return set()
+        return permission_bits(self).permissions()
 
     @property
     def is_staff(self):
@@ -410,7 +473,7 @@ class User(AbstractBaseUser, PermissionsMixin):
     @property
     def is_superuser(self):
         """Returns true if the user is the superuser."""
-        return 'superuser' in self.groups.all().values_list('name', flat=True)
+        return permission_bits(self).superuser
 
     def get_group_permissions(self, obj=None):
         """
@@ -451,7 +514,7 @@ class NationalId(models.Model):
         blank=True,
         null=True
     )
-    history = HistoricalRecords()
+    history = BufferedHistoricalRecords()
     modified_by = (
         models.ForeignKey(settings.AUTH_USER_MODEL,
                           related_name='%(app_label)s_%(class)s_last_modified',
@@ -459,7 +522,8 @@ class NationalId(models.Model):
                           blank=True))
 
     def save(self, *args, **kwargs):
-        self.full_clean()
+        validate(self, kwargs.pop('validation', None),
+                 kwargs.get('update_fields'))
         super(NationalId, self).save(*args, **kwargs)
 
     def delete(self, *args, **kwargs):
@@ -507,7 +571,7 @@ class Profile(models.Model):
                                 on_delete=models.CASCADE,
                                 blank=True,
                                 null=True)
-    history = HistoricalRecords()
+    history = BufferedHistoricalRecords()
     modified_by = (
         models.ForeignKey(settings.AUTH_USER_MODEL,
                           related_name='%(app_label)s_%(class)s_last_modified',
@@ -532,3 +596,67 @@ class Profile(models.Model):
     @_history_user.setter
     def _history_user(self, value):
         self.modified_by = value
+
+
+class MembershipKind:
+    """The many-to-many relations MembershipChange tracks, as (model,
+    field) of their forward side."""
+    USER_GROUP = 0
+    USER_PERMISSION = 1
+    GROUP_PERMISSION = 2
+    CHOICES = (
+        (USER_GROUP, _('User groups')),
+        (USER_PERMISSION, _('User permissions')),
+        (GROUP_PERMISSION, _('Group permissions')),
+    )
+
+    @classmethod
+    def fields(cls):
+        return {
+            cls.USER_GROUP: User._meta.get_field('groups'),
+            cls.USER_PERMISSION: User._meta.get_field('user_permissions'),
+            cls.GROUP_PERMISSION: Group._meta.get_field('permissions'),
+        }
+
+
+class MembershipChange(models.Model):
+    """
+    One target (group or permission) added to or removed from a source
+    (user or group), recorded from m2m_changed; see accounts.audit.
+    """
+    kind = models.PositiveSmallIntegerField(choices=MembershipKind.CHOICES)
+    source_id = models.IntegerField()
+    target_id = models.IntegerField()
+    added = models.BooleanField()
+    changed_at = models.DateTimeField(editable=False)
+    changed_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL, related_name='+', on_delete=models.SET_NULL,
+        null=True, blank=True)
+
+    class Meta:
+        ordering = ('changed_at', 'pk')
+        indexes = [models.Index(fields=['kind', 'source_id', 'changed_at'],
+                                name='membership_change_idx')]
+
+    def __str__(self):
+        return '%s %s %s %s' % (self.get_kind_display(), self.source_id,
+                                '+' if self.added else '-', self.target_id)
+
+
+class MembershipCheckpoint(models.Model):
+    """
+    The targets of one source at taken_at; every checkpoint run writes
+    the non-empty sets of all sources with the same taken_at. Replaying
+    MembershipChange rows from the last run gives any later state.
+    """
+    kind = models.PositiveSmallIntegerField(choices=MembershipKind.CHOICES)
+    source_id = models.IntegerField()
+    target_ids = models.TextField()
+    taken_at = models.DateTimeField(editable=False)
+
+    class Meta:
+        indexes = [models.Index(fields=['taken_at', 'kind', 'source_id'],
+                                name='membership_checkpoint_idx')]
+
+    def targets(self):
+        return set(int(pk) for pk in self.target_ids.split(',') if pk)
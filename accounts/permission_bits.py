@@ -0,0 +1,190 @@
+"""
+Each user's model permissions compiled into one integer bitset.
+
+Bit p of a user's bitset is set when the user holds the Permission with
+pk p, directly or through a group; members of the 'superuser' group
+hold every permission. The names of the user's groups are kept with
+the bits. Both are compiled with two queries and kept in the shared
+cache, so every process reads the same bits:
+
+    version     bumped when a group's permissions, a group or a
+                permission change, which makes every bitset stale
+    user bits   under '<version>:<user pk>', dropped when that user's
+                groups or permissions change
+
+accounts.signals does both, once when the change is made and again when
+its transaction commits. Each process keeps the permission-code table
+('app_label.codename' to pk) of the current version, loaded with one
+query. A user instance keeps its bits once read, as ModelBackend keeps
+its permission cache, so with both warm user.has_perm(perm) is a
+dictionary lookup and a bit test. User sends checks without an object
+here; object permissions still go through the backends (guardian).
+
+e.g.:
+    bits = permission_bits(request.user)
+    bits.has_perm('accounts.change_user')
+"""
+import threading
+from uuid import uuid4
+
+from django.contrib.auth.models import Group, Permission
+from django.core.cache import cache
+from django.db import transaction
+
+VERSION_KEY = 'permission-bits-version'
+BITS_TIMEOUT = 60 * 60 * 24
+SUPERUSER_GROUP = 'superuser'
+
+_lock = threading.Lock()
+_table = None
+
+
+class PermissionTable:
+    """The pk of every permission by 'app_label.codename', and the bits
+    of each app's permissions."""
+
+    def __init__(self, version):
+        self.version = version
+        self.pks = {}
+        self.codes = {}
+        self.app_bits = {}
+        self.all_bits = 0
+        for pk, app_label, codename in Permission.objects.order_by(
+                ).values_list('pk', 'content_type__app_label', 'codename'):
+            code = '%s.%s' % (app_label, codename)
+            self.pks[code] = pk
+            self.codes[pk] = code
+            self.app_bits[app_label] = self.app_bits.get(app_label, 0) | 1 << pk
+            self.all_bits |= 1 << pk
+
+    def bits_of(self, perms):
+        """The bits of `perms`, or None if one of them does not exist."""
+        bits = 0
+        for perm in perms:
+            pk = self.pks.get(perm)
+            if pk is None:
+                return None
+            bits |= 1 << pk
+        return bits
+
+
+class PermissionBits:
+    """The compiled permissions and group names of one user. Whether
+    the user is active is left to the caller, as it is read from the
+    user row."""
+
+    __slots__ = ('table', 'groups', 'superuser', 'bits')
+
+    def __init__(self, table, groups, bits):
+        self.table = table
+        self.groups = groups
+        self.superuser = SUPERUSER_GROUP in groups
+        self.bits = table.all_bits if self.superuser else bits
+
+    def has_perm(self, perm):
+        if self.superuser:
+            return True
+        pk = self.table.pks.get(perm)
+        return pk is not None and self.bits >> pk & 1 == 1
+
+    def has_perms(self, perms):
+        if self.superuser:
+            return True
+        bits = self.table.bits_of(perms)
+        return bits is not None and self.bits & bits == bits
+
+    def has_module_perms(self, app_label):
+        return self.superuser or bool(
+            self.bits & self.table.app_bits.get(app_label, 0))
+
+    def permissions(self):
+        """{'app_label.codename'}, as ModelBackend.get_all_permissions()."""
+        return {code for pk, code in self.table.codes.items()
+                if self.bits >> pk & 1}
+
+
+def current_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, uuid4().hex, None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def get_table(version):
+    """This process's permission-code table, reloaded if the version
+    moved."""
+    global _table
+    table = _table
+    if table is None or table.version != version:
+        with _lock:
+            table = _table
+            if table is None or table.version != version:
+                table = _table = PermissionTable(version)
+    return table
+
+
+def bits_key(version, user_pk):
+    return 'permission-bits:groups:%s:%s' % (version, user_pk)
+
+
+def compile_bits(user_pk):
+    """(group names, bits) of a user, from the database."""
+    groups = frozenset(Group.objects.filter(user=user_pk).values_list(
+        'name', flat=True))
+    if SUPERUSER_GROUP in groups:
+        return groups, 0
+    direct = Permission.objects.filter(user=user_pk).order_by(
+        ).values_list('pk', flat=True)
+    granted = Permission.objects.filter(group__user=user_pk).order_by(
+        ).values_list('pk', flat=True)
+    bits = 0
+    for pk in direct.union(granted):
+        bits |= 1 << pk
+    return groups, bits
+
+
+def load_bits(user_pk):
+    """The PermissionBits of a user, from the cache or compiled."""
+    version = current_version()
+    table = get_table(version)
+    if user_pk is None:
+        return PermissionBits(table, frozenset(), 0)
+    key = bits_key(version, user_pk)
+    compiled = cache.get(key)
+    if compiled is None:
+        compiled = compile_bits(user_pk)
+        cache.set(key, compiled, BITS_TIMEOUT)
+    return PermissionBits(table, *compiled)
+
+
+def permission_bits(user):
+    """The PermissionBits of a user instance, read once per instance."""
+    bits = user.__dict__.get('_permission_bits')
+    if bits is None:
+        bits = user.__dict__['_permission_bits'] = load_bits(user.pk)
+    return bits
+
+
+def forget(user):
+    """Makes a user instance read its bits again."""
+    user.__dict__.pop('_permission_bits', None)
+
+
+def _now_and_on_commit(func):
+    # Again on commit: a process may have compiled the old memberships
+    # in the meantime.
+    func()
+    transaction.on_commit(func)
+
+
+def bump_version():
+    """Makes every bitset stale."""
+    _now_and_on_commit(lambda: cache.set(VERSION_KEY, uuid4().hex, None))
+
+
+def invalidate_users(user_pks):
+    """Drops the bitsets of some users."""
+    user_pks = list(user_pks)
+    _now_and_on_commit(lambda: cache.delete_many(
+        [bits_key(current_version(), pk) for pk in user_pks]))
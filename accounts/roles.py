@@ -0,0 +1,123 @@
+"""
+The groups create_initial_groups keeps in line with accounts/roles.json.
+
+The spec maps each group name to its flags and, optionally, the
+permissions it holds, as 'app_label.codename' patterns with fnmatch
+wildcards; a leading '!' takes out what the patterns before it matched:
+
+    "recruiter": {
+        "is_supervisor": false,
+        "permissions": ["applications.*", "!applications.delete_*"]
+    }
+
+sync() reads the permissions, the groups of the spec and what they hold
+(three queries), and applies the difference in one transaction: missing
+groups are created, changed flags saved, and each group whose
+permissions differ gets one add() and one remove(), a single bulk
+INSERT or DELETE on the through table each. m2m_changed is still sent,
+so accounts.audit and accounts.permission_bits follow. Groups without
+"permissions" keep whatever was granted to them; groups missing from
+the spec are left alone.
+
+e.g.:
+    for change in sync(load_spec(), dry_run=True):
+        print(change.name, change.added, change.removed)
+"""
+import fnmatch
+import json
+import os
+from collections import OrderedDict, defaultdict, namedtuple
+
+from django.contrib.auth.models import Group, Permission
+from django.db import router, transaction
+
+SPEC_PATH = os.path.join(os.path.dirname(__file__), 'roles.json')
+FLAGS = ('is_supervisor', 'is_admin')
+ROLE_KEYS = FLAGS + ('permissions',)
+
+RoleChange = namedtuple('RoleChange',
+                        ('name', 'created', 'flags', 'added', 'removed'))
+
+
+def load_spec(path=SPEC_PATH):
+    """{group name: role} from a JSON spec; raises ValueError when it is
+    malformed."""
+    with open(path) as spec_file:
+        spec = json.load(spec_file, object_pairs_hook=OrderedDict)
+    for name, role in spec.items():
+        unknown = set(role) - set(ROLE_KEYS)
+        if unknown:
+            raise ValueError('Unknown keys for role %s: %s.' % (
+                name, ', '.join(sorted(unknown))))
+    return spec
+
+
+def permission_codes():
+    """{'app_label.codename': pk} of every permission."""
+    return {'%s.%s' % (app_label, codename): pk
+            for pk, app_label, codename in Permission.objects.values_list(
+                'pk', 'content_type__app_label', 'codename')}
+
+
+def resolve(patterns, codes):
+    """The codes among `codes` that `patterns` select. A pattern without
+    wildcards must name an existing permission."""
+    selected = set()
+    for pattern in patterns:
+        exclude = pattern.startswith('!')
+        pattern = pattern.lstrip('!')
+        matched = set(fnmatch.filter(codes, pattern))
+        if not matched and not any(char in pattern for char in '*?['):
+            raise ValueError('Unknown permission %s.' % (pattern,))
+        if exclude:
+            selected -= matched
+        else:
+            selected |= matched
+    return selected
+
+
+def sync(spec, dry_run=False):
+    """Brings the groups of `spec` in line with it; returns a RoleChange
+    per group created or changed. With dry_run nothing is written."""
+    using = router.db_for_write(Group)
+    changes = []
+    with transaction.atomic(using=using):
+        codes = permission_codes()
+        names = {pk: code for code, pk in codes.items()}
+        groups = Group.objects.using(using).in_bulk(list(spec),
+                                                    field_name='name')
+        held = defaultdict(set)
+        for group_pk, permission_pk in Group.permissions.through.objects.using(
+                using).filter(group__name__in=list(spec)).values_list(
+                    'group_id', 'permission_id'):
+            held[group_pk].add(permission_pk)
+        for name, role in spec.items():
+            group = groups.get(name)
+            flags = OrderedDict(
+                (flag, role[flag]) for flag in FLAGS if flag in role and (
+                    group is None or getattr(group, flag) != role[flag]))
+            current = held[group.pk] if group is not None else set()
+            wanted = current
+            if 'permissions' in role:
+                wanted = {codes[code]
+                          for code in resolve(role['permissions'], codes)}
+            added, removed = wanted - current, current - wanted
+            if group is not None and not (flags or added or removed):
+                continue
+            changes.append(RoleChange(
+                name, group is None, flags,
+                sorted(names[pk] for pk in added),
+                sorted(names[pk] for pk in removed)))
+            if dry_run:
+                continue
+            if group is None:
+                group = Group.objects.using(using).create(name=name, **flags)
+            elif flags:
+                for flag, value in flags.items():
+                    setattr(group, flag, value)
+                group.save(using=using, update_fields=list(flags))
+            if added:
+                group.permissions.add(*added)
+            if removed:
+                group.permissions.remove(*removed)
+    return changes
@@ -1,9 +1,19 @@
 """Applications signals module"""
 from django.core.exceptions import ValidationError
-from django.db.models.signals import post_save
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.contrib.auth.models import Group, Permission
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_migrate,
+    post_save,
+)
 from django.dispatch import receiver
 
-from accounts.models import User, Profile, EmailAddress
+from accounts import permission_bits
+from accounts.audit import record_change
+from accounts.models import User, Profile, EmailAddress, PhoneNumber
+from common.validation import TRUSTED
 
 @receiver(post_save, sender=User)
 #pylint: disable=W0613
@@ -18,6 +28,84 @@ def create_email_for_user(sender, instance, created, **kwargs):
     """Create and assign an object after a User object is
     created."""
     if created:
-        EmailAddress.objects.create(email=instance.email,
-                                    is_primary=True,
-                                    user=instance)
\ No newline at end of file
+        # The address was validated with the user; the unique index on
+        # email still guards against duplicates.
+        EmailAddress(email=instance.email,
+                     is_primary=True,
+                     user=instance).save(validation=TRUSTED)
+
+@receiver(m2m_changed, sender=User.groups.through)
+@receiver(m2m_changed, sender=User.user_permissions.through)
+@receiver(m2m_changed, sender=Group.permissions.through)
+def record_membership_change(sender, instance, action, reverse, pk_set,
+                             **kwargs):
+    """Keeps the membership changes accounts.audit replays."""
+    record_change(sender, instance, action, reverse, pk_set)
+
+@receiver(m2m_changed, sender=User.groups.through)
+@receiver(m2m_changed, sender=User.user_permissions.through)
+def invalidate_user_permission_bits(sender, instance, action, reverse,
+                                    pk_set, **kwargs):
+    """Drops the compiled permissions of the users whose groups or
+    permissions changed; clearing a group or permission's users makes
+    every bitset stale."""
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        permission_bits.forget(instance)
+        permission_bits.invalidate_users([instance.pk])
+    elif pk_set is None:
+        permission_bits.bump_version()
+    else:
+        permission_bits.invalidate_users(pk_set)
+
+@receiver(m2m_changed, sender=Group.permissions.through)
+def invalidate_group_permission_bits(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        permission_bits.bump_version()
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+@receiver(post_save, sender=Permission)
+@receiver(post_delete, sender=Permission)
+def invalidate_permission_bits(sender, **kwargs):
+    """Renamed or deleted groups and new or deleted permissions make
+    every bitset stale."""
+    permission_bits.bump_version()
+
+@receiver(post_migrate)
+def invalidate_migrated_permission_bits(sender, **kwargs):
+    """migrate creates permissions in bulk, without post_save."""
+    permission_bits.bump_version()
+
+PRIMARY_CONTACT_MODELS = (EmailAddress, PhoneNumber)
+
+
+@receiver(post_migrate)
+def create_primary_contact_indexes(sender, using=DEFAULT_DB_ALIAS, **kwargs):
+    """
+    Allows one primary email address and one primary phone number per
+    user. Django 2.1 cannot declare partial indexes on a model, so they
+    are created after every migrate, on the backends supporting them.
+    Any existing duplicates are un-flagged first, keeping the oldest.
+    """
+    if sender.label != 'accounts':
+        return
+    connection = connections[using]
+    if connection.vendor not in ('postgresql', 'sqlite'):
+        return
+    quote = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        tables = connection.introspection.table_names(cursor)
+        for model in PRIMARY_CONTACT_MODELS:
+            if model._meta.db_table not in tables:
+                continue
+            table = quote(model._meta.db_table)
+            cursor.execute(
+                'UPDATE %s SET is_primary = %%s WHERE is_primary AND id NOT IN '
+                '(SELECT MIN(id) FROM %s WHERE is_primary GROUP BY user_id)'
+                % (table, table), [False])
+            cursor.execute(
+                'CREATE UNIQUE INDEX IF NOT EXISTS %s ON %s (user_id) '
+                'WHERE is_primary' % (
+                    quote('%s_one_primary' % (model._meta.db_table,)), table))
@@ -0,0 +1,17 @@
+from ta_platform.celery_app import app
+
+from accounts.audit import take_checkpoint
+from common.retention import prune
+
+
+@app.task(ignore_result=True)
+def prune_history():
+    """Nightly, from celery beat; see common.retention."""
+    for _ in prune():
+        pass
+
+
+@app.task(ignore_result=True)
+def checkpoint_memberships():
+    """Weekly, from celery beat; see accounts.audit."""
+    take_checkpoint()
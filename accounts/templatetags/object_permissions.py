@@ -0,0 +1,32 @@
+"""Object permission checks reading the request's checker; see
+accounts.object_permissions."""
+from django import template
+
+from accounts.object_permissions import checker_for
+
+register = template.Library()
+
+
+@register.simple_tag(takes_context=True)
+def get_object_perms(context, obj):
+    """Codenames of the request user's permissions on obj.
+
+    e.g.:
+        {% get_object_perms group as group_perms %}
+    """
+    request = context['request']
+    if not request.user.is_authenticated:
+        return []
+    return checker_for(request).get_perms(obj)
+
+
+@register.simple_tag(takes_context=True)
+def has_object_perm(context, perm, obj):
+    """Whether the request user has permission `perm` (a codename, or
+    'app_label.codename') on obj.
+
+    e.g.:
+        {% has_object_perm 'change_group' group as can_edit %}
+    """
+    # The codenames prefetched for the page; superusers' are complete.
+    return perm.split('.')[-1] in get_object_perms(context, obj)
@@ -0,0 +1,113 @@
+from datetime import timedelta
+from io import StringIO
+
+from django.contrib.auth.models import Group, Permission
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+
+from accounts.audit import as_of, take_checkpoint
+from accounts.models import MembershipChange, MembershipCheckpoint, User
+from common.retention import prune
+
+
+def permission(codename):
+    return Permission.objects.get(content_type__app_label='accounts',
+                                  codename=codename)
+
+
+class AsOfTest(TestCase):
+
+    def setUp(self):
+        self.before = timezone.now()
+        self.recruiter = Group.objects.create(name='recruiter')
+        self.recruiter.permissions.add(permission('add_user'))
+        self.reporting = Group.objects.create(name='reporting')
+        self.reporting.permissions.add(permission('view_user'))
+        self.user = User.objects.create_user(
+            username='auditee', email='auditee@example.com',
+            password='auditee-password')
+        self.times = [timezone.now()]
+        self.user.groups.add(self.recruiter)
+        self.times.append(timezone.now())
+        take_checkpoint()
+        self.recruiter.permissions.add(permission('change_user'))
+        self.times.append(timezone.now())
+        self.user.groups.remove(self.recruiter)
+        self.user.user_permissions.add(permission('delete_user'))
+        self.times.append(timezone.now())
+        self.reporting.user_set.add(self.user)
+        self.times.append(timezone.now())
+        self.user.groups.clear()
+        self.times.append(timezone.now())
+
+    def assertStates(self):
+        expected = [
+            ({}, set()),
+            ({self.recruiter.pk: 'recruiter'}, {'accounts.add_user'}),
+            ({self.recruiter.pk: 'recruiter'},
+             {'accounts.add_user', 'accounts.change_user'}),
+            ({}, {'accounts.delete_user'}),
+            ({self.reporting.pk: 'reporting'},
+             {'accounts.delete_user', 'accounts.view_user'}),
+            ({}, {'accounts.delete_user'}),
+        ]
+        for when, (groups, permissions) in zip(self.times, expected):
+            state = as_of(self.user.pk, when)
+            self.assertEqual(state.groups, groups)
+            self.assertEqual(state.permissions, permissions)
+
+    def test_replays_changes_from_the_checkpoint(self):
+        self.assertStates()
+
+    def test_replays_changes_without_checkpoint(self):
+        MembershipCheckpoint.objects.all().delete()
+        self.assertStates()
+
+    def test_clear_and_reverse_changes_are_recorded(self):
+        self.assertEqual(list(MembershipChange.objects.filter(
+            source_id=self.user.pk, target_id=self.reporting.pk).values_list(
+                'added', flat=True)), [True, False])
+
+    def test_user_that_did_not_exist_yet(self):
+        self.assertIsNone(as_of(self.user.pk, self.before))
+
+    def test_deleted_groups_are_left_out(self):
+        self.user.groups.add(self.recruiter)
+        self.recruiter.delete()
+        state = as_of(self.user.pk, timezone.now())
+        self.assertEqual(state.groups, {})
+        self.assertEqual(state.permissions, {'accounts.delete_user'})
+
+    def test_pruning_keeps_what_as_of_replays(self):
+        for n in range(25):
+            self.user.first_names = 'Version %s' % (n,)
+            self.user.save()
+        for model in (User, Group):
+            for pk, date in model.history.values_list('history_id',
+                                                      'history_date'):
+                model.history.filter(history_id=pk).update(
+                    history_date=date - timedelta(days=400))
+        history = User.history.filter(id=self.user.pk)
+        first = history.earliest('history_date').history_date
+        rows = history.count()
+        self.assertFalse(any(report.deleted for report in prune()))
+        self.assertEqual(history.count(), rows)
+        self.assertIsNotNone(as_of(self.user.pk, first))
+        self.assertStates()
+
+    def test_bounded_number_of_queries(self):
+        for _ in range(20):
+            self.user.groups.add(self.recruiter)
+            self.user.groups.remove(self.recruiter)
+        self.user.groups.add(self.recruiter)
+        with self.assertNumQueries(9):
+            state = as_of(self.user.pk, timezone.now() + timedelta(days=1))
+        self.assertEqual(state.groups, {self.recruiter.pk: 'recruiter'})
+
+    def test_command(self):
+        out = StringIO()
+        call_command('permissions_as_of', 'auditee',
+                     self.times[2].isoformat(), stdout=out)
+        self.assertIn('Groups: recruiter', out.getvalue())
+        self.assertIn('  accounts.change_user', out.getvalue())
@@ -0,0 +1,85 @@
+import os
+import tempfile
+from io import StringIO
+
+from django.contrib.auth.models import Group, Permission
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from accounts.memberships import change_memberships, select_users
+from accounts.models import MembershipChange, MembershipKind, User
+
+
+class ChangeMembershipsTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.candidate = Group.objects.create(name='candidate')
+        self.employee = Group.objects.create(name='employee')
+        self.employee.permissions.add(Permission.objects.get(
+            content_type__app_label='accounts', codename='view_user'))
+        self.users = [User.objects.create_user(
+            username='agent-%s' % (n,), email='agent%s@example.com' % (n,),
+            password='agent-password', is_active=True) for n in range(12)]
+        self.pks = [user.pk for user in self.users]
+        self.candidate.user_set.add(*self.users[:10])
+        self.employee.user_set.add(self.users[0])
+
+    def test_moves_users_in_chunks(self):
+        MembershipChange.objects.all().delete()
+        report = change_memberships(self.pks, add=[self.employee],
+                                    remove=[self.candidate], chunk_size=5)
+        self.assertEqual(report, (11, 10))
+        self.assertEqual(set(self.employee.user_set.values_list(
+            'pk', flat=True)), set(self.pks))
+        self.assertFalse(self.candidate.user_set.exists())
+        changes = MembershipChange.objects.filter(
+            kind=MembershipKind.USER_GROUP)
+        self.assertEqual(changes.filter(added=True).count(), 11)
+        self.assertEqual(changes.filter(added=False).count(), 10)
+        self.assertEqual(change_memberships(
+            self.pks, add=[self.employee], remove=[self.candidate]), (0, 0))
+
+    def test_queries_grow_with_chunks_not_users(self):
+        counts = []
+        for users in (self.pks[:4], self.pks[4:]):
+            with CaptureQueriesContext(connection) as queries:
+                change_memberships(users, add=[self.employee],
+                                   remove=[self.candidate])
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+
+    def test_permission_bits_are_dropped(self):
+        user = User.objects.get(pk=self.pks[5])
+        self.assertFalse(user.has_perm('accounts.view_user'))
+        change_memberships([user.pk], add=[self.employee])
+        self.assertTrue(User.objects.get(pk=user.pk).has_perm(
+            'accounts.view_user'))
+
+    def test_group_added_and_removed(self):
+        with self.assertRaises(ValueError):
+            change_memberships(self.pks, add=[self.employee],
+                               remove=[self.employee])
+
+    def test_select_users(self):
+        self.assertEqual(select_users(['agent-11'], [self.candidate]),
+                         sorted(self.pks[:10] + [self.pks[11]]))
+        with self.assertRaisesMessage(ValueError, 'nobody'):
+            select_users(['agent-1', 'nobody'])
+
+    def test_command(self):
+        handle, path = tempfile.mkstemp()
+        with os.fdopen(handle, 'w') as names:
+            names.write('agent-10\n\nagent-11\n')
+        self.addCleanup(os.remove, path)
+        out = StringIO()
+        call_command('group_members', '--file', path, '--members-of',
+                     'candidate', '--add', 'employee', '--remove',
+                     'candidate', stdout=out)
+        self.assertIn('12 users: 11 memberships added, 10 removed',
+                      out.getvalue())
+        with self.assertRaisesMessage(CommandError, 'Unknown groups'):
+            call_command('group_members', 'agent-1', '--add', 'nope')
@@ -1,9 +1,11 @@
 import os
+import threading
 from io import StringIO
 from django.conf import settings
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.core.management import call_command
-from django.test import TestCase, override_settings
+from django.db import IntegrityError, OperationalError, connection
+from django.test import TestCase, TransactionTestCase, override_settings
 from django.contrib.auth.models import Group, Permission
 from django.contrib.contenttypes.models import ContentType
 
@@ -107,6 +109,93 @@ class EmailAddressTest(TestCase):
         self.assertFalse(email2.is_primary)
 
 
+class PrimaryContactTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username=USERNAME,
+                                        password=PASSWORD,
+                                        email=EMAIL)
+
+    def add_emails(self, count, start=0):
+        return [EmailAddress.objects.create(email='%s%s' % (index, EMAIL),
+                                            user=self.user)
+                for index in range(start, start + count)]
+
+    def test_switch_query_count_does_not_grow(self):
+        emails = self.add_emails(2)
+        with self.assertNumQueries(5):
+            EmailAddress.objects.set_as_primary(emails[0])
+        emails += self.add_emails(8, start=2)
+        with self.assertNumQueries(5):
+            EmailAddress.objects.set_as_primary(emails[-1])
+        self.assertEqual(
+            list(self.user.email_addresses.filter(is_primary=True)),
+            [emails[-1]])
+        self.assertEqual(User.objects.get(pk=self.user.pk).email,
+                         emails[-1].email)
+
+    def test_second_primary_is_rejected_by_the_database(self):
+        email = self.add_emails(1)[0]
+        with self.assertRaises(IntegrityError):
+            EmailAddress.objects.filter(pk=email.pk).update(is_primary=True)
+
+    def test_updates_do_not_probe_for_a_primary(self):
+        email = self.add_emails(1)[0]
+        email.is_verified = True
+        with self.assertNumQueries(2):
+            email.save(validation='raw')
+
+
+class PrimaryContactConcurrencyTest(TransactionTestCase):
+    """Parallel writers racing for the primary flag of one user."""
+    WRITERS = 8
+
+    def setUp(self):
+        self.user = User.objects.create(username=USERNAME,
+                                        password=PASSWORD,
+                                        email=EMAIL)
+
+    def run_in_threads(self, target, args_list):
+        errors = []
+        barrier = threading.Barrier(len(args_list))
+
+        def run(*args):
+            try:
+                barrier.wait()
+                target(*args)
+            except (IntegrityError, OperationalError) as error:
+                errors.append(error)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=run, args=args)
+                   for args in args_list]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return errors
+
+    def test_parallel_switches_leave_one_primary(self):
+        emails = [EmailAddress.objects.create(email='%s%s' % (index, EMAIL),
+                                              user=self.user)
+                  for index in range(self.WRITERS)]
+        self.run_in_threads(EmailAddress.objects.set_as_primary,
+                            [(email,) for email in emails])
+        self.assertEqual(
+            self.user.email_addresses.filter(is_primary=True).count(), 1)
+
+    def test_parallel_first_numbers_leave_one_primary(self):
+        def add_phone(index):
+            PhoneNumber.objects.create(phone_number='555%04d' % (index,),
+                                       user=self.user)
+        errors = self.run_in_threads(
+            add_phone, [(index,) for index in range(self.WRITERS)])
+        self.assertEqual(
+            self.user.phone_numbers.filter(is_primary=True).count(), 1)
+        self.assertEqual(self.user.phone_numbers.count(),
+                         self.WRITERS - len(errors))
+
+
 class AreaCodeTest(TestCase):
     def setUp(self):
         self.user = User.objects.create(username=USERNAME,
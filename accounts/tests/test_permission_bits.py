@@ -0,0 +1,84 @@
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.models import Group, Permission
+from django.core.cache import cache
+from django.test import TestCase
+
+from accounts.models import User
+
+
+def permission(codename):
+    return Permission.objects.get(content_type__app_label='accounts',
+                                  codename=codename)
+
+
+class PermissionBitsTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.recruiter = Group.objects.create(name='recruiter')
+        self.recruiter.permissions.add(permission('add_user'),
+                                       permission('view_user'))
+        self.user = User.objects.create_user(
+            username='checked', email='checked@example.com',
+            password='checked-password', is_active=True)
+        self.user.groups.add(self.recruiter)
+        self.user.user_permissions.add(permission('delete_user'))
+
+    def fresh(self):
+        return User.objects.get(pk=self.user.pk)
+
+    def test_same_permissions_as_model_backend(self):
+        user = self.fresh()
+        self.assertEqual(user.get_all_permissions(),
+                         ModelBackend().get_all_permissions(self.fresh()))
+        self.assertEqual(user.get_all_permissions(), {
+            'accounts.add_user', 'accounts.view_user', 'accounts.delete_user'})
+        self.assertTrue(user.has_perm('accounts.add_user'))
+        self.assertFalse(user.has_perm('accounts.change_user'))
+        self.assertFalse(user.has_perm('accounts.no_such_permission'))
+        self.assertTrue(user.has_perms(['accounts.add_user',
+                                        'accounts.delete_user']))
+        self.assertFalse(user.has_perms(['accounts.add_user',
+                                         'accounts.change_user']))
+        self.assertTrue(user.has_module_perms('accounts'))
+        self.assertFalse(user.has_module_perms('applications'))
+
+    def test_warm_checks_run_no_queries(self):
+        self.fresh().has_perm('accounts.add_user')
+        user = self.fresh()
+        with self.assertNumQueries(0):
+            self.assertTrue(user.has_perm('accounts.add_user'))
+            self.assertFalse(user.is_superuser)
+
+    def test_changes_invalidate(self):
+        self.assertFalse(self.fresh().has_perm('accounts.change_user'))
+        self.recruiter.permissions.add(permission('change_user'))
+        self.assertTrue(self.fresh().has_perm('accounts.change_user'))
+        self.recruiter.user_set.remove(self.user)
+        self.assertFalse(self.fresh().has_perm('accounts.change_user'))
+        self.user.user_permissions.clear()
+        self.assertEqual(self.fresh().get_all_permissions(), set())
+        self.recruiter.user_set.add(self.user)
+        self.assertTrue(self.fresh().has_perm('accounts.add_user'))
+        permission('add_user').user_set.clear()
+        self.recruiter.user_set.clear()
+        self.assertEqual(self.fresh().get_all_permissions(), set())
+
+    def test_instance_sees_its_own_changes(self):
+        user = self.fresh()
+        self.assertFalse(user.has_perm('accounts.change_user'))
+        user.user_permissions.add(permission('change_user'))
+        self.assertTrue(user.has_perm('accounts.change_user'))
+
+    def test_superuser_and_inactive(self):
+        self.user.groups.add(Group.objects.create(name='superuser'))
+        user = self.fresh()
+        self.assertTrue(user.is_superuser)
+        self.assertTrue(user.has_perm('applications.change_application'))
+        self.assertEqual(len(user.get_all_permissions()),
+                         Permission.objects.count())
+        User.objects.filter(pk=user.pk).update(is_active=False)
+        user = self.fresh()
+        self.assertFalse(user.has_perm('accounts.add_user'))
+        self.assertFalse(user.has_module_perms('accounts'))
+        self.assertEqual(user.get_all_permissions(), set())
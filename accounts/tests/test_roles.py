@@ -0,0 +1,94 @@
+import json
+import os
+import tempfile
+from io import StringIO
+
+from django.contrib.auth.models import Group, Permission
+from django.core.management import CommandError, call_command
+from django.test import TestCase
+
+from accounts.models import MembershipChange, MembershipKind
+from accounts.roles import load_spec, resolve, sync
+
+
+class RoleSyncTest(TestCase):
+
+    def write_spec(self, spec):
+        handle, path = tempfile.mkstemp(suffix='.json')
+        with os.fdopen(handle, 'w') as spec_file:
+            json.dump(spec, spec_file)
+        self.addCleanup(os.remove, path)
+        return path
+
+    def codes(self, name):
+        return set(Permission.objects.filter(group__name=name).values_list(
+            'content_type__app_label', 'codename'))
+
+    def test_initial_groups(self):
+        out = StringIO()
+        call_command('create_initial_groups', stdout=out)
+        spec = load_spec()
+        self.assertEqual(set(Group.objects.values_list('name', flat=True)),
+                         set(spec))
+        superuser = Group.objects.get(name='superuser')
+        self.assertTrue(superuser.is_admin)
+        self.assertEqual(superuser.permissions.count(),
+                         Permission.objects.count())
+        self.assertTrue(MembershipChange.objects.filter(
+            kind=MembershipKind.GROUP_PERMISSION,
+            source_id=superuser.pk).exists())
+        self.assertTrue(Group.objects.get(name='ANON').is_supervisor)
+        call_command('create_initial_groups', stdout=out)
+        self.assertIn('Groups are in sync.', out.getvalue())
+
+    def test_in_sync_costs_three_queries(self):
+        spec = load_spec()
+        sync(spec)
+        # The permissions, the groups and what they hold, inside a
+        # savepoint here.
+        with self.assertNumQueries(5):
+            self.assertEqual(sync(spec), [])
+
+    def test_diff_is_applied(self):
+        path = self.write_spec({'recruiter': {
+            'is_supervisor': True,
+            'permissions': ['accounts.*', '!accounts.delete_*',
+                            'applications.view_application'],
+        }})
+        call_command('create_initial_groups', spec=path, stdout=StringIO())
+        granted = self.codes('recruiter')
+        self.assertIn(('applications', 'view_application'), granted)
+        self.assertIn(('accounts', 'add_user'), granted)
+        self.assertNotIn(('accounts', 'delete_user'), granted)
+        recruiter = Group.objects.get(name='recruiter')
+        self.assertTrue(recruiter.is_supervisor)
+
+        spec = {'recruiter': {'is_supervisor': False,
+                              'permissions': ['accounts.add_user',
+                                              'accounts.delete_user']}}
+        changes = sync(spec, dry_run=True)
+        self.assertEqual(self.codes('recruiter'), granted)
+        self.assertEqual(changes[0].added, ['accounts.delete_user'])
+        self.assertIn('applications.view_application', changes[0].removed)
+        self.assertEqual(changes[0].flags, {'is_supervisor': False})
+        sync(spec)
+        self.assertEqual(self.codes('recruiter'), {
+            ('accounts', 'add_user'), ('accounts', 'delete_user')})
+        self.assertFalse(Group.objects.get(name='recruiter').is_supervisor)
+
+    def test_unmanaged_permissions_are_kept(self):
+        group = Group.objects.create(name='payroll')
+        group.permissions.add(Permission.objects.get(codename='add_user'))
+        self.assertEqual(sync({'payroll': {'is_admin': False}}), [])
+        self.assertEqual(group.permissions.count(), 1)
+
+    def test_invalid_specs(self):
+        with self.assertRaises(ValueError):
+            resolve(['accounts.no_such_permission'], {'accounts.add_user': 1})
+        self.assertEqual(resolve(['nothing.*'], {'accounts.add_user': 1}),
+                         set())
+        path = self.write_spec({'recruiter': {'permisions': []}})
+        with self.assertRaisesMessage(CommandError, 'permisions'):
+            call_command('create_initial_groups', spec=path,
+                         stdout=StringIO())
+        self.assertFalse(Group.objects.exists())
@@ -218,16 +218,17 @@ class PasswordResetView(views.PasswordResetView):
 
     def form_valid(self, form):
         """Allows the password_reset_done_view access once."""
-        self.request.session['can_view_password_reset_done'] = True
+        self.request.session.setdefault('can_view_password_reset_done', True)
         return super(PasswordResetView, self).form_valid(form)
 
     def form_invalid(self, form):
         """
         Allows the password_reset_done_view access once. Enabled on
         invalid forms so as not to leak information about which email
-        addresses or usernames do exist.
+        addresses or usernames do exist. setdefault() leaves the session
+        unmodified (and unsaved) on repeated attempts.
         """
-        self.request.session['can_view_password_reset_done'] = True
+        self.request.session.setdefault('can_view_password_reset_done', True)
         return super(PasswordResetView, self).form_invalid(form)
 
 class PasswordResetDoneView(views.PasswordChangeDoneView):
@@ -258,7 +259,7 @@ class PasswordResetConfirmView(views.PasswordResetConfirmView):
 
     def form_valid(self, form):
         """Allows the password_reset_done_view access once."""
-        self.request.session['can_view_password_reset_complete'] = True
+        self.request.session.setdefault('can_view_password_reset_complete', True)
         return super(PasswordResetConfirmView, self).form_valid(form)
 
 
@@ -0,0 +1,122 @@
+"""
+Users by permissions, or users by groups, for access reviews.
+
+The grid of a page or chunk of users is a NumPy boolean array, one row
+per user (pk-ordered) and one column per permission or group. It costs
+two queries whatever its size: the users, and one aggregate query of
+every (user, column) pair they hold. For permissions that is the UNION
+ALL of direct grants, grants through groups and membership of the
+superuser group, whose members hold every column; for groups it is the
+User.groups through table. The pairs are placed in the grid with one
+fancy-indexed assignment.
+
+AccessMatrix is also an Export (see admin_console.exports), so
+csv_lines() streams the whole matrix a chunk at a time.
+
+e.g.:
+    matrix = AccessMatrix(PERMISSIONS, group=recruiters)
+    page, users, grid = matrix.page(number=2)
+    for (pk, username), cells in zip(users, grid):
+        ...
+"""
+from itertools import chain
+
+import numpy as np
+from django.contrib.auth.models import Group, Permission
+from django.core.paginator import Paginator
+from django.db.models import IntegerField, Value
+
+from accounts.models import User
+from accounts.permission_bits import SUPERUSER_GROUP
+from admin_console.exports import CHUNK_SIZE, Export, chunked
+
+PERMISSIONS, GROUPS = 'permissions', 'groups'
+KINDS = (PERMISSIONS, GROUPS)
+PER_PAGE = 100
+# The column of the pairs that stand for superuser group membership;
+# permission pks start at 1.
+EVERYTHING = 0
+
+
+class AccessMatrix(Export):
+    """Who holds what, for the members of `group` (every user if None),
+    with permission columns limited to `app_label` if given."""
+    name = 'access'
+    groups = ()
+
+    def __init__(self, kind=PERMISSIONS, group=None, app_label=None):
+        if kind not in KINDS:
+            raise ValueError('kind must be one of %s, not %r.' % (
+                ', '.join(KINDS), kind))
+        self.kind = kind
+        self.users = User.objects.all() if group is None else \
+            group.user_set.all()
+        if kind == GROUPS:
+            columns = list(Group.objects.order_by('name').values_list(
+                'pk', 'name'))
+        else:
+            permissions = Permission.objects.all()
+            if app_label:
+                permissions = permissions.filter(
+                    content_type__app_label=app_label)
+            columns = [(pk, '%s.%s' % (app, codename))
+                       for pk, app, codename in permissions.order_by(
+                           'content_type__app_label', 'codename').values_list(
+                               'pk', 'content_type__app_label', 'codename')]
+        self.headers = ('id', 'username') + tuple(
+            label for _, label in columns)
+        pks = np.array([pk for pk, _ in columns], dtype=np.int64)
+        # Column of each pk, -1 for pks that are not a column.
+        self.column_of = np.full(pks.max() + 1 if len(pks) else 1, -1,
+                                 dtype=np.int64)
+        self.column_of[pks] = np.arange(len(pks))
+        self.width = len(pks)
+
+    def pairs(self, user_pks):
+        """(user pk, column pk) held by `user_pks`, one query."""
+        memberships = User.groups.through.objects.filter(
+            user_id__in=user_pks).order_by()
+        if self.kind == GROUPS:
+            return memberships.values_list('user_id', 'group_id')
+        direct = User.user_permissions.through.objects.filter(
+            user_id__in=user_pks).order_by().values_list(
+                'user_id', 'permission_id')
+        granted = memberships.filter(
+            group__permissions__isnull=False).values_list(
+                'user_id', 'group__permissions')
+        superusers = memberships.filter(
+            group__name=SUPERUSER_GROUP).annotate(
+                everything=Value(EVERYTHING, IntegerField())).values_list(
+                    'user_id', 'everything')
+        return direct.union(granted, superusers, all=True)
+
+    def grid(self, user_pks):
+        """Boolean array of `user_pks` (ascending) by the columns."""
+        cells = np.zeros((len(user_pks), self.width), dtype=bool)
+        if not user_pks:
+            return cells
+        pairs = np.fromiter(chain.from_iterable(self.pairs(user_pks)),
+                            dtype=np.int64).reshape(-1, 2)
+        rows = np.searchsorted(np.asarray(user_pks, dtype=np.int64),
+                               pairs[:, 0])
+        cells[rows[pairs[:, 1] == EVERYTHING]] = True
+        known = pairs[:, 1] < len(self.column_of)
+        columns = np.full(len(pairs), -1, dtype=np.int64)
+        columns[known] = self.column_of[pairs[known, 1]]
+        held = columns >= 0
+        cells[rows[held], columns[held]] = True
+        return cells
+
+    def page(self, number=1, per_page=PER_PAGE):
+        """(Page, [(pk, username)], grid) of a page of users."""
+        paginator = Paginator(self.users.order_by('pk').values_list(
+            'pk', 'username'), per_page)
+        page = paginator.get_page(number)
+        users = list(page.object_list)
+        return page, users, self.grid([pk for pk, _ in users])
+
+    def rows(self, chunk_size=CHUNK_SIZE):
+        for chunk in chunked(self.users, ('username',), chunk_size):
+            grid = self.grid([row['pk'] for row in chunk]).astype(np.uint8)
+            for row, cells in zip(chunk, grid.tolist()):
+                yield (row['pk'], row['username']) + tuple(cells)
@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class AdminConsoleConfig(AppConfig):
     name = 'admin_console'
+
+    def ready(self):
+        import admin_console.signals
+        super(AdminConsoleConfig, self).ready()
@@ -0,0 +1,34 @@
+from asgiref.sync import async_to_sync
+from channels.generic.websocket import JsonWebsocketConsumer
+
+from admin_console.models import ReportJob
+from admin_console.reports import REPORTS, group_name
+
+
+class ReportProgressConsumer(JsonWebsocketConsumer):
+    """
+    Relays the progress of a report job (admin_console.reports) to the
+    browser, starting with its current state:
+        {"job": 1, "status": "running", "progress": 0.25, ...}
+    """
+    def connect(self):
+        user = self.scope['user']
+        job = ReportJob.objects.filter(
+            pk=self.scope['url_route']['kwargs']['pk']).first()
+        if job is None or not REPORTS[job.report]().allowed(user):
+            self.close()
+            return
+        self.group = group_name(job.pk)
+        async_to_sync(self.channel_layer.group_add)(self.group,
+                                                    self.channel_name)
+        self.accept()
+        self.send_json(job.progress_message())
+
+    def disconnect(self, close_code):
+        if hasattr(self, 'group'):
+            async_to_sync(self.channel_layer.group_discard)(
+                self.group, self.channel_name)
+
+    def report_progress(self, event):
+        self.send_json({key: value for key, value in event.items()
+                        if key != 'type'})
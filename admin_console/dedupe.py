@@ -0,0 +1,260 @@
+"""
+Fuzzy duplicate detection for applications.
+
+Comparing every pair of a million applications is out of the question,
+so each application gets a few blocking keys and only applications
+sharing a key are compared:
+
+    n:<soundex of first name><soundex of last name>
+    p:<last seven digits of each phone>
+    e:<normalized email local part>
+    i:<national id digits>
+
+Keys are hashed to int64 so the grouping runs on NumPy arrays; blocks
+larger than max_block (very common names) are skipped. Key generation
+and scoring run in worker processes over pk ranges and pair batches,
+each worker reading what it needs itself. Pairs scoring at least the
+threshold land in PossibleDuplicate for review in the admin console;
+pairs already queued, whatever their status, are left alone. The queue
+shows applicants' contact details, so only DuplicateReview's groups
+(and admins) may see or review it.
+
+e.g.:
+    found = find_duplicates(processes=8)
+"""
+import unicodedata
+from collections import namedtuple
+from difflib import SequenceMatcher
+from hashlib import blake2b
+from multiprocessing import Pool
+
+import numpy as np
+from django.db import connections, transaction
+from django.db.models import Max, Min
+
+from accounts.models import reduce_to_alphanum
+from admin_console.exports import GroupRestricted
+from admin_console.models import PossibleDuplicate
+from applications.models import Application
+
+
+class DuplicateReview(GroupRestricted):
+    groups = ('recruiter', 'human_resources')
+
+
+FIELDS = ('pk', 'first_names', 'last_names', 'email', 'primary_phone',
+          'secondary_phone', 'birth_date', 'national_id_number')
+WEIGHTS = {
+    'name': 0.35,
+    'phone': 0.2,
+    'email': 0.2,
+    'national_id': 0.15,
+    'birth_date': 0.1,
+}
+# A field counts as a reason for the match from this similarity up.
+REASON_SIMILARITY = 0.9
+THRESHOLD = 0.6
+MAX_BLOCK = 200
+# SQLite allows 999 variables per statement.
+IN_BATCH = 900
+
+Candidate = namedtuple('Candidate', (
+    'pk', 'name', 'first', 'last', 'phones', 'email', 'birth_date',
+    'national_id'))
+SOUNDEX_CODES = dict(
+    [(letter, '1') for letter in 'bfpv'] +
+    [(letter, '2') for letter in 'cgjkqsxz'] +
+    [(letter, '3') for letter in 'dt'] +
+    [('l', '4')] +
+    [(letter, '5') for letter in 'mn'] +
+    [('r', '6')]
+)
+
+
+def normalize(value):
+    """Lowercase ASCII letters, digits and single spaces."""
+    value = unicodedata.normalize('NFKD', value or '')
+    value = ''.join(char for char in value
+                    if not unicodedata.combining(char)).lower()
+    return ' '.join(''.join(char if char.isalnum() else ' '
+                            for char in value).split())
+
+
+def soundex(word):
+    """American Soundex of an already normalized word, '' for none."""
+    letters = [char for char in word if char.isalpha()]
+    if not letters:
+        return ''
+    code, previous = letters[0].upper(), SOUNDEX_CODES.get(letters[0])
+    for char in letters[1:]:
+        digit = SOUNDEX_CODES.get(char)
+        if digit and digit != previous:
+            code += digit
+        if char not in 'hw':
+            previous = digit
+    return (code + '000')[:4]
+
+
+def email_local(email):
+    """'Ana.Perez+jobs@x.com' -> 'anaperez'."""
+    local = (email or '').lower().split('@')[0].split('+')[0]
+    return local.replace('.', '')
+
+
+def phone_suffix(phone):
+    digits = ''.join(char for char in phone or '' if char.isdigit())
+    return digits[-7:] if len(digits) >= 7 else ''
+
+
+def candidate(row):
+    pk, first_names, last_names, email, primary, secondary, birth, natid = row
+    first, last = normalize(first_names), normalize(last_names)
+    return Candidate(
+        pk=pk,
+        name='%s %s' % (first, last),
+        first=first,
+        last=last,
+        phones=frozenset(suffix for suffix in map(
+            phone_suffix, (primary, secondary)) if suffix),
+        email=email_local(email),
+        birth_date=birth,
+        national_id=reduce_to_alphanum(natid or ''),
+    )
+
+
+def blocking_keys(candidate):
+    keys = []
+    if candidate.first and candidate.last:
+        keys.append('n:%s%s' % (soundex(candidate.first.split()[0]),
+                                soundex(candidate.last.split()[0])))
+    keys.extend('p:%s' % (phone,) for phone in candidate.phones)
+    if candidate.email:
+        keys.append('e:%s' % (candidate.email,))
+    if candidate.national_id:
+        keys.append('i:%s' % (candidate.national_id,))
+    return keys
+
+
+def key_hash(key):
+    return int.from_bytes(blake2b(key.encode(), digest_size=8).digest(),
+                          'little', signed=True)
+
+
+def similarity(a, b):
+    """Returns (score between 0 and 1, [reasons])."""
+    parts = {
+        'name': SequenceMatcher(None, a.name, b.name).ratio(),
+        'phone': float(bool(a.phones & b.phones)),
+        'email': (SequenceMatcher(None, a.email, b.email).ratio()
+                  if a.email and b.email else 0.0),
+        'national_id': float(bool(a.national_id) and
+                             a.national_id == b.national_id),
+        'birth_date': float(a.birth_date is not None and
+                            a.birth_date == b.birth_date),
+    }
+    score = sum(WEIGHTS[field] * value for field, value in parts.items())
+    reasons = [field for field in WEIGHTS
+               if parts[field] >= REASON_SIMILARITY]
+    return score, reasons
+
+
+def load_candidates(pks):
+    """Returns {pk: Candidate}."""
+    pks = list(pks)
+    candidates = {}
+    for start in range(0, len(pks), IN_BATCH):
+        rows = Application.objects.filter(
+            pk__in=pks[start:start + IN_BATCH]).values_list(*FIELDS)
+        candidates.update((row[0], candidate(row)) for row in rows)
+    return candidates
+
+
+def keys_for_range(pk_range):
+    """Worker: (key hashes, pks) for the applications in [start, end)."""
+    start, end = pk_range
+    hashes, pks = [], []
+    rows = Application.objects.filter(
+        pk__gte=start, pk__lt=end).values_list(*FIELDS).iterator()
+    for row in rows:
+        for key in blocking_keys(candidate(row)):
+            hashes.append(key_hash(key))
+            pks.append(row[0])
+    return np.array(hashes, np.int64), np.array(pks, np.int64)
+
+
+def candidate_pairs(hashes, pks, max_block=MAX_BLOCK):
+    """Unique (older, newer) pk pairs sharing a block, as an (n, 2)
+    array; blocks over max_block are skipped."""
+    order = np.lexsort((pks, hashes))
+    hashes, pks = hashes[order], pks[order]
+    starts = np.flatnonzero(np.r_[True, hashes[1:] != hashes[:-1]])
+    sizes = np.diff(np.r_[starts, len(hashes)])
+    pairs = []
+    for start, size in zip(starts, sizes):
+        if 2 <= size <= max_block:
+            block = np.unique(pks[start:start + size])
+            first, second = np.triu_indices(len(block), 1)
+            pairs.append(np.column_stack((block[first], block[second])))
+    if not pairs:
+        return np.empty((0, 2), np.int64)
+    return np.unique(np.concatenate(pairs), axis=0)
+
+
+def score_pairs(task):
+    """Worker: [(older, newer, score, reasons)] at or over threshold."""
+    pairs, threshold = task
+    candidates = load_candidates(np.unique(pairs))
+    found = []
+    for older, newer in pairs.tolist():
+        if older in candidates and newer in candidates:
+            score, reasons = similarity(candidates[older], candidates[newer])
+            if score >= threshold:
+                found.append((older, newer, score, ','.join(reasons)))
+    return found
+
+
+def _map(function, tasks, processes):
+    """imap over a pool, or in this process when processes is 0 (tests,
+    or anything that must see uncommitted rows)."""
+    if processes == 0:
+        for task in tasks:
+            yield function(task)
+        return
+    connections.close_all()
+    with Pool(processes) as pool:
+        for result in pool.imap_unordered(function, tasks):
+            yield result
+
+
+def find_duplicates(processes=None, chunk_size=50000, pair_batch=20000,
+                    threshold=THRESHOLD, max_block=MAX_BLOCK, progress=None):
+    """Runs the whole job; returns how many pairs were queued."""
+    bounds = Application.objects.aggregate(low=Min('pk'), high=Max('pk'))
+    if bounds['low'] is None:
+        return 0
+    ranges = [(start, start + chunk_size) for start in range(
+        bounds['low'], bounds['high'] + 1, chunk_size)]
+    hashes, pks = [], []
+    for chunk_hashes, chunk_pks in _map(keys_for_range, ranges, processes):
+        hashes.append(chunk_hashes)
+        pks.append(chunk_pks)
+    pairs = candidate_pairs(np.concatenate(hashes), np.concatenate(pks),
+                            max_block)
+    if progress:
+        progress('pairs', len(pairs))
+
+    queued = set(PossibleDuplicate.objects.values_list('older', 'newer'))
+    batches = [(pairs[start:start + pair_batch], threshold)
+               for start in range(0, len(pairs), pair_batch)]
+    created = 0
+    for found in _map(score_pairs, batches, processes):
+        new = [PossibleDuplicate(older_id=older, newer_id=newer, score=score,
+                                 reasons=reasons)
+               for older, newer, score, reasons in found
+               if (older, newer) not in queued]
+        with transaction.atomic():
+            PossibleDuplicate.objects.bulk_create(new, batch_size=500)
+        created += len(new)
+        if progress:
+            progress('queued', created)
+    return created
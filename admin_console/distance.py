@@ -0,0 +1,102 @@
+"""
+Commute distance between candidates and a CallCenter site.
+
+A candidate is placed at the sector of their user's primary address,
+else at that address's city, else at the application's city_or_town,
+using the coordinates on those lookup rows. Locating any number of
+applications takes one query for the applications, one for the
+addresses and one per lookup table; the distances themselves are
+computed with NumPy over whole arrays.
+
+e.g.:
+    pks, km = rank_by_distance(Application.objects.all(), call_center,
+                               within=25)
+"""
+import numpy as np
+
+from admin_console.models import Address, CitySector, CityTown
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+def haversine_km(lat, lng, lats, lngs):
+    """Great-circle distances in km from (lat, lng) to every point of the
+    `lats`/`lngs` arrays; NaN coordinates give NaN distances."""
+    lat, lng = np.radians(lat), np.radians(lng)
+    lats, lngs = np.radians(lats), np.radians(lngs)
+    a = (np.sin((lats - lat) / 2) ** 2 +
+         np.cos(lat) * np.cos(lats) * np.sin((lngs - lng) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+
+def lookup_coordinates(model, ids):
+    """Returns (lats, lngs) for an array of `model` ids, NaN where the id
+    is missing or the row has no coordinates."""
+    rows = np.array(list(
+        model._default_manager.exclude(latitude=None).exclude(longitude=None)
+        .order_by('pk').values_list('pk', 'latitude', 'longitude')),
+        dtype=float).reshape(-1, 3)
+    return _take(rows, ids)
+
+
+def _take(rows, ids):
+    """Looks ids up in `rows` ([[id, lat, lng], ...] sorted by id)."""
+    lats = np.full(len(ids), np.nan)
+    lngs = np.full(len(ids), np.nan)
+    if len(rows):
+        index = np.searchsorted(rows[:, 0], ids).clip(0, len(rows) - 1)
+        found = rows[index, 0] == ids
+        lats[found] = rows[index[found], 1]
+        lngs[found] = rows[index[found], 2]
+    return lats, lngs
+
+
+def _fill(into, values):
+    missing = np.isnan(into)
+    into[missing] = values[missing]
+
+
+def locate_applications(queryset):
+    """Returns (pks, lats, lngs) arrays for the applications in
+    `queryset`, NaN where no coordinates are known."""
+    rows = np.array(list(queryset.order_by().values_list(
+        'pk', 'user_id', 'city_or_town_id')), dtype=float).reshape(-1, 3)
+    pks, user_ids, city_ids = rows[:, 0].astype(np.int64), rows[:, 1], rows[:, 2]
+
+    addresses = np.array(list(Address.objects.filter(
+        is_primary=True, user__in=queryset.order_by().values('user'),
+    ).order_by('user_id', 'pk').values_list(
+        'user_id', 'sector_id', 'city_id')), dtype=float).reshape(-1, 3)
+    # One address per user; with several primaries the last one wins.
+    _, last = np.unique(addresses[::-1, 0], return_index=True)
+    addresses = addresses[::-1][last]
+
+    lats, lngs = np.full(len(pks), np.nan), np.full(len(pks), np.nan)
+    for model, column in ((CitySector, 1), (CityTown, 2)):
+        points = lookup_coordinates(model, addresses[:, column])
+        user_points = np.column_stack((addresses[:, 0],) + points)
+        for into, values in zip((lats, lngs), _take(user_points, user_ids)):
+            _fill(into, values)
+    for into, values in zip((lats, lngs),
+                            lookup_coordinates(CityTown, city_ids)):
+        _fill(into, values)
+    return pks, lats, lngs
+
+
+def rank_by_distance(queryset, site, within=None):
+    """
+    Returns (pks, km) for the applications in `queryset`, nearest to
+    `site` (anything with latitude/longitude) first and those that could
+    not be located last. `within` drops everything further than that
+    many km, and anything not located.
+    """
+    if site.latitude is None or site.longitude is None:
+        raise ValueError('%s has no coordinates.' % (site,))
+    pks, lats, lngs = locate_applications(queryset)
+    km = haversine_km(site.latitude, site.longitude, lats, lngs)
+    order = np.argsort(km, kind='stable')
+    pks, km = pks[order], km[order]
+    if within is not None:
+        keep = km <= within
+        pks, km = pks[keep], km[keep]
+    return pks, km
@@ -0,0 +1,234 @@
+"""
+Streaming exports for the reporting and payroll groups.
+
+Rows are read in pk-ordered chunks (pk > last pk seen, so memory stays
+flat whatever the table size, also behind PgBouncer where server-side
+cursors are off). Each chunk costs one query for the rows plus one per
+related table; lookup names come from the cached maps in
+admin_console.lookups instead of joins. Rows are written as they are
+read: CSV is streamed straight into the response, XLSX is written by
+XlsxWriter in constant-memory mode to a temporary file which is then
+streamed.
+
+e.g.:
+    export = EXPORTS['applications']
+    response = StreamingHttpResponse(csv_lines(export))
+"""
+import csv
+from collections import OrderedDict, defaultdict
+
+import xlsxwriter
+
+from accounts.models import AreaCode, NationalId, PhoneNumber, User
+from admin_console.lookups import many_lookup_names
+from admin_console.models import (
+    Address,
+    ApplicationStatus,
+    AreaOfExpertise,
+    CallCenter,
+    CitySector,
+    CityTown,
+    Language,
+    StateProvinceRegion,
+)
+from applications.models import Application
+
+CHUNK_SIZE = 2000
+CONTENT_TYPES = {
+    'csv': 'text/csv',
+    'xlsx': ('application/vnd.openxmlformats-officedocument.'
+             'spreadsheetml.sheet'),
+}
+
+
+def chunked(queryset, fields, chunk_size=CHUNK_SIZE):
+    """Yields lists of values(*fields) dicts, pk-ordered, one query per
+    chunk."""
+    queryset = queryset.order_by('pk').values('pk', *fields)
+    last = None
+    while True:
+        page = queryset if last is None else queryset.filter(pk__gt=last)
+        rows = list(page[:chunk_size])
+        if not rows:
+            return
+        yield rows
+        last = rows[-1]['pk']
+
+
+def related_names(field, pks, names):
+    """{application pk: 'Name, Name'} for a many-to-many field of
+    Application, from one query on its through table."""
+    field = Application._meta.get_field(field)
+    source = field.m2m_field_name()
+    pairs = field.remote_field.through.objects.filter(**{
+        '%s__in' % (source,): pks,
+    }).order_by('pk').values_list(
+        '%s_id' % (source,), '%s_id' % (field.m2m_reverse_field_name(),))
+    joined = defaultdict(list)
+    for pk, lookup in pairs:
+        joined[pk].append(names.get(lookup, ''))
+    return {pk: ', '.join(values) for pk, values in joined.items()}
+
+
+class GroupRestricted:
+    """For admins and the members of `groups` only."""
+    groups = ()
+
+    @classmethod
+    def allowed(cls, user):
+        return user.is_authenticated and (
+            user.is_admin or user.groups.filter(name__in=cls.groups).exists())
+
+
+class Export(GroupRestricted):
+    """A named list of columns and the rows to fill them."""
+    name = None
+    headers = ()
+
+    def rows(self, chunk_size=CHUNK_SIZE):
+        raise NotImplementedError
+
+
+class ApplicationExport(Export):
+    name = 'applications'
+    groups = ('reporting',)
+    headers = (
+        'id', 'applied_at', 'first_names', 'last_names', 'email',
+        'primary_phone', 'secondary_phone', 'national_id_type',
+        'national_id_number', 'gender', 'birth_date', 'city_or_town',
+        'address_line_one', 'address_line_two', 'status',
+        'status_changed_at', 'pre_screen', 'hire_iq', 'tss', 'hm_interview',
+        'languages', 'areas_of_expertise', 'previous_call_center',
+    )
+    fields = (
+        'applied_at', 'first_names', 'last_names', 'email', 'primary_phone',
+        'secondary_phone', 'national_id_type', 'national_id_number',
+        'gender', 'birth_date', 'city_or_town_id', 'address_line_one',
+        'address_line_two', 'current_status_id', 'status_changed_at',
+        'pre_screen', 'hire_iq', 'tss', 'hm_interview',
+    )
+    multi_valued = (
+        ('languages', Language),
+        ('areas_of_expertise', AreaOfExpertise),
+        ('previous_call_center', CallCenter),
+    )
+
+    def __init__(self, queryset=None):
+        self.queryset = (Application.objects.all() if queryset is None
+                         else queryset)
+
+    def rows(self, chunk_size=CHUNK_SIZE):
+        names = many_lookup_names(
+            [CityTown, ApplicationStatus] +
+            [model for _, model in self.multi_valued])
+        id_types = dict(Application.ID_TYPE_CHOICES)
+        genders = dict(Application.GENDER_CHOICES)
+        for chunk in chunked(self.queryset, self.fields, chunk_size):
+            pks = [row['pk'] for row in chunk]
+            related = [related_names(field, pks, names[model])
+                       for field, model in self.multi_valued]
+            for row in chunk:
+                yield (
+                    row['pk'], row['applied_at'], row['first_names'],
+                    row['last_names'], row['email'], row['primary_phone'],
+                    row['secondary_phone'] or '',
+                    str(id_types.get(row['national_id_type'], '')),
+                    row['national_id_number'],
+                    str(genders.get(row['gender'], '')), row['birth_date'],
+                    names[CityTown].get(row['city_or_town_id'], ''),
+                    row['address_line_one'], row['address_line_two'],
+                    names[ApplicationStatus].get(row['current_status_id'],
+                                                 ''),
+                    row['status_changed_at'], row['pre_screen'],
+                    row['hire_iq'], row['tss'], row['hm_interview'],
+                ) + tuple(values.get(row['pk'], '') for values in related)
+
+
+class EmployeeExport(Export):
+    """Users who work or worked for us."""
+    name = 'employees'
+    groups = ('reporting', 'payroll')
+    headers = (
+        'id', 'username', 'first_names', 'last_names', 'email',
+        'employee_status', 'birth_date', 'national_id_type',
+        'national_id_number', 'phone', 'sector', 'city',
+        'state_province_region',
+    )
+    fields = ('username', 'first_names', 'last_names', 'email',
+              'employee_status', 'birth_date')
+
+    def __init__(self, queryset=None):
+        self.queryset = (User.objects.exclude(
+            employee_status=User.NEVER_EMPLOYED) if queryset is None
+                         else queryset)
+
+    def rows(self, chunk_size=CHUNK_SIZE):
+        names = many_lookup_names([CitySector, CityTown,
+                                   StateProvinceRegion])
+        area_codes = dict(AreaCode.objects.values_list('pk', 'code'))
+        statuses = dict(User.EMPLOYEE_STATUS_CHOICES)
+        id_types = dict(NationalId.ID_TYPE_CHOICES)
+        for chunk in chunked(self.queryset, self.fields, chunk_size):
+            pks = [row['pk'] for row in chunk]
+            ids = {user: (id_type, number) for user, id_type, number in
+                   NationalId.objects.filter(user__in=pks).values_list(
+                       'user_id', 'id_type', 'id_number')}
+            phones = {user: '%s %s' % (area_codes.get(code, ''), number)
+                      for user, code, number in PhoneNumber.objects.filter(
+                          user__in=pks, is_primary=True).order_by(
+                              'pk').values_list('user_id', 'area_code_id',
+                                                'phone_number')}
+            addresses = {
+                user: (sector, city, region)
+                for user, sector, city, region in Address.objects.filter(
+                    user__in=pks, is_primary=True).order_by('pk').values_list(
+                        'user_id', 'sector_id', 'city_id',
+                        'state_province_region_id')}
+            for row in chunk:
+                id_type, number = ids.get(row['pk'], (None, ''))
+                sector, city, region = addresses.get(row['pk'],
+                                                     (None, None, None))
+                yield (
+                    row['pk'], row['username'], row['first_names'],
+                    row['last_names'], row['email'],
+                    str(statuses.get(row['employee_status'], '')),
+                    row['birth_date'], str(id_types.get(id_type, '')),
+                    number, phones.get(row['pk'], ''),
+                    names[CitySector].get(sector, ''),
+                    names[CityTown].get(city, ''),
+                    names[StateProvinceRegion].get(region, ''),
+                )
+
+
+EXPORTS = OrderedDict((export.name, export) for export in (
+    ApplicationExport, EmployeeExport))
+
+
+class Echo:
+    """File-like object that hands back what csv.writer writes."""
+    def write(self, value):
+        return value
+
+
+def csv_lines(export, chunk_size=CHUNK_SIZE):
+    """Yields the export as encoded CSV lines, header first."""
+    writer = csv.writer(Echo())
+    yield writer.writerow(export.headers).encode('utf-8')
+    for row in export.rows(chunk_size):
+        yield writer.writerow(row).encode('utf-8')
+
+
+def write_xlsx(export, output, chunk_size=CHUNK_SIZE):
+    """Writes the export as an XLSX workbook to `output`, a path or a
+    binary file object, holding one row in memory at a time."""
+    workbook = xlsxwriter.Workbook(output, {
+        'constant_memory': True,
+        'remove_timezone': True,
+        'default_date_format': 'yyyy-mm-dd hh:mm:ss',
+    })
+    worksheet = workbook.add_worksheet(export.name)
+    worksheet.write_row(0, 0, export.headers)
+    for number, row in enumerate(export.rows(chunk_size), 1):
+        worksheet.write_row(number, 0, ['' if value is None else value
+                                        for value in row])
+    workbook.close()
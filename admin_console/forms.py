@@ -2,10 +2,124 @@ from django import forms
 from django.conf import settings
 from django.contrib.admin.widgets import FilteredSelectMultiple, AdminDateWidget
 from django.contrib.auth.models import Permission, Group
+from django.core.exceptions import ValidationError
+from django.urls import reverse
 from django.utils.translation import gettext as _
 
 import admin_console.models as admin_models
 import accounts.models as accounts_models
+from accounts.memberships import select_users
+from admin_console import geo
+from admin_console.access_matrix import GROUPS, PERMISSIONS
+
+
+class GeoSelect(forms.Select):
+    """
+    Dropdown of a level of the geographic tree. The roots are listed
+    from the in-process tree; a level below lists only its bound value
+    and the rows without a parent (marked data-geo-orphan), and
+    assets/js/geo-select.js fills it from the geo endpoint whenever its
+    parent changes.
+    """
+    def __init__(self, level, parent=None, attrs=None):
+        attrs = dict({'class': 'form-control dropdown',
+                      'data-geo-level': level}, **(attrs or {}))
+        if parent is not None:
+            attrs['data-geo-parent'] = parent
+        super(GeoSelect, self).__init__(attrs)
+        self.level = level
+        self.parent = parent
+
+    def get_context(self, name, value, attrs):
+        context = super(GeoSelect, self).get_context(name, value, attrs)
+        context['widget']['attrs']['data-geo-url'] = reverse(
+            'admin_console:geo-roots')
+        return context
+
+    def optgroups(self, name, value, attrs=None):
+        tree = geo.get_tree()
+        if self.parent is None:
+            self.orphans = set()
+            choices = list(tree.children())
+        else:
+            orphans = tree.children(geo.parent_level(self.level), None)
+            self.orphans = set(pk for pk, _ in orphans)
+            choices = [(int(pk), tree.name(self.level, int(pk)))
+                       for pk in value if pk.isdigit() and
+                       (self.level, int(pk)) in tree and
+                       int(pk) not in self.orphans] + list(orphans)
+        self.choices = [('', '---------')] + choices
+        return super(GeoSelect, self).optgroups(name, value, attrs)
+
+    def create_option(self, name, value, *args, **kwargs):
+        option = super(GeoSelect, self).create_option(name, value, *args,
+                                                      **kwargs)
+        if value in self.orphans:
+            option['attrs']['data-geo-orphan'] = True
+        return option
+
+
+class GeoChoiceField(forms.ModelChoiceField):
+    """A row of a level of the geographic tree, below the row picked in
+    the `parent` field of the form (see GeoFormMixin). Only rows in the
+    tree are valid."""
+    def __init__(self, level, parent=None, **kwargs):
+        self.level = level
+        self.parent = parent
+        kwargs.setdefault('widget', GeoSelect(level, parent))
+        super(GeoChoiceField, self).__init__(
+            geo.LEVELS[level][0]._default_manager.all(), **kwargs)
+
+    def to_python(self, value):
+        if value in self.empty_values:
+            return None
+        if not str(value).isdigit() or (
+                self.level, int(value)) not in geo.get_tree():
+            raise ValidationError(self.error_messages['invalid_choice'],
+                                  code='invalid_choice')
+        return super(GeoChoiceField, self).to_python(value)
+
+
+class GeoFormMixin:
+    """
+    For forms with GeoChoiceFields: the parents of an instance's row
+    start at its ancestors, so the dependent dropdowns can be filled,
+    and a row that is not below the chosen parent is rejected.
+    """
+    def __init__(self, *args, **kwargs):
+        super(GeoFormMixin, self).__init__(*args, **kwargs)
+        levels = list(geo.LEVELS)
+        fields = sorted(
+            ((name, field) for name, field in self.fields.items()
+             if isinstance(field, GeoChoiceField)),
+            key=lambda item: levels.index(item[1].level), reverse=True)
+        for name, field in fields:
+            field.widget.attrs['data-geo-field'] = name
+            pk = self.initial.get(name)
+            if field.parent is None or not pk or self.initial.get(
+                    field.parent):
+                continue
+            model, parent_key = geo.LEVELS[field.level]
+            self.initial[field.parent] = model._default_manager.filter(
+                pk=getattr(pk, 'pk', pk)).values_list(
+                    parent_key, flat=True).first()
+
+    def clean(self):
+        cleaned_data = super(GeoFormMixin, self).clean()
+        tree = geo.get_tree()
+        for name, field in self.fields.items():
+            if not isinstance(field, GeoChoiceField) or field.parent is None:
+                continue
+            row = cleaned_data.get(name)
+            parent = cleaned_data.get(field.parent)
+            if row is None or parent is None:
+                continue
+            parent_level = self.fields[field.parent].level
+            if row.pk not in dict(tree.children(parent_level, parent.pk)):
+                self.add_error(name, ValidationError(
+                    field.error_messages['invalid_choice'],
+                    code='invalid_choice'))
+        return cleaned_data
 
 
 class AdminUserCreationForm(forms.ModelForm):
@@ -135,7 +249,7 @@ class AreaCodeForm(forms.ModelForm):
         fields = ('prefix', 'code', 'country', 'display_in_form')
 
 
-class CityTownForm(forms.ModelForm):
+class CityTownForm(GeoFormMixin, forms.ModelForm):
     name = forms.CharField(label=_('Name'),
                            required=True,
                            widget=forms.TextInput(attrs={
@@ -146,12 +260,20 @@ class CityTownForm(forms.ModelForm):
                                          widget=forms.CheckboxInput(attrs={
                                              'class': 'form-check-input',
                                          }))
+    country = GeoChoiceField('country', label=_('Country'), required=False)
+    state_province_region = GeoChoiceField(
+        'region',
+        parent='country',
+        label=_('State, province or region'),
+        required=False,
+    )
     class Meta:
         model = admin_models.CityTown
-        fields = ('name', 'display_in_form', )
+        fields = ('name', 'display_in_form', 'state_province_region',
+                  'latitude', 'longitude',)
 
 
-class CitySectorForm(forms.ModelForm):
+class CitySectorForm(GeoFormMixin, forms.ModelForm):
     name = forms.CharField(label=_('Name'),
                            required=True,
                            widget=forms.TextInput(attrs={
@@ -162,9 +284,16 @@ class CitySectorForm(forms.ModelForm):
                                          widget=forms.CheckboxInput(attrs={
                                              'class': 'form-check-input',
                                          }))
+    country = GeoChoiceField('country', label=_('Country'), required=False)
+    region = GeoChoiceField('region', parent='country',
+                            label=_('State, province or region'),
+                            required=False)
+    city = GeoChoiceField('city', parent='region', label=_('City or town'),
+                          required=False)
     class Meta:
         model = admin_models.CitySector
-        fields = ('name', 'display_in_form', )
+        fields = ('name', 'display_in_form', 'city', 'latitude',
+                  'longitude',)
 
 
 class StateProvinceRegionForm(forms.ModelForm):
@@ -178,16 +307,7 @@ class StateProvinceRegionForm(forms.ModelForm):
                                          widget=forms.CheckboxInput(attrs={
                                              'class': 'form-check-input',
                                          }))
-    country = forms.ModelChoiceField(
-        label=_('Country'),
-        required=True,
-        queryset=admin_models.Country.objects.filter(
-            display_in_form=True
-        ),
-        widget=forms.Select(attrs={
-            'class': 'form-control dropdown',
-        }),
-    )
+    country = GeoChoiceField('country', label=_('Country'), required=True)
     class Meta:
         model = admin_models.StateProvinceRegion
         fields = ('name', 'display_in_form', 'country',)
@@ -206,7 +326,7 @@ class CallCenterForm(forms.ModelForm):
                                          }))
     class Meta:
         model = admin_models.CallCenter
-        fields = ('name', 'display_in_form', )
+        fields = ('name', 'display_in_form', 'latitude', 'longitude',)
 
 
 class AreaOfExpertiseForm(forms.ModelForm):
@@ -236,9 +356,18 @@ class ApplicationStatusForm(forms.ModelForm):
                                          widget=forms.CheckboxInput(attrs={
                                              'class': 'form-check-input',
                                          }))
+    next_statuses = forms.ModelMultipleChoiceField(
+        label=_('Next statuses'),
+        required=False,
+        queryset=admin_models.ApplicationStatus.objects.all(),
+        widget=forms.SelectMultiple(attrs={
+            'class': 'form-control',
+        }),
+    )
     class Meta:
         model = admin_models.ApplicationStatus
-        fields = ('name', 'display_in_form', )
+        fields = ('name', 'display_in_form', 'is_initial', 'is_closed',
+                  'next_statuses',)
 
 
 class DeclinedReasonForm(forms.ModelForm):
@@ -337,6 +466,99 @@ class InstitutionForm(forms.ModelForm):
     class Meta:
         model = admin_models.Institution
         fields = ('name', 'display_in_form', )
+
+
+class ApplicationDistanceForm(forms.Form):
+    """Filters and sorts applications by distance to a call center."""
+    near = forms.ModelChoiceField(
+        label=_('Near'),
+        required=False,
+        queryset=admin_models.CallCenter.objects.exclude(
+            latitude=None).exclude(longitude=None),
+        widget=forms.Select(attrs={
+            'class': 'form-control dropdown',
+        }),
+    )
+    within = forms.FloatField(label=_('Within (km)'),
+                              required=False,
+                              min_value=0,
+                              widget=forms.NumberInput(attrs={
+                                  'class': 'form-control',
+                              }))
+
+
+class GroupMembershipForm(forms.Form):
+    """Users, by username or as the members of groups, to put in some
+    groups and take out of others at once."""
+    usernames = forms.CharField(label=_('Usernames'),
+                                required=False,
+                                help_text=_('Separated by spaces, commas or '
+                                            'new lines.'),
+                                widget=forms.Textarea(attrs={
+                                    'class': 'form-control',
+                                }))
+    members_of = forms.ModelMultipleChoiceField(
+        label=_('Members of'),
+        required=False,
+        queryset=Group.objects.all(),
+        to_field_name='name',
+    )
+    add = forms.ModelMultipleChoiceField(label=_('Add to'),
+                                         required=False,
+                                         queryset=Group.objects.all(),
+                                         to_field_name='name')
+    remove = forms.ModelMultipleChoiceField(label=_('Remove from'),
+                                            required=False,
+                                            queryset=Group.objects.all(),
+                                            to_field_name='name')
+
+    def clean_usernames(self):
+        return self.cleaned_data['usernames'].replace(',', ' ').split()
+
+    def clean(self):
+        cleaned_data = super(GroupMembershipForm, self).clean()
+        add, remove = cleaned_data.get('add'), cleaned_data.get('remove')
+        if add is None or remove is None:
+            return cleaned_data
+        if not add and not remove:
+            raise forms.ValidationError(
+                _('Choose groups to add the users to or remove them from.'))
+        if set(add) & set(remove):
+            raise forms.ValidationError(
+                _('A group cannot be both added and removed.'))
+        try:
+            cleaned_data['user_pks'] = select_users(
+                cleaned_data.get('usernames', ()),
+                cleaned_data.get('members_of', ()))
+        except ValueError as error:
+            self.add_error('usernames', str(error))
+        return cleaned_data
+
+
+class AccessMatrixForm(forms.Form):
+    """Columns and rows of the access matrix."""
+    kind = forms.ChoiceField(label=_('Columns'),
+                             required=False,
+                             choices=((PERMISSIONS, _('Permissions')),
+                                      (GROUPS, _('Groups'))),
+                             widget=forms.Select(attrs={
+                                 'class': 'form-control dropdown',
+                             }))
+    group = forms.ModelChoiceField(
+        label=_('Members of'),
+        required=False,
+        queryset=Group.objects.order_by('name'),
+        to_field_name='name',
+        widget=forms.Select(attrs={
+            'class': 'form-control dropdown',
+        }),
+    )
+    app_label = forms.CharField(label=_('App'),
+                                required=False,
+                                widget=forms.TextInput(attrs={
+                                    'class': 'form-control',
+                                }))
+
 # PersonFormSet = forms.inlineformset_factory(parent_model=User,
 #                                             model=Profile,
 #                                             exclude=('email', 'password',),
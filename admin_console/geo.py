@@ -0,0 +1,137 @@
+"""
+In-process tree of the geographic lookups offered in forms:
+
+    Country > StateProvinceRegion > CityTown > CitySector
+
+Only rows with display_in_form are included, and a row is reachable only
+through its parent (countries are the roots). Rows whose parent is not
+set, such as cities entered before regions existed, hang below
+(parent level, None) so they can still be picked. Every process keeps
+one immutable tree and rebuilds it when the version stored in the
+shared cache moves; admin_console.signals bumps it whenever a
+geographic row changes.
+
+e.g.:
+    tree = get_tree()
+    tree.children('country', country.pk)  # ((pk, name), ...) of regions
+    tree.children('region', None)  # cities without a region
+"""
+import threading
+from collections import OrderedDict
+from types import MappingProxyType
+from uuid import uuid4
+
+from django.core.cache import cache
+from django.utils import timezone
+
+from admin_console.models import (
+    CitySector,
+    CityTown,
+    Country,
+    StateProvinceRegion,
+)
+
+VERSION_KEY = 'geo-tree-version'
+
+# level: (model, parent foreign key), from the root down.
+LEVELS = OrderedDict((
+    ('country', (Country, None)),
+    ('region', (StateProvinceRegion, 'country')),
+    ('city', (CityTown, 'state_province_region')),
+    ('sector', (CitySector, 'city')),
+))
+MODELS = tuple(model for model, _ in LEVELS.values())
+
+_lock = threading.Lock()
+_tree = None
+
+
+def parent_level(level):
+    """Returns the level above `level`, or None for the roots."""
+    levels = list(LEVELS)
+    position = levels.index(level)
+    return levels[position - 1] if position else None
+
+
+def child_level(level):
+    """Returns the level below `level` (the roots for None), or None
+    below the leaves."""
+    levels = list(LEVELS)
+    if level is None:
+        return levels[0]
+    position = levels.index(level) + 1
+    return levels[position] if position < len(levels) else None
+
+
+class GeoTree(object):
+    """An immutable snapshot of the hierarchy at `version`."""
+    __slots__ = ('version', 'modified', '_nodes', '_children')
+
+    def __init__(self, version, modified, nodes, children):
+        self.version = version
+        self.modified = modified
+        self._nodes = nodes
+        self._children = children
+
+    @classmethod
+    def build(cls, version, modified):
+        nodes = {}
+        parent_levels = [None] + list(LEVELS)
+        children = {(level, None): [] for level in parent_levels}
+        for parent_level, (level, (model, parent)) in zip(parent_levels,
+                                                          LEVELS.items()):
+            fields = ('pk', 'name') + ((parent,) if parent else ())
+            rows = model._default_manager.filter(
+                display_in_form=True).order_by('name').values_list(*fields)
+            for row in rows:
+                pk, name = row[:2]
+                parent_key = (parent_level, row[2] if parent else None)
+                if parent_key not in children:
+                    continue
+                nodes[(level, pk)] = name
+                children[(level, pk)] = []
+                children[parent_key].append((pk, name))
+        return cls(version, modified, MappingProxyType(nodes),
+                   MappingProxyType({key: tuple(value)
+                                     for key, value in children.items()}))
+
+    def __contains__(self, node):
+        return node in self._nodes
+
+    def name(self, level, pk):
+        return self._nodes[(level, pk)]
+
+    def children(self, level=None, pk=None):
+        """Returns ((pk, name), ...) below a node, or the roots when no
+        node is given, or the rows of the level below `level` without a
+        parent when pk is None; raises KeyError for nodes not in the
+        tree."""
+        return self._children[(level, pk)]
+
+
+def current_version():
+    """Returns (version, modified) from the cache, starting a new version
+    when there is none yet."""
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, (uuid4().hex, timezone.now()), None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def bump_version():
+    """Makes every process rebuild its tree on next use."""
+    cache.set(VERSION_KEY, (uuid4().hex, timezone.now()), None)
+
+
+def get_tree():
+    """Returns this process's tree, rebuilding it if the version moved."""
+    global _tree
+    version, modified = current_version()
+    tree = _tree
+    if tree is None or tree.version != version:
+        with _lock:
+            tree = _tree
+            if tree is None or tree.version != version:
+                tree = _tree = GeoTree.build(version, modified)
+    return tree
@@ -0,0 +1,41 @@
+"""
+Cached {pk: name} maps of the curated lookup tables. They are small and
+rarely edited, so formatting code reads names from here instead of
+fetching the related rows; admin_console.signals drops a map whenever
+its table changes.
+
+e.g.:
+    names = lookup_names(CityTown)
+    names[address.city_id]
+"""
+from django.core.cache import cache
+
+NAMES_TIMEOUT = 60 * 60 * 24
+
+
+def names_key(model):
+    return 'lookup-names:%s' % (model._meta.label_lower,)
+
+
+def lookup_names(model):
+    """Returns {pk: name} for every row of `model`."""
+    return many_lookup_names([model])[model]
+
+
+def many_lookup_names(lookup_models):
+    """Returns {model: {pk: name}}, reading every map in one cache round
+    trip and loading only the missing ones from the database."""
+    keys = {names_key(model): model for model in lookup_models}
+    cached = cache.get_many(list(keys))
+    missing = {}
+    for key, model in keys.items():
+        if key not in cached:
+            missing[key] = cached[key] = dict(
+                model._default_manager.order_by().values_list('pk', 'name'))
+    if missing:
+        cache.set_many(missing, NAMES_TIMEOUT)
+    return {model: cached[key] for key, model in keys.items()}
+
+
+def invalidate_names(model):
+    cache.delete(names_key(model))
@@ -0,0 +1,36 @@
+"""Creates the default application pipeline."""
+from django.core.management.base import BaseCommand
+
+from admin_console.models import ApplicationStatus
+
+# name: (is_initial, is_closed, next statuses)
+PIPELINE = (
+    ('New', (True, False, ('Pre-screened', 'Declined'))),
+    ('Pre-screened', (False, False, ('Interviewed', 'Declined'))),
+    ('Interviewed', (False, False, ('Offered', 'Declined'))),
+    ('Offered', (False, False, ('Hired', 'Declined'))),
+    ('Hired', (False, True, ())),
+    ('Declined', (False, True, ())),
+)
+
+
+class Command(BaseCommand):
+    help = ('Creates the default application statuses and the moves '
+            'allowed between them; existing statuses are left as they are.')
+
+    def handle(self, *args, **options):
+        statuses, created_names = {}, set()
+        for name, (is_initial, is_closed, _) in PIPELINE:
+            statuses[name], created = ApplicationStatus.objects.get_or_create(
+                name=name, defaults={'display_in_form': True,
+                                     'is_initial': is_initial,
+                                     'is_closed': is_closed})
+            self.stdout.write(' Creating status %s...' % (name,), ending='')
+            self.stdout.write(self.style.SUCCESS(' OK' if created else
+                                                 ' exists'))
+            if created:
+                created_names.add(name)
+        for name, (_, _, following) in PIPELINE:
+            if name in created_names:
+                statuses[name].next_statuses.set(
+                    [statuses[other] for other in following])
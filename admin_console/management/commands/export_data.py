@@ -0,0 +1,37 @@
+"""Writes an application or employee export to a file."""
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from admin_console.exports import CHUNK_SIZE, EXPORTS, csv_lines, write_xlsx
+
+
+class Command(BaseCommand):
+    help = ('Exports applications or employees as CSV or XLSX, reading and '
+            'writing in chunks so memory stays flat.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('name', choices=list(EXPORTS))
+        parser.add_argument('--format', dest='file_format', default='csv',
+                            choices=('csv', 'xlsx'))
+        parser.add_argument('--output', default='-',
+                            help='File to write, - for stdout (CSV only).')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        exporter = EXPORTS[options['name']]()
+        output, chunk_size = options['output'], options['chunk_size']
+        start = time.perf_counter()
+        if options['file_format'] == 'xlsx':
+            if output == '-':
+                raise CommandError('XLSX exports need --output.')
+            write_xlsx(exporter, output, chunk_size)
+        elif output == '-':
+            for line in csv_lines(exporter, chunk_size):
+                self.stdout.write(line.decode('utf-8'), ending='')
+        else:
+            with open(output, 'wb') as stream:
+                stream.writelines(csv_lines(exporter, chunk_size))
+        if output != '-':
+            self.stdout.write(self.style.SUCCESS(
+                ' %s written in %.1fs' % (output, time.perf_counter() - start)))
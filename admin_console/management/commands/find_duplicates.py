@@ -0,0 +1,41 @@
+"""Queues applications that probably come from the same person for
+review in the admin console."""
+import time
+
+from django.core.management.base import BaseCommand
+
+from admin_console.dedupe import MAX_BLOCK, THRESHOLD, find_duplicates
+
+
+class Command(BaseCommand):
+    help = ('Compares applications sharing a blocking key (name sound, '
+            'phone suffix, email local part or national ID) across '
+            'several processes and queues likely duplicates for review.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=None,
+                            help='Worker processes (default: CPU count; 0 '
+                                 'runs everything in this process).')
+        parser.add_argument('--chunk-size', type=int, default=50000)
+        parser.add_argument('--threshold', type=float, default=THRESHOLD)
+        parser.add_argument('--max-block', type=int, default=MAX_BLOCK,
+                            help='Skip blocking keys shared by more '
+                                 'applications than this.')
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+
+        def progress(stage, count):
+            self.stdout.write('\r %s %s...' % (count, stage), ending='')
+            self.stdout.flush()
+
+        queued = find_duplicates(
+            processes=options['processes'],
+            chunk_size=options['chunk_size'],
+            threshold=options['threshold'],
+            max_block=options['max_block'],
+            progress=progress,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            '\n %s possible duplicates queued in %.1fs' % (
+                queued, time.perf_counter() - start)))
@@ -1,8 +1,19 @@
 """Admin console models."""
 from django.conf import settings
+from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
+from django.db.models import Case, OuterRef, Subquery, Value, When
+from django.db.models.functions import Concat
+from django.urls import reverse
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
-from simple_history.models import HistoricalRecords
+
+from admin_console.lookups import many_lookup_names
+from common.history import BufferedHistoricalRecords
+from common.validation import validate
+
+LATITUDE_VALIDATORS = [MinValueValidator(-90), MaxValueValidator(90)]
+LONGITUDE_VALIDATORS = [MinValueValidator(-180), MaxValueValidator(180)]
 
 
 class BaseSupportModel(models.Model):
@@ -16,7 +27,7 @@ class BaseSupportModel(models.Model):
                           related_name='%(app_label)s_%(class)s_modified_by',
                           on_delete=models.SET_NULL, null=True,
                           blank=True))
-    history = HistoricalRecords()
+    history = BufferedHistoricalRecords()
 
     class Meta:
         abstract = True
@@ -25,7 +36,8 @@ class BaseSupportModel(models.Model):
         return self.name
 
     def save(self, *args, **kwargs):
-        self.full_clean()
+        validate(self, kwargs.pop('validation', None),
+                 kwargs.get('update_fields'))
         super(BaseSupportModel, self).save(*args, **kwargs)
 
     @property
@@ -37,9 +49,58 @@ class BaseSupportModel(models.Model):
         self.modified_by = value
 
 
+class AddressManager(models.Manager):
+    def lookup_names(self):
+        """Returns {lookup model: {pk: name}} for the formatted parts."""
+        return many_lookup_names(
+            [self.model._meta.get_field(field).related_model
+             for field in self.model.FORMATTED_PARTS])
+
+    def formatted_name_expression(self):
+        """
+        SQL equivalent of Address.format_name(), reading each name with
+        a subquery so whole sets of addresses can be reformatted in a
+        single UPDATE.
+        """
+        parts = ['address_line_one']
+        for field in self.model.FORMATTED_PARTS:
+            related = self.model._meta.get_field(field).related_model
+            name = Subquery(related._default_manager.filter(
+                pk=OuterRef(field)).order_by().values('name')[:1])
+            parts.append(Case(
+                When(**{'%s__isnull' % (field,): False},
+                     then=Concat(Value(', '), name)),
+                default=Value(''),
+                output_field=models.CharField(),
+            ))
+        return Concat(*parts, output_field=models.CharField())
+
+    def refresh_formatted_names(self, **filters):
+        """
+        Recomputes formatted_name in the database for the addresses
+        matching `filters`, e.g. after a lookup row is renamed:
+            Address.objects.refresh_formatted_names(city=city.pk)
+        """
+        return self.get_queryset().filter(**filters).update(
+            formatted_name=self.formatted_name_expression())
+
+    def bulk_import(self, addresses, batch_size=None):
+        """
+        Creates unsaved Address instances with bulk_create, formatting
+        them in memory from the cached lookup names. Rows are neither
+        validated nor recorded in history, as with any bulk_create.
+        """
+        names = self.lookup_names()
+        for address in addresses:
+            address.formatted_name = address.format_name(names)
+        return self.bulk_create(addresses, batch_size=batch_size)
+
 
 class Address(BaseSupportModel):
     """Address model."""
+    # Lookup foreign keys appended to address_line_one, in order.
+    FORMATTED_PARTS = ('sector', 'city', 'state_province_region', 'country')
+
     associated_name = models.CharField(max_length=100, blank=False,
                                        help_text=_('Enter a name to remember'\
                                        'this address by.'))
@@ -91,20 +152,32 @@ class Address(BaseSupportModel):
         null=True,
     )
 
-    def save(self, *args, **kwargs):
-        self.full_clean()
-        super(Address, self).save(*args, **kwargs)
+    objects = AddressManager()
 
     def clean(self, *args, **kwargs):
-        self.formatted_name = ', '.join((
-            f'{self.address_line_one}',
-            f'{self.sector}',
-            f'{self.city}',
-            f'{self.state_province_region}',
-            f'{self.country}'
-        ))
+        self.formatted_name = self.format_name()
         super(Address, self).clean(*args, **kwargs)
 
+    def format_name(self, names=None):
+        """
+        Joins address_line_one and the names of the set lookups without
+        loading the related rows; `names` defaults to
+        Address.objects.lookup_names(). A row missing from `names`, e.g.
+        created in the current transaction, is read from the database.
+        """
+        if names is None:
+            names = Address.objects.lookup_names()
+        parts = [self.address_line_one]
+        for field in self.FORMATTED_PARTS:
+            pk = getattr(self, '%s_id' % (field,))
+            if pk is not None:
+                related = self._meta.get_field(field).related_model
+                if pk not in names[related]:
+                    names[related][pk] = related._default_manager.filter(
+                        pk=pk).values_list('name', flat=True).first() or ''
+                parts.append(names[related][pk])
+        return ', '.join(parts)
+
     def __str__(self):
         return f'address of %s' % (self.user.username,)
 
@@ -242,6 +315,17 @@ class CityTown(BaseSupportModel):
     # conforming to a single standard (DR or US) narrows the scope too
     # much. It's left open, individual use-cases may have different
     # setups
+    state_province_region = models.ForeignKey(
+        'admin_console.StateProvinceRegion',
+        related_name='cities',
+        on_delete=models.SET_NULL,
+        blank=True,
+        null=True,
+    )
+    latitude = models.FloatField(blank=True, null=True,
+                                 validators=LATITUDE_VALIDATORS)
+    longitude = models.FloatField(blank=True, null=True,
+                                  validators=LONGITUDE_VALIDATORS)
     class Meta(BaseSupportModel.Meta):
         verbose_name = _('city or town')
         ordering = ('name',)
@@ -249,6 +333,17 @@ class CityTown(BaseSupportModel):
 
 class CitySector(BaseSupportModel):
     """City subdivision model."""
+    city = models.ForeignKey(
+        'admin_console.CityTown',
+        related_name='sectors',
+        on_delete=models.SET_NULL,
+        blank=True,
+        null=True,
+    )
+    latitude = models.FloatField(blank=True, null=True,
+                                 validators=LATITUDE_VALIDATORS)
+    longitude = models.FloatField(blank=True, null=True,
+                                  validators=LONGITUDE_VALIDATORS)
     class Meta(BaseSupportModel.Meta):
         verbose_name = _('city sector')
         ordering = ('name',)
@@ -279,6 +374,10 @@ class Country(BaseSupportModel):
 
 class CallCenter(BaseSupportModel):
     """Curated call center model."""
+    latitude = models.FloatField(blank=True, null=True,
+                                 validators=LATITUDE_VALIDATORS)
+    longitude = models.FloatField(blank=True, null=True,
+                                  validators=LONGITUDE_VALIDATORS)
     class Meta(BaseSupportModel.Meta):
         verbose_name = _('call center')
         verbose_name_plural = _('call centers')
@@ -292,7 +391,20 @@ class AreaOfExpertise(BaseSupportModel):
 
 
 class ApplicationStatus(BaseSupportModel):
-    """Curated application status model."""
+    """
+    Curated application status model. Together they form the pipeline's
+    state machine: applications enter at an is_initial status and move
+    only to one of next_statuses; is_closed statuses end the pipeline.
+    """
+    is_initial = models.BooleanField(default=False)
+    is_closed = models.BooleanField(default=False)
+    next_statuses = models.ManyToManyField(
+        'self',
+        symmetrical=False,
+        related_name='previous_statuses',
+        blank=True,
+    )
+
     class Meta(BaseSupportModel.Meta):
         verbose_name = _('application status')
         verbose_name_plural = _('application status')
@@ -302,3 +414,124 @@ class DeclinedReason(BaseSupportModel):
     class Meta(BaseSupportModel.Meta):
         verbose_name = _('declined reason')
         verbose_name_plural = _('declined reasons')
+
+
+class PossibleDuplicate(models.Model):
+    """
+    A pair of applications the dedupe job (admin_console.dedupe) thinks
+    may come from the same person, waiting for review. `older` always has
+    the lower pk.
+    """
+    PENDING = 0
+    SAME_PERSON = 1
+    DIFFERENT = 2
+    STATUS_CHOICES = (
+        (PENDING, _('Pending review')),
+        (SAME_PERSON, _('Same person')),
+        (DIFFERENT, _('Different people')),
+    )
+    older = models.ForeignKey(
+        'applications.Application',
+        related_name='+',
+        on_delete=models.CASCADE,
+    )
+    newer = models.ForeignKey(
+        'applications.Application',
+        related_name='+',
+        on_delete=models.CASCADE,
+    )
+    score = models.FloatField()
+    # Comma separated fields that matched closely, e.g. 'name,phone'.
+    reasons = models.CharField(max_length=100, blank=True)
+    status = models.IntegerField(choices=STATUS_CHOICES, default=PENDING)
+    created_at = models.DateTimeField(auto_now_add=True, editable=False)
+    reviewed_at = models.DateTimeField(blank=True, null=True)
+    reviewed_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        related_name='+',
+        on_delete=models.SET_NULL,
+        blank=True,
+        null=True,
+    )
+
+    class Meta:
+        verbose_name = _('possible duplicate')
+        verbose_name_plural = _('possible duplicates')
+        unique_together = (('older', 'newer'),)
+        indexes = [models.Index(fields=['status', '-score'])]
+
+    def __str__(self):
+        return '%s ~ %s (%.2f)' % (self.older_id, self.newer_id, self.score)
+
+
+class ReportJobQuerySet(models.QuerySet):
+
+    def reusable(self):
+        """Jobs a new identical request can attach to: queued or running
+        (and not given up on), or done with an unexpired artifact."""
+        now = timezone.now()
+        return self.filter(
+            models.Q(status__in=(ReportJob.PENDING, ReportJob.RUNNING),
+                     created_at__gt=now - settings.REPORT_JOB_TIMEOUT) |
+            models.Q(status=ReportJob.DONE, expires_at__gt=now))
+
+
+class ReportJob(models.Model):
+    """
+    One run of a report (see admin_console.reports) for one set of
+    parameters. Identical requests share a job through params_hash until
+    its artifact expires.
+    """
+    PENDING = 0
+    RUNNING = 1
+    DONE = 2
+    FAILED = 3
+    STATUS_CHOICES = (
+        (PENDING, _('Pending')),
+        (RUNNING, _('Running')),
+        (DONE, _('Done')),
+        (FAILED, _('Failed')),
+    )
+    report = models.CharField(max_length=50)
+    # Canonical JSON of the cleaned parameters.
+    params = models.TextField(default='{}')
+    params_hash = models.CharField(max_length=64)
+    status = models.IntegerField(choices=STATUS_CHOICES, default=PENDING)
+    progress = models.FloatField(default=0)
+    artifact = models.FileField(upload_to='reports/', blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True, editable=False)
+    started_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+    expires_at = models.DateTimeField(blank=True, null=True)
+    requested_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        related_name='+',
+        on_delete=models.SET_NULL,
+        blank=True,
+        null=True,
+    )
+
+    objects = ReportJobQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = _('report job')
+        verbose_name_plural = _('report jobs')
+        get_latest_by = 'created_at'
+        indexes = [models.Index(fields=['report', 'params_hash', 'status'])]
+
+    def __str__(self):
+        return '%s %s (%s)' % (self.report, self.params,
+                               self.get_status_display())
+
+    def progress_message(self):
+        """What the progress socket sends, see admin_console.consumers."""
+        return {
+            'job': self.pk,
+            'status': self.get_status_display().lower(),
+            'progress': round(self.progress, 4),
+            'error': self.error,
+            'download': (reverse('admin_console:report-download',
+                                 args=(self.pk,))
+                         if self.status == self.DONE else None),
+        }
@@ -0,0 +1,330 @@
+"""
+Reports too heavy for a request, run as Celery jobs.
+
+A report cleans its parameters, splits the work into application pk
+ranges, computes a partial result per range over the live and the
+archived applications (see applications.archive) and turns the merged
+result into CSV rows. request_report() hashes the cleaned parameters
+and hands back the job already queued, running or done (until its
+artifact expires) for the same hash, so identical requests compute
+once. run_job() reports progress after every chunk to the channel
+layer group of the job, which admin_console.consumers relays to the
+browser, and stores the CSV in the default storage.
+
+e.g.:
+    job, created = request_report('funnel_by_city',
+                                  {'since': '2018-01-01'}, user)
+"""
+import csv
+import hashlib
+import io
+import json
+import logging
+from collections import Counter, OrderedDict, defaultdict
+
+import numpy as np
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.db.models import Count, Max, Min
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from django.utils.translation import gettext_lazy as _
+
+from admin_console.exports import GroupRestricted
+from admin_console.lookups import many_lookup_names
+from admin_console.models import (
+    ApplicationStatus,
+    CallCenter,
+    CityTown,
+    ReportJob,
+)
+from applications.archive import all_applications, all_transitions, split_ids
+from applications.models import Application, ArchivedApplication
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 20000
+
+
+def group_name(job_pk):
+    return 'report-%s' % (job_pk,)
+
+
+def params_hash(report, params):
+    canonical = json.dumps([report, params], sort_keys=True)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def pk_ranges(querysets, chunk_size=CHUNK_SIZE):
+    """[low, high) ranges of chunk_size covering the pks of every
+    queryset."""
+    bounds = [queryset.aggregate(low=Min('pk'), high=Max('pk'))
+              for queryset in querysets]
+    bounds = [bound for bound in bounds if bound['low'] is not None]
+    if not bounds:
+        return []
+    return [(start, start + chunk_size) for start in range(
+        min(bound['low'] for bound in bounds),
+        max(bound['high'] for bound in bounds) + 1, chunk_size)]
+
+
+class Report(GroupRestricted):
+    """
+    Base report: the date range filters applications by applied_at and
+    partial results are Counters. Subclasses define name, title, headers
+    (or header()), partial() and rows().
+    """
+    name = None
+    title = None
+    groups = ('reporting',)
+    headers = ()
+
+    def clean(self, params):
+        """Validated, JSON-ready parameters; raises ValidationError."""
+        cleaned = {}
+        for key in ('since', 'until'):
+            value = params.get(key) or None
+            if value is not None and parse_date(str(value)) is None:
+                raise ValidationError(_('%(key)s is not a date.'),
+                                      code='invalid', params={'key': key})
+            cleaned[key] = value and parse_date(str(value)).isoformat()
+        return cleaned
+
+    def filters(self, params, prefix=''):
+        """Lookups of the date range, for the applications reached
+        through `prefix`."""
+        filters = {}
+        if params.get('since'):
+            filters[prefix + 'applied_at__date__gte'] = params['since']
+        if params.get('until'):
+            filters[prefix + 'applied_at__date__lte'] = params['until']
+        return filters
+
+    def chunk_filters(self, params, chunk, prefix=''):
+        """filters() of the applications in `chunk`."""
+        return dict(self.filters(params, prefix), **{
+            prefix + 'pk__gte': chunk[0], prefix + 'pk__lt': chunk[1]})
+
+    def applications(self, params, chunk, *fields, **filters):
+        """values(*fields) of the live and archived applications of
+        `chunk` in the date range."""
+        filters.update(self.chunk_filters(params, chunk))
+        return all_applications(*fields, **filters)
+
+    def chunks(self, params, chunk_size=CHUNK_SIZE):
+        return pk_ranges([Application.objects.all(),
+                          ArchivedApplication.objects.all()], chunk_size)
+
+    def empty(self):
+        return Counter()
+
+    def merge(self, total, partial):
+        total.update(partial)
+        return total
+
+    def header(self, params):
+        return list(self.headers)
+
+    def partial(self, params, chunk):
+        raise NotImplementedError
+
+    def rows(self, params, total):
+        raise NotImplementedError
+
+
+class FunnelByCity(Report):
+    """Applications per city in each status, for the date range."""
+    name = 'funnel_by_city'
+    title = _('Funnel by city')
+
+    def partial(self, params, chunk):
+        return Counter((row['city_or_town'], row['current_status'])
+                       for row in self.applications(
+                           params, chunk, 'city_or_town', 'current_status'))
+
+    def statuses(self):
+        """(pk, name) of every status, None for applications without."""
+        names = many_lookup_names([ApplicationStatus])[ApplicationStatus]
+        return [(None, 'No status')] + sorted(names.items())
+
+    def header(self, params):
+        return (['city'] + [name for pk, name in self.statuses()] +
+                ['total'])
+
+    def rows(self, params, total):
+        names = many_lookup_names([CityTown])
+        statuses = [pk for pk, name in self.statuses()]
+        cities = sorted(set(city for city, status in total),
+                        key=lambda pk: names[CityTown].get(pk, ''))
+        for city in cities:
+            counts = [total[(city, status)] for status in statuses]
+            yield [names[CityTown].get(city, '')] + counts + [sum(counts)]
+
+
+class HiringReport(Report):
+    """Reports about applications that reached the hired status."""
+
+    def clean(self, params):
+        cleaned = super(HiringReport, self).clean(params)
+        statuses = ApplicationStatus.objects.all()
+        if params.get('hired_status'):
+            try:
+                statuses = statuses.filter(pk=int(params['hired_status']))
+            except (TypeError, ValueError):
+                raise ValidationError(_('Unknown hired status.'),
+                                      code='invalid')
+        else:
+            statuses = statuses.filter(name='Hired')
+        hired = statuses.values_list('pk', flat=True).first()
+        if hired is None:
+            raise ValidationError(_('Unknown hired status.'), code='invalid')
+        cleaned['hired_status'] = hired
+        return cleaned
+
+
+class TimeToHire(HiringReport):
+    """Days from application to hire, per city."""
+    name = 'time_to_hire'
+    title = _('Time to hire')
+    headers = ('city', 'hires', 'mean_days', 'median_days', 'p90_days')
+
+    def empty(self):
+        return defaultdict(list)
+
+    def merge(self, total, partial):
+        for city, days in partial.items():
+            total[city].extend(days)
+        return total
+
+    def partial(self, params, chunk):
+        hires = all_transitions(
+            'application__city_or_town', 'application__applied_at',
+            'changed_at', to_status=params['hired_status'],
+            **self.chunk_filters(params, chunk, prefix='application__'))
+        days = defaultdict(list)
+        for hire in hires:
+            days[hire['application__city_or_town']].append(
+                (hire['changed_at'] - hire['application__applied_at']
+                 ).total_seconds() / 86400)
+        return days
+
+    def rows(self, params, total):
+        names = many_lookup_names([CityTown])[CityTown]
+        for city in sorted(total, key=lambda pk: names.get(pk, '')):
+            days = np.array(total[city])
+            yield (names.get(city, ''), len(days), round(days.mean(), 1),
+                   round(float(np.median(days)), 1),
+                   round(float(np.percentile(days, 90)), 1))
+
+
+class HiresByCallCenter(HiringReport):
+    """Hires per call center the candidates had worked at before."""
+    name = 'hires_by_call_center'
+    title = _('Hires by previous call center')
+    headers = ('previous_call_center', 'hires')
+
+    def partial(self, params, chunk):
+        # A many-to-many field, so the two tables are read apart.
+        filters = dict(self.chunk_filters(params, chunk),
+                       current_status=params['hired_status'])
+        rows = Application.objects.filter(**filters).order_by().values_list(
+            'previous_call_center').annotate(count=Count('pk'))
+        counts = Counter(dict(rows))
+        for ids in ArchivedApplication.objects.filter(**filters).values_list(
+                'previous_call_center_ids', flat=True):
+            counts.update(split_ids(ids) or [None])
+        return counts
+
+    def rows(self, params, total):
+        names = many_lookup_names([CallCenter])[CallCenter]
+        for center, count in total.most_common():
+            yield (names.get(center, 'None'), count)
+
+
+REPORTS = OrderedDict((report.name, report) for report in (
+    FunnelByCity, TimeToHire, HiresByCallCenter))
+
+
+def request_report(name, params, user=None):
+    """
+    Returns (job, created) for report `name` with `params`, reusing a
+    job for identical parameters when there is one. New jobs are queued
+    once the transaction commits. Raises KeyError for unknown reports
+    and ValidationError for bad parameters.
+    """
+    report = REPORTS[name]()
+    params = report.clean(params)
+    digest = params_hash(name, params)
+    job = ReportJob.objects.reusable().filter(
+        report=name, params_hash=digest).order_by('-created_at').first()
+    if job is not None:
+        return job, False
+    job = ReportJob.objects.create(
+        report=name, params=json.dumps(params, sort_keys=True),
+        params_hash=digest,
+        requested_by=user if user and user.is_authenticated else None)
+    from admin_console.tasks import run_report
+    transaction.on_commit(lambda: run_report.delay(job.pk))
+    return job, True
+
+
+def notify(job):
+    """Sends the job's progress to its channel group, if there is a
+    channel layer; progress is best effort."""
+    try:
+        layer = get_channel_layer()
+        if layer is not None:
+            async_to_sync(layer.group_send)(group_name(job.pk), dict(
+                job.progress_message(), type='report.progress'))
+    except Exception:  #pylint: disable=W0703
+        logger.warning('Could not send progress of report job %s', job.pk,
+                       exc_info=True)
+
+
+def _update(job, **fields):
+    for field, value in fields.items():
+        setattr(job, field, value)
+    job.save(update_fields=list(fields))
+    notify(job)
+
+
+def run_job(job, chunk_size=CHUNK_SIZE):
+    """Computes the report of `job` and stores its CSV artifact."""
+    report = REPORTS[job.report]()
+    params = json.loads(job.params)
+    _update(job, status=ReportJob.RUNNING, started_at=timezone.now(),
+            progress=0)
+    try:
+        chunks = report.chunks(params, chunk_size)
+        total = report.empty()
+        for done, chunk in enumerate(chunks, 1):
+            total = report.merge(total, report.partial(params, chunk))
+            _update(job, progress=done / len(chunks))
+        output = io.StringIO()
+        writer = csv.writer(output)
+        writer.writerow(report.header(params))
+        writer.writerows(report.rows(params, total))
+        job.artifact.save('%s-%s.csv' % (job.report, job.params_hash[:12]),
+                          ContentFile(output.getvalue().encode('utf-8')),
+                          save=False)
+    except Exception as error:
+        _update(job, status=ReportJob.FAILED, error=str(error),
+                finished_at=timezone.now())
+        raise
+    finished = timezone.now()
+    _update(job, status=ReportJob.DONE, progress=1, artifact=job.artifact,
+            finished_at=finished,
+            expires_at=finished + settings.REPORT_ARTIFACT_TTL)
+    return job
+
+
+def purge_expired(now=None):
+    """Deletes expired artifacts and their jobs; returns how many."""
+    expired = ReportJob.objects.filter(expires_at__lte=now or timezone.now())
+    for job in expired.exclude(artifact=''):
+        job.artifact.delete(save=False)
+    return expired.delete()[0]
@@ -0,0 +1,7 @@
+from django.urls import path
+
+from admin_console import consumers
+
+websocket_urlpatterns = [
+    path('ws/reports/<int:pk>/', consumers.ReportProgressConsumer),
+]
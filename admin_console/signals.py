@@ -0,0 +1,52 @@
+"""Admin console signals module"""
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+
+from admin_console import geo
+from admin_console.lookups import invalidate_names
+from admin_console.models import Address
+
+ADDRESS_LOOKUPS = {Address._meta.get_field(field).related_model: field
+                   for field in Address.FORMATTED_PARTS}
+
+
+#pylint: disable=W0613
+def remember_lookup_name(sender, instance, raw=False, **kwargs):
+    """Keeps the stored name so post_save can tell a rename apart."""
+    if instance.pk is not None and not raw:
+        instance._stored_name = sender._default_manager.filter(
+            pk=instance.pk).values_list('name', flat=True).first()
+
+
+def propagate_lookup_name(sender, instance, created, raw=False, **kwargs):
+    """Drops the cached names once the change commits and, on a rename,
+    reformats the addresses pointing at the row with one UPDATE."""
+    forget_lookup_names(sender)
+    stored_name = getattr(instance, '_stored_name', None)
+    if created or raw or stored_name in (None, instance.name):
+        return
+    Address.objects.refresh_formatted_names(
+        **{ADDRESS_LOOKUPS[sender]: instance.pk})
+    instance._stored_name = instance.name
+
+
+def forget_lookup_names(sender, **kwargs):
+    # Not before: a rollback, or a request reading the names before the
+    # commit, would leave the old names cached.
+    transaction.on_commit(lambda: invalidate_names(sender))
+
+
+for lookup in ADDRESS_LOOKUPS:
+    pre_save.connect(remember_lookup_name, sender=lookup)
+    post_save.connect(propagate_lookup_name, sender=lookup)
+    post_delete.connect(forget_lookup_names, sender=lookup)
+
+
+def bump_geo_version(sender, **kwargs):
+    """Rebuilds the geographic tree everywhere once the change commits."""
+    transaction.on_commit(geo.bump_version)
+
+
+for model in geo.MODELS:
+    post_save.connect(bump_geo_version, sender=model)
+    post_delete.connect(bump_geo_version, sender=model)
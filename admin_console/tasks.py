@@ -1,3 +1,8 @@
+from ta_platform.celery_app import app
+
+from admin_console.models import ReportJob
+from admin_console.reports import purge_expired, run_job
+
 # """Applications signals module"""
 # from django.core.mail import EmailMessage
 # from django.db.models.signals import post_save
@@ -30,3 +35,16 @@
 # @receiver(post_save, sender=Application)
 # def send_user_creation_email(sender, instance, **kwargs):
 #     send_user_email.delay(instance.email)
+
+
+@app.task(ignore_result=True)
+def run_report(job_pk):
+    job = ReportJob.objects.filter(pk=job_pk, status=ReportJob.PENDING).first()
+    if job is not None:
+        run_job(job)
+
+
+@app.task(ignore_result=True)
+def purge_report_artifacts():
+    """Meant for celery beat, e.g. hourly."""
+    return purge_expired()
@@ -1,3 +1,939 @@
-from django.test import TestCase
+import csv
+import io
+import shutil
+import tempfile
+import zipfile
 
-# Create your tests here.
+import numpy as np
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.contrib.auth.models import Group, Permission
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.http import http_date
+from guardian.shortcuts import assign_perm
+
+from accounts.models import ModGroup, Profile, User
+from admin_console import dedupe, geo, reports
+from admin_console.access_matrix import AccessMatrix
+from admin_console.distance import haversine_km, rank_by_distance
+from admin_console.exports import ApplicationExport, EmployeeExport, csv_lines
+from admin_console.forms import CitySectorForm
+from admin_console.models import (
+    Address,
+    ApplicationStatus,
+    CallCenter,
+    CitySector,
+    CityTown,
+    Country,
+    Language,
+    PossibleDuplicate,
+    ReportJob,
+    StateProvinceRegion,
+)
+from applications import archive
+from applications.forms import ApplicationForm
+from applications.models import Application, StatusTransition
+
+
+class AddressFormattingTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='addressee', email='addressee@example.com',
+            password='password')
+        cls.country = Country.objects.create(name='Dominican Republic')
+        cls.state = StateProvinceRegion.objects.create(
+            name='Santo Domingo', country=cls.country)
+        cls.city = CityTown.objects.create(name='Santo Domingo Este')
+        cls.sector = CitySector.objects.create(name='Ensanche Ozama')
+
+    def setUp(self):
+        cache.clear()
+
+    def make_address(self, **kwargs):
+        fields = dict(user=self.user, name='Home', associated_name='Home',
+                      address_line_one='Calle 1 #10', sector=self.sector,
+                      city=self.city, state_province_region=self.state,
+                      country=self.country)
+        fields.update(kwargs)
+        return Address(**fields)
+
+    def test_formatted_name_joins_lookup_names(self):
+        address = self.make_address()
+        address.save()
+        self.assertEqual(address.formatted_name, 'Calle 1 #10, Ensanche '
+                         'Ozama, Santo Domingo Este, Santo Domingo, '
+                         'Dominican Republic')
+
+    def test_missing_parts_are_skipped(self):
+        address = self.make_address(sector=None, state_province_region=None)
+        self.assertEqual(address.format_name(),
+                         'Calle 1 #10, Santo Domingo Este, Dominican Republic')
+
+    def test_formatting_reads_the_cache_not_the_lookups(self):
+        self.make_address().save()
+        address = Address.objects.get()
+        with self.assertNumQueries(0):
+            address.format_name()
+
+    def test_refresh_is_a_single_update(self):
+        for _ in range(3):
+            self.make_address().save()
+        with self.assertNumQueries(1):
+            self.assertEqual(
+                Address.objects.refresh_formatted_names(city=self.city.pk), 3)
+
+    def test_expression_matches_format_name(self):
+        address = self.make_address(state_province_region=None)
+        address.save()
+        Address.objects.update(formatted_name='')
+        Address.objects.refresh_formatted_names()
+        self.assertEqual(Address.objects.get().formatted_name,
+                         address.format_name())
+
+    def test_bulk_import_formats_in_memory(self):
+        Address.objects.lookup_names()
+        addresses = [self.make_address(address_line_one='Calle %s' % (i,))
+                     for i in range(3)]
+        with self.assertNumQueries(1):
+            Address.objects.bulk_import(addresses)
+        self.assertEqual(
+            sorted(Address.objects.values_list('formatted_name', flat=True)),
+            sorted(address.format_name() for address in addresses))
+
+
+class LookupNameSignalTest(TransactionTestCase):
+    """Cached names are dropped when the change commits."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='addressee', email='addressee@example.com',
+            password='password')
+        self.country = Country.objects.create(name='Dominican Republic')
+        self.city = CityTown.objects.create(name='Santo Domingo Este')
+
+    def make_address(self, **kwargs):
+        fields = dict(user=self.user, name='Home', associated_name='Home',
+                      address_line_one='Calle 1 #10', city=self.city,
+                      country=self.country)
+        fields.update(kwargs)
+        return Address(**fields)
+
+    def test_rename_propagates_to_addresses(self):
+        addresses = [self.make_address(), self.make_address(sector=None)]
+        for address in addresses:
+            address.save()
+        other = self.make_address(city=None)
+        other.save()
+        city = CityTown.objects.get(pk=self.city.pk)
+        city.name = 'Santo Domingo Norte'
+        city.save()
+        formatted = dict(Address.objects.values_list('pk', 'formatted_name'))
+        for address in addresses:
+            self.assertEqual(formatted[address.pk], address.format_name())
+            self.assertIn('Santo Domingo Norte', formatted[address.pk])
+        self.assertEqual(formatted[other.pk], other.formatted_name)
+
+    def test_new_lookup_rows_invalidate_the_names(self):
+        Address.objects.lookup_names()
+        city = CityTown.objects.create(name='Boca Chica')
+        address = self.make_address(city=city)
+        self.assertIn('Boca Chica', address.format_name())
+
+    def test_rows_created_in_the_transaction_are_named(self):
+        Address.objects.lookup_names()
+        with transaction.atomic():
+            city = CityTown.objects.create(name='Boca Chica')
+            Address.objects.bulk_import([self.make_address(city=city)])
+        self.assertIn('Boca Chica', Address.objects.get().formatted_name)
+
+    def test_rolled_back_rename_keeps_the_names(self):
+        address = self.make_address()
+        address.save()
+        with self.assertRaises(ValueError), transaction.atomic():
+            city = CityTown.objects.get(pk=self.city.pk)
+            city.name = 'Santo Domingo Norte'
+            city.save()
+            Address.objects.lookup_names()
+            raise ValueError
+        self.assertIn('Santo Domingo Este', address.format_name())
+
+
+def make_hierarchy(test):
+    test.country = Country.objects.create(name='Dominican Republic',
+                                          display_in_form=True)
+    test.region = StateProvinceRegion.objects.create(
+        name='Santo Domingo', country=test.country, display_in_form=True)
+    test.city = CityTown.objects.create(
+        name='Santo Domingo Este', state_province_region=test.region,
+        display_in_form=True)
+    test.sectors = [CitySector.objects.create(name=name, city=test.city,
+                                              display_in_form=True)
+                    for name in ('Los Mina', 'Ensanche Ozama')]
+    CitySector.objects.create(name='Hidden', city=test.city)
+    CitySector.objects.create(name='Orphan', display_in_form=True)
+
+
+class GeoTreeTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        make_hierarchy(cls)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_children_follow_the_hierarchy(self):
+        tree = geo.get_tree()
+        self.assertEqual(tree.children(), ((self.country.pk,
+                                            'Dominican Republic'),))
+        self.assertEqual(tree.children('country', self.country.pk),
+                         ((self.region.pk, 'Santo Domingo'),))
+        self.assertEqual(tree.children('city', self.city.pk),
+                         ((self.sectors[1].pk, 'Ensanche Ozama'),
+                          (self.sectors[0].pk, 'Los Mina')))
+        self.assertEqual(tree.children('sector', self.sectors[0].pk), ())
+
+    def test_tree_is_reused_until_the_version_moves(self):
+        tree = geo.get_tree()
+        with self.assertNumQueries(0):
+            self.assertIs(geo.get_tree(), tree)
+        geo.bump_version()
+        self.assertIsNot(geo.get_tree(), tree)
+
+    def test_endpoint_returns_children(self):
+        response = self.client.get(reverse(
+            'admin_console:geo-children', args=['region', self.region.pk]))
+        self.assertEqual(response.json(), {
+            'level': 'city',
+            'children': [{'id': self.city.pk, 'name': 'Santo Domingo Este'}],
+        })
+        self.assertTrue(response.has_header('ETag'))
+        self.assertTrue(response.has_header('Last-Modified'))
+
+    def test_unknown_nodes_are_not_found(self):
+        for args in (['city', 0], ['planet', self.city.pk],
+                     ['sector', self.sectors[0].pk]):
+            response = self.client.get(reverse('admin_console:geo-children',
+                                               args=args))
+            self.assertEqual(response.status_code, 404, args)
+
+    def test_unchanged_tree_answers_not_modified(self):
+        url = reverse('admin_console:geo-roots')
+        response = self.client.get(url)
+        with self.assertNumQueries(0):
+            cached = self.client.get(url,
+                                     HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(cached.status_code, 304)
+        cached = self.client.get(url, HTTP_IF_MODIFIED_SINCE=http_date())
+        self.assertEqual(cached.status_code, 304)
+        geo.bump_version()
+        self.assertEqual(self.client.get(
+            url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+
+
+class GeoFormTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        make_hierarchy(cls)
+        cls.other_region = StateProvinceRegion.objects.create(
+            name='Santiago', country=cls.country, display_in_form=True)
+
+    def setUp(self):
+        cache.clear()
+
+    def form(self, **data):
+        return CitySectorForm(data=dict({'name': 'Villa Duarte',
+                                         'display_in_form': True}, **data))
+
+    def test_dependent_dropdowns_start_with_the_bound_value_only(self):
+        geo.get_tree()
+        form = CitySectorForm(initial={'city': self.city.pk,
+                                       'region': self.region.pk})
+        with self.assertNumQueries(0):
+            country, region, city = (str(form[name]) for name in (
+                'country', 'region', 'city'))
+        self.assertIn('Dominican Republic', country)
+        self.assertIn('data-geo-parent="country"', region)
+        self.assertNotIn('Santiago', region)
+        self.assertIn('Santo Domingo Este', city)
+        self.assertIn(reverse('admin_console:geo-roots'), city)
+
+    def test_instance_ancestors_are_the_initial_parents(self):
+        sector = CitySectorForm(instance=self.sectors[0])
+        self.assertEqual(sector.initial['region'], self.region.pk)
+        self.assertEqual(sector.initial['country'], self.country.pk)
+
+    def test_rows_must_be_in_the_tree_below_the_parent(self):
+        self.assertTrue(self.form(country=self.country.pk,
+                                  region=self.region.pk,
+                                  city=self.city.pk).is_valid())
+        self.assertIn('city', self.form(region=self.other_region.pk,
+                                        city=self.city.pk).errors)
+        hidden = CityTown.objects.create(name='Hidden',
+                                         state_province_region=self.region)
+        geo.bump_version()
+        self.assertIn('city', self.form(city=hidden.pk).errors)
+
+    def test_cities_without_a_region_can_be_picked(self):
+        city = CityTown.objects.create(name='Boca Chica',
+                                       display_in_form=True)
+        geo.bump_version()
+        form = ApplicationForm(instance=Application(city_or_town=self.city))
+        field = str(form['city_or_town'])
+        self.assertIn('Boca Chica', field)
+        self.assertIn('data-geo-orphan', field)
+        self.assertTrue(self.form(city=city.pk).is_valid())
+        self.assertIn('city', self.form(region=self.region.pk,
+                                        city=city.pk).errors)
+
+    def test_application_form_cascades_to_the_city(self):
+        form = ApplicationForm(instance=Application(city_or_town=self.city))
+        self.assertEqual(form.initial['country'], self.country.pk)
+        self.assertIn('data-geo-parent="region"', str(form['city_or_town']))
+
+
+class GeoVersionSignalTest(TransactionTestCase):
+
+    def test_committed_changes_rebuild_the_tree(self):
+        cache.clear()
+        make_hierarchy(self)
+        tree = geo.get_tree()
+        self.city.name = 'Santo Domingo Norte'
+        self.city.save()
+        self.assertEqual(geo.get_tree().children('region', self.region.pk),
+                         ((self.city.pk, 'Santo Domingo Norte'),))
+        self.assertNotEqual(geo.get_tree().version, tree.version)
+
+
+class DistanceTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.site = CallCenter.objects.create(
+            name='Downtown', latitude=18.4861, longitude=-69.9312)
+        cls.near_city = CityTown.objects.create(
+            name='Santo Domingo Este', latitude=18.4885, longitude=-69.8570)
+        cls.far_city = CityTown.objects.create(
+            name='Santiago', latitude=19.4517, longitude=-70.6970)
+        cls.unmapped_city = CityTown.objects.create(name='Unmapped')
+        cls.sector = CitySector.objects.create(
+            name='Gazcue', latitude=18.4663, longitude=-69.9044)
+        cls.user = User.objects.create_user(
+            username='commuter', email='commuter@example.com',
+            password='password')
+        Address.objects.create(user=cls.user, name='Home',
+                               associated_name='Home', is_primary=True,
+                               address_line_one='Calle 1', sector=cls.sector,
+                               city=cls.far_city)
+        cls.by_address = cls.apply('address', city=cls.far_city,
+                                   user=cls.user)
+        cls.near = cls.apply('near', city=cls.near_city)
+        cls.far = cls.apply('far', city=cls.far_city)
+        cls.unlocated = cls.apply('unlocated', city=cls.unmapped_city)
+
+    @classmethod
+    def apply(cls, name, city, user=None):
+        return Application.objects.create(
+            first_names=name, last_names=name, primary_phone='8095550100',
+            email='%s@example.com' % (name,), national_id_number='1',
+            address_line_one='Calle 1', city_or_town=city, user=user)
+
+    def test_haversine_matches_known_distance(self):
+        km = haversine_km(self.site.latitude, self.site.longitude,
+                          [self.far_city.latitude], [self.far_city.longitude])
+        self.assertAlmostEqual(km[0], 134.2, delta=0.1)
+
+    def test_nearest_first_and_unlocated_last(self):
+        pks, km = rank_by_distance(Application.objects.all(), self.site)
+        self.assertEqual(list(pks), [self.by_address.pk, self.near.pk,
+                                     self.far.pk, self.unlocated.pk])
+        self.assertTrue(np.isnan(km[-1]))
+
+    def test_within_drops_far_and_unlocated(self):
+        pks, _ = rank_by_distance(Application.objects.all(), self.site,
+                                  within=20)
+        self.assertEqual(list(pks), [self.by_address.pk, self.near.pk])
+
+    def test_query_count_does_not_grow_with_candidates(self):
+        with self.assertNumQueries(5):
+            rank_by_distance(Application.objects.all(), self.site)
+
+    def test_site_needs_coordinates(self):
+        with self.assertRaises(ValueError):
+            rank_by_distance(Application.objects.all(),
+                             CallCenter(name='Nowhere'))
+
+    def test_admin_list_sorts_by_distance(self):
+        reporter = User.objects.create_user(
+            username='reporter', email='reporter@example.com',
+            password='password', is_active=True)
+        reporter.groups.add(Group.objects.create(name='reporting'))
+        self.client.force_login(reporter)
+        url = reverse('admin_console:application-list')
+        response = self.client.get(url, {'near': self.site.pk, 'within': 50})
+        applications = response.context['application_list']
+        self.assertEqual([a.pk for a in applications],
+                         [self.by_address.pk, self.near.pk])
+        self.assertLess(applications[0].distance_km, 5)
+        response = self.client.get(url)
+        self.assertEqual(len(response.context['application_list']), 4)
+
+    def test_admin_list_needs_an_export_group(self):
+        url = reverse('admin_console:application-list')
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 302)
+        self.assertNotContains(response, 'near@example.com', status_code=302)
+        self.user.is_active = True
+        self.user.save()
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+
+class DedupeTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.original = cls.apply('José Ramón', 'Pérez', 'jramon.perez@example.com',
+                                 '809-555-0101', birth_date='1990-04-02')
+        cls.again = cls.apply('Jose Ramon', 'Peres', 'j.ramonperez+2@example.com',
+                              '(829) 555 0101', birth_date='1990-04-02')
+        cls.namesake = cls.apply('Jose', 'Perez', 'other@example.com',
+                                 '8095559999', birth_date='1985-01-01')
+        cls.stranger = cls.apply('Maria', 'Santos', 'maria@example.com',
+                                 '8095551234')
+
+    @classmethod
+    def apply(cls, first_names, last_names, email, phone, birth_date=None):
+        return Application.objects.create(
+            first_names=first_names, last_names=last_names, email=email,
+            primary_phone=phone, birth_date=birth_date,
+            national_id_number='%011d' % (Application.objects.count(),),
+            address_line_one='Calle 1')
+
+    def test_soundex_and_normalization(self):
+        self.assertEqual(dedupe.normalize(' José  Ramón-Pérez '),
+                         'jose ramon perez')
+        self.assertEqual(dedupe.soundex('robert'), 'R163')
+        self.assertEqual(dedupe.soundex('rupert'), 'R163')
+        self.assertEqual(dedupe.soundex('perez'), dedupe.soundex('peres'))
+        self.assertEqual(dedupe.email_local('Ana.Perez+jobs@x.com'), 'anaperez')
+
+    def test_pairs_only_come_from_shared_blocks(self):
+        hashes, pks = dedupe.keys_for_range((0, 10 ** 9))
+        pairs = {tuple(pair) for pair in dedupe.candidate_pairs(
+            hashes, pks).tolist()}
+        self.assertIn((self.original.pk, self.again.pk), pairs)
+        self.assertNotIn((self.original.pk, self.stranger.pk), pairs)
+        self.assertFalse(dedupe.candidate_pairs(hashes, pks, max_block=1).size)
+
+    def test_job_queues_likely_duplicates_once(self):
+        self.assertEqual(dedupe.find_duplicates(processes=0, chunk_size=2), 1)
+        duplicate = PossibleDuplicate.objects.get()
+        self.assertEqual((duplicate.older, duplicate.newer),
+                         (self.original, self.again))
+        self.assertEqual(duplicate.reasons, 'name,phone,email,birth_date')
+        self.assertEqual(dedupe.find_duplicates(processes=0), 0)
+
+    def test_review_queue(self):
+        dedupe.find_duplicates(processes=0)
+        duplicate = PossibleDuplicate.objects.get()
+        recruiter = User.objects.create_user(
+            username='recruiter', email='recruiter@example.com',
+            password='password', is_active=True)
+        recruiter.groups.add(Group.objects.create(name='recruiter'))
+        self.client.force_login(recruiter)
+        url = reverse('admin_console:duplicate-list')
+        self.assertContains(self.client.get(url), self.again.email)
+        self.client.post(reverse('admin_console:duplicate-review',
+                                 args=[duplicate.pk]),
+                         {'status': PossibleDuplicate.DIFFERENT})
+        duplicate.refresh_from_db()
+        self.assertEqual(duplicate.status, PossibleDuplicate.DIFFERENT)
+        self.assertIsNotNone(duplicate.reviewed_at)
+        self.assertEqual(duplicate.reviewed_by, recruiter)
+        self.assertNotContains(self.client.get(url), self.again.email)
+
+    def test_review_queue_needs_a_reviewer_group(self):
+        dedupe.find_duplicates(processes=0)
+        duplicate = PossibleDuplicate.objects.get()
+        url = reverse('admin_console:duplicate-list')
+        review_url = reverse('admin_console:duplicate-review',
+                             args=[duplicate.pk])
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.client.force_login(User.objects.create_user(
+            username='employee', email='employee@example.com',
+            password='password', is_active=True))
+        self.assertEqual(self.client.get(url).status_code, 403)
+        response = self.client.post(
+            review_url, {'status': PossibleDuplicate.SAME_PERSON})
+        self.assertEqual(response.status_code, 403)
+        duplicate.refresh_from_db()
+        self.assertEqual(duplicate.status, PossibleDuplicate.PENDING)
+
+
+class ExportTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.english, cls.french = [Language.objects.create(name=name)
+                                   for name in ('English', 'French')]
+        cls.city = CityTown.objects.create(name='Santiago')
+        cls.applications = [Application.objects.create(
+            first_names='Ana %s' % (n,), last_names='Perez',
+            primary_phone='8095550100', email='ana%s@example.com' % (n,),
+            national_id_number=str(n), address_line_one='Calle 1',
+            city_or_town=cls.city) for n in range(5)]
+        cls.applications[0].languages.set([cls.english, cls.french])
+        cls.reporter = User.objects.create_user(
+            username='reporter', email='reporter@example.com',
+            password='password', is_active=True)
+        cls.reporter.groups.add(Group.objects.create(name='reporting'))
+        cls.employee = User.objects.create_user(
+            username='employee', email='employee@example.com',
+            password='password', is_active=True,
+            employee_status=User.ACTIVE)
+
+    def setUp(self):
+        cache.clear()
+
+    def read_csv(self, lines):
+        return list(csv.reader(io.StringIO(
+            b''.join(lines).decode('utf-8'))))
+
+    def test_application_rows_resolve_lookup_names(self):
+        rows = self.read_csv(csv_lines(ApplicationExport()))
+        self.assertEqual(rows[0], list(ApplicationExport.headers))
+        self.assertEqual(len(rows), 6)
+        first = dict(zip(rows[0], rows[1]))
+        self.assertEqual(first['city_or_town'], 'Santiago')
+        self.assertEqual(first['languages'], 'English, French')
+        self.assertEqual(first['national_id_type'], 'Cedula')
+
+    def test_queries_grow_with_chunks_not_rows(self):
+        lines = csv_lines(ApplicationExport(), chunk_size=2)
+        next(lines)
+        # The cached lookup names, then 3 chunks and the empty one, each
+        # with the three many-to-many tables.
+        with self.assertNumQueries(5 + 3 * 4 + 1):
+            self.assertEqual(len(list(lines)), 5)
+
+    def test_employees_exclude_never_employed(self):
+        rows = self.read_csv(csv_lines(EmployeeExport()))
+        self.assertEqual([row[1] for row in rows[1:]], ['employee'])
+        self.assertEqual(rows[1][5], 'Active')
+
+    def test_employee_address_columns_are_names(self):
+        region = StateProvinceRegion.objects.create(name='Cibao Norte')
+        Address.objects.create(
+            user=self.employee, name='Home', associated_name='Home',
+            is_primary=True, address_line_one='Calle 1', city=self.city,
+            state_province_region=region)
+        row = dict(zip(*self.read_csv(csv_lines(EmployeeExport()))))
+        self.assertEqual(row['city'], 'Santiago')
+        self.assertEqual(row['state_province_region'], 'Cibao Norte')
+
+    def test_xlsx_download(self):
+        self.client.force_login(self.reporter)
+        url = reverse('admin_console:export', args=('applications', 'xlsx'))
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('attachment', response['Content-Disposition'])
+        content = b''.join(response.streaming_content)
+        with zipfile.ZipFile(io.BytesIO(content)) as workbook:
+            sheet = workbook.read('xl/worksheets/sheet1.xml').decode('utf-8')
+        self.assertIn('Ana 4', sheet)
+
+    def test_csv_download_needs_an_export_group(self):
+        url = reverse('admin_console:export', args=('employees', 'csv'))
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.client.force_login(self.employee)
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.client.force_login(self.reporter)
+        response = self.client.get(url)
+        self.assertEqual(len(self.read_csv(response.streaming_content)), 2)
+
+
+class ObjectPermissionListTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.editor = User.objects.create_user(
+            username='editor', email='editor@example.com',
+            password='password', is_active=True)
+        cls.editors = Group.objects.create(name='editors')
+        cls.editor.groups.add(cls.editors)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.editor)
+
+    def add_rows(self, count):
+        start = User.objects.count()
+        for n in range(start, start + count):
+            group = Group.objects.create(name='group-%s' % (n,))
+            if n % 2:
+                assign_perm('change_group', self.editor, group)
+            else:
+                assign_perm('change_group', self.editors, group)
+            user = User.objects.create_user(
+                username='user-%s' % (n,), email='user%s@example.com' % (n,),
+                password='password')
+            if n % 3 == 0:
+                assign_perm('change_profile', self.editor, user.profile)
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries), response
+
+    def test_queries_do_not_grow_with_rows(self):
+        for name in ('group-list', 'user-list'):
+            url = reverse('admin_console:%s' % (name,))
+            self.add_rows(2)
+            few, _ = self.count_queries(url)
+            self.add_rows(10)
+            many, _ = self.count_queries(url)
+            self.assertEqual(few, many, name)
+
+    def test_edit_links_follow_object_permissions(self):
+        self.add_rows(4)
+        _, response = self.count_queries(reverse('admin_console:group-list'))
+        for group in Group.objects.filter(name__startswith='group-'):
+            self.assertContains(response, reverse(
+                'admin_console:group-edit', args=(group.pk,)))
+        self.assertNotContains(response, reverse(
+            'admin_console:group-edit', args=(self.editors.pk,)))
+        _, response = self.count_queries(reverse('admin_console:user-list'))
+        for profile in Profile.objects.all():
+            link = reverse('admin_console:user-edit', args=(profile.pk,))
+            if profile.user.username == 'user-3':
+                self.assertContains(response, link)
+            else:
+                self.assertNotContains(response, link)
+
+    def test_anonymous_users_are_sent_to_log_in(self):
+        self.add_rows(2)
+        self.client.logout()
+        for name in ('group-list', 'user-list'):
+            response = self.client.get(reverse('admin_console:%s' % (name,)))
+            self.assertEqual(response.status_code, 302, name)
+            self.assertIn('login', response['Location'])
+
+    def test_group_names_with_slashes(self):
+        group = Group.objects.create(name='sales/north')
+        assign_perm('change_group', self.editor, group)
+        _, response = self.count_queries(reverse('admin_console:group-list'))
+        detail = reverse('admin_console:group-detail', args=(group.pk,))
+        self.assertContains(response, detail)
+        self.assertContains(self.client.get(detail), 'sales/north')
+
+
+class GroupMembershipsViewTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.candidate = Group.objects.create(name='candidate')
+        cls.employee = Group.objects.create(name='employee')
+        cls.agents = [User.objects.create_user(
+            username='agent-%s' % (n,), email='agent%s@example.com' % (n,),
+            password='password') for n in range(5)]
+        cls.candidate.user_set.add(*cls.agents)
+        cls.manager = User.objects.create_user(
+            username='manager', email='manager@example.com',
+            password='password', is_active=True)
+        cls.manager.user_permissions.add(
+            Permission.objects.get(codename='change_group'))
+
+    def setUp(self):
+        cache.clear()
+        self.url = reverse('admin_console:group-memberships')
+
+    def test_needs_change_group(self):
+        self.assertEqual(self.client.post(self.url).status_code, 403)
+        self.client.force_login(self.agents[0])
+        self.assertEqual(self.client.post(self.url).status_code, 403)
+
+    def test_moves_members(self):
+        self.client.force_login(self.manager)
+        response = self.client.post(self.url, {
+            'members_of': 'candidate', 'usernames': 'manager',
+            'add': 'employee', 'remove': 'candidate'})
+        self.assertEqual(response.json(),
+                         {'users': 6, 'added': 6, 'removed': 5})
+        self.assertEqual(self.employee.user_set.count(), 6)
+        self.assertFalse(self.candidate.user_set.exists())
+
+    def test_invalid(self):
+        self.client.force_login(self.manager)
+        response = self.client.post(self.url, {
+            'usernames': 'agent-1, nobody', 'add': 'employee'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('nobody', response.json()['errors']['usernames'][0])
+        response = self.client.post(self.url, {
+            'usernames': 'agent-1', 'add': 'employee', 'remove': 'employee'})
+        self.assertEqual(response.status_code, 400)
+
+
+REPORT_MEDIA = tempfile.mkdtemp(prefix='ta_platform-reports-')
+
+
+@override_settings(
+    CHANNEL_LAYERS={'default': {
+        'BACKEND': 'channels.layers.InMemoryChannelLayer'}},
+    MEDIA_ROOT=REPORT_MEDIA,
+)
+class ReportJobTest(TestCase):
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(REPORT_MEDIA, ignore_errors=True)
+        super(ReportJobTest, cls).tearDownClass()
+
+    @classmethod
+    def setUpTestData(cls):
+        call_command('create_application_statuses', stdout=io.StringIO())
+        cls.status = {status.name: status
+                      for status in ApplicationStatus.objects.all()}
+        cls.santiago = CityTown.objects.create(name='Santiago')
+        cls.bani = CityTown.objects.create(name='Bani')
+        for n, city in enumerate((cls.santiago, cls.santiago, cls.bani)):
+            application = Application.objects.create(
+                first_names='Ana %s' % (n,), last_names='Perez',
+                primary_phone='8095550100', email='ana%s@example.com' % (n,),
+                national_id_number=str(n), address_line_one='Calle 1',
+                city_or_town=city)
+            application.transition(cls.status['New'])
+        cls.reporter = User.objects.create_user(
+            username='reporter', email='reporter@example.com',
+            password='password', is_active=True)
+        cls.reporter.groups.add(Group.objects.create(name='reporting'))
+
+    def setUp(self):
+        cache.clear()
+
+    def test_identical_requests_share_a_job(self):
+        job, created = reports.request_report(
+            'funnel_by_city', {'since': '2000-01-01', 'until': ''})
+        self.assertTrue(created)
+        again, created = reports.request_report(
+            'funnel_by_city', {'until': None, 'since': '2000-01-01'})
+        self.assertEqual((again, created), (job, False))
+        other, created = reports.request_report('funnel_by_city', {})
+        self.assertTrue(created)
+
+    def test_expired_artifacts_are_recomputed(self):
+        job, _ = reports.request_report('funnel_by_city', {})
+        reports.run_job(job)
+        self.assertEqual(reports.request_report('funnel_by_city', {})[0], job)
+        ReportJob.objects.filter(pk=job.pk).update(expires_at=timezone.now())
+        self.assertNotEqual(
+            reports.request_report('funnel_by_city', {})[0], job)
+        self.assertEqual(reports.purge_expired(), 1)
+
+    def test_funnel_artifact_and_progress(self):
+        job, _ = reports.request_report('funnel_by_city', {})
+        layer = get_channel_layer()
+        async_to_sync(layer.group_add)(reports.group_name(job.pk), 'browser')
+        reports.run_job(job, chunk_size=2)
+        messages = []
+        while True:
+            message = async_to_sync(layer.receive)('browser')
+            messages.append(message)
+            if message['status'] == 'done':
+                break
+        self.assertEqual([m['progress'] for m in messages],
+                         [0, 0.5, 1, 1])
+        job.refresh_from_db()
+        with job.artifact.open('rb') as artifact:
+            rows = list(csv.reader(io.StringIO(
+                artifact.read().decode('utf-8'))))
+        self.assertEqual(rows[0][:3], ['city', 'No status', 'New'])
+        self.assertEqual([row[0] for row in rows[1:]], ['Bani', 'Santiago'])
+        self.assertEqual(rows[2][2], '2')
+        self.assertEqual(rows[2][-1], '2')
+
+    def test_time_to_hire(self):
+        StatusTransition.objects.filter(to_status=self.status['New']).update(
+            to_status=self.status['Hired'])
+        job, _ = reports.request_report('time_to_hire', {})
+        reports.run_job(job)
+        with job.artifact.open('rb') as artifact:
+            rows = list(csv.reader(io.StringIO(
+                artifact.read().decode('utf-8'))))
+        self.assertEqual(rows[0], list(reports.TimeToHire.headers))
+        self.assertEqual([row[:2] for row in rows[1:]],
+                         [['Bani', '1'], ['Santiago', '2']])
+
+    def test_hired_status_must_be_a_status_pk(self):
+        for value in ('hired', str(self.status['Hired'].pk + 100)):
+            with self.assertRaises(ValidationError):
+                reports.request_report('time_to_hire',
+                                       {'hired_status': value})
+        self.client.force_login(self.reporter)
+        response = self.client.post(
+            reverse('admin_console:report-run', args=('time_to_hire',)),
+            {'hired_status': 'hired'})
+        self.assertRedirects(response, reverse('admin_console:report-list'))
+
+    def test_archived_hires_still_count(self):
+        center = CallCenter.objects.create(name='Sitel')
+        hired = Application.objects.get(first_names='Ana 2')
+        hired.previous_call_center.set([center])
+        StatusTransition.objects.filter(application=hired).update(
+            to_status=self.status['Hired'])
+        Application.objects.filter(pk=hired.pk).update(
+            current_status=self.status['Hired'])
+        archive.archive_chunk([hired.pk])
+        self.assertFalse(Application.objects.filter(pk=hired.pk).exists())
+
+        def artifact(name):
+            job, _ = reports.request_report(name, {})
+            reports.run_job(job, chunk_size=2)
+            with job.artifact.open('rb') as artifact:
+                return list(csv.reader(io.StringIO(
+                    artifact.read().decode('utf-8'))))[1:]
+        self.assertEqual([row[:2] for row in artifact('time_to_hire')],
+                         [['Bani', '1']])
+        self.assertEqual(artifact('hires_by_call_center'), [['Sitel', '1']])
+        funnel = {row[0]: row[-1] for row in artifact('funnel_by_city')}
+        self.assertEqual(funnel, {'Bani': '1', 'Santiago': '2'})
+
+    def test_views(self):
+        url = reverse('admin_console:report-run', args=('funnel_by_city',))
+        self.assertEqual(self.client.post(url).status_code, 403)
+        self.client.force_login(self.reporter)
+        response = self.client.post(url, {'since': 'yesterday'})
+        self.assertRedirects(response, reverse('admin_console:report-list'))
+        response = self.client.post(url, {'since': '2018-01-01'})
+        job = ReportJob.objects.get()
+        self.assertRedirects(response, reverse('admin_console:report-job',
+                                               args=(job.pk,)))
+        download = reverse('admin_console:report-download', args=(job.pk,))
+        self.assertEqual(self.client.get(download).status_code, 404)
+        reports.run_job(job)
+        response = self.client.get(download)
+        self.assertEqual(b''.join(response.streaming_content).splitlines()[0],
+                         b'city,No status,New,Pre-screened,Interviewed,'
+                         b'Offered,Hired,Declined,total')
+
+
+class AccessMatrixTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.view_user = Permission.objects.get(
+            content_type__app_label='accounts', codename='view_user')
+        cls.change_group = Permission.objects.get(
+            content_type__app_label='auth', codename='change_group')
+        cls.staff = Group.objects.create(name='staff')
+        cls.staff.permissions.add(cls.change_group)
+        cls.admins = ModGroup.objects.create(name='admins', is_admin=True)
+        cls.root_group = Group.objects.create(name='superuser')
+        cls.alice, cls.bob, cls.root, cls.admin = [User.objects.create_user(
+            username=name, email='%s@example.com' % (name,),
+            password='password', is_active=True)
+            for name in ('alice', 'bob', 'root', 'admin')]
+        cls.alice.user_permissions.add(cls.view_user)
+        cls.bob.groups.add(cls.staff)
+        cls.root.groups.add(cls.root_group)
+        cls.admin.groups.add(cls.admins)
+
+    def setUp(self):
+        cache.clear()
+
+    def column(self, matrix, label):
+        return matrix.headers.index(label) - 2
+
+    def test_permission_grid(self):
+        matrix = AccessMatrix()
+        page, users, grid = matrix.page()
+        self.assertEqual([name for _, name in users],
+                         ['alice', 'bob', 'root', 'admin'])
+        self.assertEqual(grid.shape, (4, Permission.objects.count()))
+        view_user = self.column(matrix, 'accounts.view_user')
+        change_group = self.column(matrix, 'auth.change_group')
+        self.assertEqual(grid[:, view_user].tolist(),
+                         [True, False, True, False])
+        self.assertEqual(grid[:, change_group].tolist(),
+                         [False, True, True, False])
+        self.assertEqual(grid.sum(axis=1).tolist(),
+                         [1, 1, matrix.width, 0])
+
+    def test_group_grid_and_filters(self):
+        matrix = AccessMatrix('groups', group=self.staff)
+        page, users, grid = matrix.page()
+        self.assertEqual(users, [(self.bob.pk, 'bob')])
+        self.assertEqual(matrix.headers[2:],
+                         ('admins', 'staff', 'superuser'))
+        self.assertEqual(grid.tolist(), [[False, True, False]])
+        matrix = AccessMatrix(app_label='auth')
+        self.assertTrue(all(label.startswith('auth.')
+                            for label in matrix.headers[2:]))
+
+    def test_page_queries_do_not_grow_with_users(self):
+        matrix = AccessMatrix()
+        counts = []
+        for per_page in (2, 4):
+            with CaptureQueriesContext(connection) as queries:
+                matrix.page(per_page=per_page)
+            counts.append(len(queries))
+        self.assertEqual(counts, [3, 3])
+
+    def test_csv(self):
+        rows = list(csv.reader(io.StringIO(b''.join(
+            csv_lines(AccessMatrix('groups'), chunk_size=3)).decode('utf-8'))))
+        self.assertEqual(rows, [
+            ['id', 'username', 'admins', 'staff', 'superuser'],
+            [str(self.alice.pk), 'alice', '0', '0', '0'],
+            [str(self.bob.pk), 'bob', '0', '1', '0'],
+            [str(self.root.pk), 'root', '0', '0', '1'],
+            [str(self.admin.pk), 'admin', '1', '0', '0'],
+        ])
+
+    def test_views_are_for_admins(self):
+        url = reverse('admin_console:access-matrix')
+        csv_url = reverse('admin_console:access-matrix-csv')
+        self.client.force_login(self.bob)
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.assertEqual(self.client.get(csv_url).status_code, 403)
+        self.client.force_login(self.admin)
+        response = self.client.get(url, {'kind': 'groups', 'group': 'staff'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['rows'],
+                         [((self.bob.pk, 'bob'), [False, True, False])])
+        response = self.client.get(csv_url, {'kind': 'groups'})
+        self.assertIn('attachment', response['Content-Disposition'])
+        self.assertEqual(len(b''.join(
+            response.streaming_content).splitlines()), 5)
+
+    def test_invalid_filters_are_rejected(self):
+        url = reverse('admin_console:access-matrix')
+        csv_url = reverse('admin_console:access-matrix-csv')
+        self.client.force_login(self.admin)
+        response = self.client.get(url, {'kind': 'groups', 'group': 'nobody'})
+        self.assertEqual(response.status_code, 400)
+        self.assertTrue(response.context['form'].errors['group'])
+        self.assertNotContains(response, 'alice', status_code=400)
+        response = self.client.get(csv_url, {'kind': 'rows'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('kind', response.json()['errors'])
+
+    def test_permission_is_checked_before_the_matrix_is_built(self):
+        self.client.force_login(self.bob)
+        url = reverse('admin_console:access-matrix')
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get(url).status_code, 403)
+        self.assertFalse(any('auth_permission' in query['sql']
+                             for query in queries.captured_queries))
@@ -8,15 +8,28 @@ urlpatterns = [
     path('accounts/', views.AdminAccountsView.as_view(), name='accounts'),
     path('accounts/groups/', views.GroupListView.as_view(), name='group-list'),
     path('accounts/groups/add/', views.GroupCreateView.as_view(), name='group-add'),
-    path('accounts/groups/<slug:slug>/', views.GroupDetailView.as_view(), name='group-detail'),
-    path('accounts/groups/<slug:slug>/edit/', views.GroupUpdateView.as_view(), name='group-edit'),
+    path('accounts/groups/memberships/', views.group_memberships, name='group-memberships'),
+    path('accounts/groups/<int:pk>/', views.GroupDetailView.as_view(), name='group-detail'),
+    path('accounts/groups/<int:pk>/edit/', views.GroupUpdateView.as_view(), name='group-edit'),
     path('accounts/users/', views.UserListView.as_view(), name='user-list'),
     path('accounts/users/add/', views.UserCreateView.as_view(), name='user-add'),
     path('accounts/users/<int:pk>/', views.UserDetailView.as_view(), name='user-detail'),
     path('accounts/users/<int:pk>/edit/', views.UserUpdateView.as_view(), name='user-edit'),
+    path('accounts/access/', views.AccessMatrixView.as_view(), name='access-matrix'),
+    path('accounts/access.csv', views.access_matrix_csv, name='access-matrix-csv'),
     path('accounts/permissions/', views.GroupListView.as_view(), name='permission-list'),
     path('accounts/permissions/add/', views.GroupListView.as_view(), name='permission-list'),
     path('accounts/permissions/<int:pk>/', views.GroupDetailView.as_view(), name='permission-detail'),
     path('accounts/permissions/<int:pk>/edit/', views.GroupUpdateView.as_view(), name='permission-edit'),
+    path('applications/', views.ApplicationListView.as_view(), name='application-list'),
+    path('applications/duplicates/', views.DuplicateListView.as_view(), name='duplicate-list'),
+    path('applications/duplicates/<int:pk>/review/', views.review_duplicate, name='duplicate-review'),
+    path('exports/<slug:name>.<slug:file_format>', views.export, name='export'),
+    path('reports/', views.ReportListView.as_view(), name='report-list'),
+    path('reports/<slug:name>/run/', views.run_report, name='report-run'),
+    path('reports/jobs/<int:pk>/', views.ReportJobView.as_view(), name='report-job'),
+    path('reports/jobs/<int:pk>/download/', views.report_download, name='report-download'),
+    path('geo/', views.geo_children, name='geo-roots'),
+    path('geo/<slug:level>/<int:pk>/', views.geo_children, name='geo-children'),
     # path('success', ApplicationSuccessView.as_view(), name='success'),
 ]
@@ -1,5 +1,17 @@
+import tempfile
+
+from django.contrib import messages
+from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib.auth.models import Group
-from django.http import HttpResponseRedirect
+from django.core.exceptions import PermissionDenied, ValidationError
+from django.http import (
+    FileResponse,
+    Http404,
+    HttpResponseRedirect,
+    JsonResponse,
+    StreamingHttpResponse,
+)
+from django.shortcuts import get_object_or_404
 from django.views.generic import (
     DetailView,
     UpdateView,
@@ -9,9 +21,38 @@ from django.views.generic import (
 )
 from django.urls import reverse_lazy
 from django.utils import timezone
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import (
+    condition,
+    require_POST,
+    require_safe,
+)
 
-from accounts.models import User, Profile
-from admin_console.forms import AdminUserCreationForm, GroupForm
+from accounts.memberships import change_memberships
+from accounts.models import ModGroup, User, Profile
+from accounts.object_permissions import ObjectPermissionsMixin
+from admin_console import geo
+from admin_console.access_matrix import PERMISSIONS, AccessMatrix
+from admin_console.exports import (
+    CONTENT_TYPES,
+    EXPORTS,
+    ApplicationExport,
+    csv_lines,
+    write_xlsx,
+)
+from admin_console.dedupe import DuplicateReview
+from admin_console.distance import rank_by_distance
+from admin_console.forms import (
+    AccessMatrixForm,
+    AdminUserCreationForm,
+    ApplicationDistanceForm,
+    GroupForm,
+    GroupMembershipForm,
+)
+from admin_console.models import PossibleDuplicate, ReportJob
+from admin_console.reports import REPORTS, request_report
+from applications.models import Application
+from common.db import ReplicaReadMixin
 
 EIGHTEEN_YEARS_AGO = (timezone.now() - timezone.timedelta(days=((365*18)+5))
                       ).strftime('%m/%d/%Y')
@@ -25,9 +66,12 @@ class AdminHomeView(TemplateView):
 class AdminAccountsView(TemplateView):
     template_name = 'admin_console/accounts.html'
 
-class GroupListView(ListView):
-    model = Group
+class GroupListView(ReplicaReadMixin, ObjectPermissionsMixin, ListView):
+    queryset = ModGroup.objects.prefetch_related('permissions').order_by(
+        'name')
+    context_object_name = 'modgroup_list'
     template_name = 'admin_console/modgroup_list.html'
+    paginate_by = 50
 
 
 class GroupCreateView(CreateView):
@@ -37,7 +81,7 @@ class GroupCreateView(CreateView):
     fields = ('name', 'permissions', )
 
 
-class GroupDetailView(DetailView):
+class GroupDetailView(ReplicaReadMixin, DetailView):
     model = Group
     template_name = 'admin_console/modgroup_detail.html'
 
@@ -55,9 +99,92 @@ class GroupUpdateView(UpdateView):
 
 
 
-class UserListView(ListView):
-    model = Profile
+@require_POST
+def group_memberships(request):
+    """
+    Puts many users in some groups and takes them out of others at once
+    (see accounts.memberships), for users who may change groups:
+        {"users": 2000, "added": 1990, "removed": 2000}
+    Invalid requests answer 400 with the form errors.
+    """
+    if not request.user.has_perm('auth.change_group'):
+        raise PermissionDenied
+    form = GroupMembershipForm(request.POST)
+    if not form.is_valid():
+        return JsonResponse({'errors': form.errors}, status=400)
+    report = change_memberships(form.cleaned_data['user_pks'],
+                                add=form.cleaned_data['add'],
+                                remove=form.cleaned_data['remove'])
+    return JsonResponse({'users': len(form.cleaned_data['user_pks']),
+                         'added': report.added, 'removed': report.removed})
+
+
+class UserListView(ReplicaReadMixin, ObjectPermissionsMixin, ListView):
+    queryset = Profile.objects.select_related('user').order_by('pk')
+    context_object_name = 'profile_list'
     template_name = 'admin_console/user_list.html'
+    paginate_by = 50
+
+
+def access_matrix(request):
+    """(form, AccessMatrix) of the filters in the query string, the
+    matrix None when the form is invalid; raises PermissionDenied for
+    non-admins."""
+    if not AccessMatrix.allowed(request.user):
+        raise PermissionDenied
+    form = AccessMatrixForm(request.GET)
+    if not form.is_valid():
+        return form, None
+    data = form.cleaned_data
+    matrix = AccessMatrix(data['kind'] or PERMISSIONS, group=data['group'],
+                          app_label=data['app_label'])
+    return form, matrix
+
+
+class AccessMatrixView(ReplicaReadMixin, TemplateView):
+    """
+    Users by permissions or by groups, a page of users at a time, for
+    access reviews (?kind=groups&group=<name>&app_label=<label>).
+    """
+    template_name = 'admin_console/access_matrix.html'
+
+    def get(self, request, *args, **kwargs):
+        form, matrix = access_matrix(request)
+        context = self.get_context_data(form=form, matrix=matrix)
+        return self.render_to_response(
+            context, status=400 if matrix is None else 200)
+
+    def get_context_data(self, *args, **kwargs):
+        context = super(AccessMatrixView, self
+            ).get_context_data(*args, **kwargs)
+        matrix = context['matrix']
+        if matrix is None:
+            return context
+        page, users, grid = matrix.page(self.request.GET.get('page'))
+        query = self.request.GET.copy()
+        query.pop('page', None)
+        context.update({
+            'rows': list(zip(users, grid.tolist())),
+            'page_obj': page,
+            'paginator': page.paginator,
+            'is_paginated': page.has_other_pages(),
+            'query': query.urlencode(),
+        })
+        return context
+
+
+@require_safe
+def access_matrix_csv(request):
+    """The whole access matrix as CSV, streamed a chunk of users at a
+    time. Invalid filters answer 400 with the form errors."""
+    form, matrix = access_matrix(request)
+    if matrix is None:
+        return JsonResponse({'errors': form.errors}, status=400)
+    response = StreamingHttpResponse(csv_lines(matrix),
+                                     content_type=CONTENT_TYPES['csv'])
+    response['Content-Disposition'] = 'attachment; filename="%s-%s-%s.csv"' % (
+        matrix.name, matrix.kind, timezone.now().strftime('%Y%m%d'))
+    return response
 
 
 class UserCreateView(CreateView):
@@ -90,7 +217,7 @@ class UserCreateView(CreateView):
 
 
 
-class UserDetailView(DetailView):
+class UserDetailView(ReplicaReadMixin, DetailView):
     model = Profile
     template_name = 'admin_console/user_detail.html'
 
@@ -113,8 +240,220 @@ class UserUpdateView(UpdateView):
     success_url = reverse_lazy('admin_console:user-detail')
 
     def get_success_url(self, *args, **kwargs):
-        obj = self.get_object()
-        print('\n\n\n -=-=-=-=-=-=-=-=--==-\n pk {}\n\n\n\n\n -=-=-=-=='.format(obj.pk))
-        return HttpResponseRedirect(
-            reverse_lazy('admin_console:user-detail', kwargs={'pk': obj.pk}))
+        # The session is pinned to the primary after this write, so the
+        # detail page shows the update even if replicas lag behind.
+        return reverse_lazy('admin_console:user-detail',
+                            kwargs={'pk': self.object.pk})
+
+
+class RankedApplications:
+    """
+    Applications in the order of a distance ranking, loading only the
+    slices that are asked for (a page), each with a distance_km.
+    """
+    def __init__(self, queryset, pks, km):
+        self.queryset = queryset
+        self.pks = pks
+        self.km = km
+
+    def __len__(self):
+        return len(self.pks)
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+        pks = [int(pk) for pk in self.pks[index]]
+        objects = self.queryset.in_bulk(pks)
+        page = []
+        for pk, km in zip(pks, self.km[index]):
+            application = objects[pk]
+            application.distance_km = float(km)
+            page.append(application)
+        return page
+
+
+class ApplicationListView(LoginRequiredMixin, ReplicaReadMixin, ListView):
+    """
+    Applications, newest first, or nearest first to the call center
+    picked in the filter form (?near=<pk>&within=<km>). For those who
+    may export applications.
+    """
+    model = Application
+    template_name = 'admin_console/application_list.html'
+    context_object_name = 'application_list'
+    paginate_by = 50
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.user.is_authenticated and not ApplicationExport.allowed(
+                request.user):
+            raise PermissionDenied
+        return super(ApplicationListView, self).dispatch(
+            request, *args, **kwargs)
+
+    def get_queryset(self):
+        queryset = Application.objects.select_related(
+            'city_or_town').order_by('-applied_at')
+        self.form = ApplicationDistanceForm(self.request.GET or None)
+        if not self.form.is_valid() or not self.form.cleaned_data['near']:
+            return queryset
+        pks, km = rank_by_distance(queryset,
+                                   self.form.cleaned_data['near'],
+                                   within=self.form.cleaned_data['within'])
+        return RankedApplications(queryset, pks, km)
+
+    def get_context_data(self, *args, **kwargs):
+        context = super(ApplicationListView, self
+            ).get_context_data(*args, **kwargs)
+        context['form'] = self.form
+        return context
+
+
+class DuplicateListView(ReplicaReadMixin, ListView):
+    """Review queue of the dedupe job, most likely duplicates first."""
+    template_name = 'admin_console/duplicate_list.html'
+    paginate_by = 50
+
+    def dispatch(self, request, *args, **kwargs):
+        if not DuplicateReview().allowed(request.user):
+            raise PermissionDenied
+        return super(DuplicateListView, self).dispatch(
+            request, *args, **kwargs)
+
+    def get_queryset(self):
+        return PossibleDuplicate.objects.filter(
+            status=PossibleDuplicate.PENDING,
+        ).select_related('older', 'newer').order_by('-score', 'pk')
+
+
+@require_POST
+def review_duplicate(request, pk):
+    if not DuplicateReview().allowed(request.user):
+        raise PermissionDenied
+    duplicate = get_object_or_404(PossibleDuplicate, pk=pk)
+    try:
+        status = int(request.POST.get('status'))
+    except (TypeError, ValueError):
+        status = None
+    if status in (PossibleDuplicate.SAME_PERSON, PossibleDuplicate.DIFFERENT):
+        duplicate.status = status
+        duplicate.reviewed_at = timezone.now()
+        duplicate.reviewed_by = request.user
+        duplicate.save()
+    return HttpResponseRedirect(reverse_lazy('admin_console:duplicate-list'))
+
+
+@require_safe
+def export(request, name, file_format):
+    """
+    Downloads an export (see admin_console.exports) as CSV, streamed as
+    it is read, or XLSX, streamed once written to a temporary file.
+    """
+    if name not in EXPORTS or file_format not in CONTENT_TYPES:
+        raise Http404
+    exporter = EXPORTS[name]()
+    if not exporter.allowed(request.user):
+        raise PermissionDenied
+    if file_format == 'csv':
+        response = StreamingHttpResponse(csv_lines(exporter),
+                                         content_type=CONTENT_TYPES['csv'])
+    else:
+        output = tempfile.TemporaryFile()
+        write_xlsx(exporter, output)
+        output.seek(0)
+        response = FileResponse(output, content_type=CONTENT_TYPES['xlsx'])
+    response['Content-Disposition'] = 'attachment; filename="%s-%s.%s"' % (
+        name, timezone.now().strftime('%Y%m%d'), file_format)
+    return response
+
+
+class ReportListView(ListView):
+    """The reports one can run, and one's latest report jobs."""
+    template_name = 'admin_console/report_list.html'
+    context_object_name = 'job_list'
+
+    def get_queryset(self):
+        if not self.request.user.is_authenticated:
+            return ReportJob.objects.none()
+        return ReportJob.objects.filter(
+            requested_by=self.request.user).order_by('-created_at')[:20]
+
+    def get_context_data(self, *args, **kwargs):
+        context = super(ReportListView, self).get_context_data(*args, **kwargs)
+        context['reports'] = [report() for report in REPORTS.values()
+                              if report().allowed(self.request.user)]
+        return context
+
 
+@require_POST
+def run_report(request, name):
+    """Queues report `name`, or finds the identical job already queued,
+    running or done, and shows it."""
+    if name not in REPORTS:
+        raise Http404
+    if not REPORTS[name]().allowed(request.user):
+        raise PermissionDenied
+    try:
+        job, _ = request_report(name, request.POST, request.user)
+    except ValidationError as error:
+        messages.error(request, ' '.join(error.messages))
+        return HttpResponseRedirect(reverse_lazy('admin_console:report-list'))
+    return HttpResponseRedirect(reverse_lazy('admin_console:report-job',
+                                             args=(job.pk,)))
+
+
+class ReportJobView(DetailView):
+    """Progress of a report job, live over a websocket."""
+    model = ReportJob
+    template_name = 'admin_console/report_job.html'
+    context_object_name = 'job'
+
+    def get_object(self, queryset=None):
+        job = super(ReportJobView, self).get_object(queryset)
+        if not REPORTS[job.report]().allowed(self.request.user):
+            raise PermissionDenied
+        return job
+
+
+@require_safe
+def report_download(request, pk):
+    job = get_object_or_404(ReportJob, pk=pk, status=ReportJob.DONE,
+                            expires_at__gt=timezone.now())
+    if not REPORTS[job.report]().allowed(request.user):
+        raise PermissionDenied
+    response = FileResponse(job.artifact.open('rb'),
+                            content_type=CONTENT_TYPES['csv'])
+    response['Content-Disposition'] = 'attachment; filename="%s"' % (
+        job.artifact.name.rsplit('/', 1)[-1],)
+    return response
+
+
+def _geo_etag(request, *args, **kwargs):
+    return geo.current_version()[0]
+
+
+def _geo_last_modified(request, *args, **kwargs):
+    return geo.current_version()[1]
+
+
+@require_safe
+@condition(etag_func=_geo_etag, last_modified_func=_geo_last_modified)
+def geo_children(request, level=None, pk=None):
+    """
+    Children of a node of the geographic tree for cascading dropdowns,
+    the countries when no node is given. Unchanged trees answer 304:
+        {"level": "city", "children": [{"id": 1, "name": "..."}, ...]}
+    """
+    tree = geo.get_tree()
+    if level is not None and (level not in geo.LEVELS or
+                              (level, pk) not in tree):
+        raise Http404
+    children_level = geo.child_level(level)
+    if children_level is None:
+        raise Http404
+    response = JsonResponse({
+        'level': children_level,
+        'children': [{'id': child_pk, 'name': name}
+                     for child_pk, name in tree.children(level, pk)],
+    })
+    patch_cache_control(response, no_cache=True)
+    return response
@@ -2,7 +2,7 @@ from django.contrib import admin
 
 from applications.models import (
     CallCenter, Language, Career, Institution, AreaOfExpertise, Application,
-    CityTown)
+    CityTown, Requisition, StatusTransition)
 
 
 admin.site.register(CallCenter)
@@ -13,5 +13,7 @@ admin.site.register(Institution)
 admin.site.register(AreaOfExpertise)
 admin.site.register(CityTown)
 admin.site.register(Application)
+admin.site.register(Requisition)
+admin.site.register(StatusTransition)
 # Register your models here.
 
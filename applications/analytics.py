@@ -0,0 +1,335 @@
+"""
+Columnar snapshot of the application funnel, for cohort analysis.
+
+take_snapshot() (nightly, see applications.tasks) reads every
+application, live or archived (see applications.archive), in pk chunks
+and writes one .npy file per column into a
+new directory under settings.ANALYTICS_SNAPSHOT_DIR, then points the
+`current` symlink at it, so readers never see a half-written snapshot:
+
+    pk, applied_at, status_changed_at   int64 (unix seconds, 0 unset)
+    city_or_town, current_status,       int32 lookup ids (0 unset); the
+    gender                              names are in meta.json
+    hire_iq                             float32, NaN when unknown
+    pre_screen, tss, hm_interview,      booleans
+    previous_call_center_xp,
+    lived_in_usa
+    languages, areas_of_expertise,      bitsets of lookup ids in uint64
+    previous_call_center                words (bit b of word w is id 64w+b)
+
+Snapshot.load() memory-maps the current snapshot; conversion() and
+counts() answer cohort questions with whole-array operations:
+
+e.g.:
+    snapshot = Snapshot.load()
+    snapshot.conversion('week', 'pre_screen', 'hm_interview',
+                        where=snapshot.has('languages', english.pk))
+"""
+import json
+import os
+import shutil
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+import numpy as np
+from django.conf import settings
+from django.utils import timezone
+
+from admin_console.models import (
+    ApplicationStatus,
+    AreaOfExpertise,
+    CallCenter,
+    CityTown,
+    Language,
+)
+from applications.archive import MULTI_VALUED, split_ids
+from applications.models import Application, ArchivedApplication
+
+CHUNK_SIZE = 50000
+# How many snapshot directories to keep, the current one included.
+KEEP = 2
+
+TIMES = ('applied_at', 'status_changed_at')
+CODES = OrderedDict((
+    ('city_or_town', CityTown),
+    ('current_status', ApplicationStatus),
+    ('gender', None),
+))
+FLAGS = ('pre_screen', 'tss', 'hm_interview', 'previous_call_center_xp',
+         'lived_in_usa')
+MULTI_HOT = OrderedDict((
+    ('languages', Language),
+    ('areas_of_expertise', AreaOfExpertise),
+    ('previous_call_center', CallCenter),
+))
+FIELDS = ('pk',) + TIMES + tuple(
+    '%s_id' % (name,) if model else name for name, model in CODES.items()
+) + ('hire_iq',) + FLAGS
+ARCHIVED_FIELDS = FIELDS + tuple(
+    dict(MULTI_VALUED)[name] for name in MULTI_HOT)
+# Stages conversion() understands: 'applied' and the flags.
+STAGES = ('applied',) + FLAGS
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+DAY = 86400
+
+
+def _seconds(values):
+    return np.array([int((value - EPOCH).total_seconds()) if value else 0
+                     for value in values], np.int64)
+
+
+def _through(name):
+    field = Application._meta.get_field(name)
+    return (field.remote_field.through, field.m2m_field_name(),
+            field.m2m_reverse_field_name())
+
+
+def _chunk_columns(rows):
+    """{column: array} for one chunk of values_list(*FIELDS) rows."""
+    values = dict(zip(FIELDS, zip(*rows) if rows else [()] * len(FIELDS)))
+    columns = {'pk': np.array(values['pk'], np.int64)}
+    for field in TIMES:
+        columns[field] = _seconds(values[field])
+    for name, model in CODES.items():
+        columns[name] = np.array([
+            value or 0 for value in values['%s_id' % (name,) if model else name]
+        ], np.int32)
+    columns['hire_iq'] = np.array([np.nan if value is None else value
+                                   for value in values['hire_iq']], np.float32)
+    for field in FLAGS:
+        columns[field] = np.array(values[field], np.bool_)
+    return columns
+
+
+def _encode(pks, pairs):
+    """Bitsets, one row per pk, from [[application pk, lookup id]]."""
+    words = int(pairs[:, 1].max()) // 64 + 1 if len(pairs) else 1
+    bits = np.zeros((len(pks), words), np.uint64)
+    rows = np.searchsorted(pks, pairs[:, 0])
+    # Skips applications created after their chunk was read.
+    known = rows < len(pks)
+    known[known] = pks[rows[known]] == pairs[known, 0]
+    ids = pairs[known, 1]
+    np.bitwise_or.at(bits, (rows[known], ids // 64), np.left_shift(
+        np.uint64(1), (ids % 64).astype(np.uint64)))
+    return bits
+
+
+def _live_columns(rows):
+    """_chunk_columns() and the bitsets, one query per many-to-many
+    table."""
+    columns = _chunk_columns(rows)
+    first, last = rows[0][0], rows[-1][0]
+    for name in MULTI_HOT:
+        through, source, target = _through(name)
+        pairs = np.array(list(through.objects.filter(**{
+            '%s__gte' % (source,): first, '%s__lte' % (source,): last,
+        }).values_list('%s_id' % (source,), '%s_id' % (target,))),
+            np.int64).reshape(-1, 2)
+        columns[name] = _encode(columns['pk'], pairs)
+    return columns
+
+
+def _archived_columns(rows):
+    """_chunk_columns() and the bitsets of rows of ArchivedApplication,
+    whose many-to-many ids follow FIELDS (see ARCHIVED_FIELDS)."""
+    columns = _chunk_columns([row[:len(FIELDS)] for row in rows])
+    for offset, name in enumerate(MULTI_HOT, len(FIELDS)):
+        pairs = np.array([(row[0], pk) for row in rows
+                          for pk in split_ids(row[offset])],
+                         np.int64).reshape(-1, 2)
+        columns[name] = _encode(columns['pk'], pairs)
+    return columns
+
+
+def _read_chunks(queryset, convert, chunk_size):
+    last = 0
+    while True:
+        rows = list(queryset.filter(pk__gt=last)[:chunk_size])
+        if not rows:
+            return
+        last = rows[-1][0]
+        yield convert(rows)
+
+
+def read_columns(chunk_size=CHUNK_SIZE):
+    """Reads the funnel into {column: array}, sorted by pk, converting
+    each chunk to arrays as it comes; one query per chunk of archived
+    applications, and per chunk of live ones plus one per many-to-many
+    table."""
+    chunks = list(_read_chunks(
+        Application.objects.order_by('pk').values_list(*FIELDS),
+        _live_columns, chunk_size))
+    chunks.extend(_read_chunks(
+        ArchivedApplication.objects.order_by('pk').values_list(
+            *ARCHIVED_FIELDS), _archived_columns, chunk_size))
+    if not chunks:
+        chunks.append(_chunk_columns([]))
+        for name in MULTI_HOT:
+            chunks[0][name] = np.zeros((0, 1), np.uint64)
+    columns = {}
+    for name in chunks[0]:
+        if name in MULTI_HOT:
+            words = max(chunk[name].shape[1] for chunk in chunks)
+            columns[name] = np.concatenate([np.pad(
+                chunk[name], ((0, 0), (0, words - chunk[name].shape[1])),
+                'constant') for chunk in chunks])
+        else:
+            columns[name] = np.concatenate([chunk[name] for chunk in chunks])
+    # An application archived while it was read shows up twice.
+    _, order = np.unique(columns['pk'], return_index=True)
+    return {name: values[order] for name, values in columns.items()}
+
+
+def lookup_names():
+    names = {name: {str(pk): label for pk, label in
+                    model.objects.values_list('pk', 'name')}
+             for name, model in list(CODES.items()) + list(MULTI_HOT.items())
+             if model}
+    names['gender'] = {str(value): str(label)
+                       for value, label in Application.GENDER_CHOICES}
+    return names
+
+
+def take_snapshot(directory=None, chunk_size=CHUNK_SIZE):
+    """Writes a new snapshot and makes it current; returns its path."""
+    directory = directory or settings.ANALYTICS_SNAPSHOT_DIR
+    os.makedirs(directory, exist_ok=True)
+    taken_at = timezone.now()
+    path = os.path.join(directory, taken_at.strftime('%Y%m%dT%H%M%S%f'))
+    os.makedirs(path)
+    columns = read_columns(chunk_size)
+    for name, values in columns.items():
+        np.save(os.path.join(path, '%s.npy' % (name,)), values)
+    with open(os.path.join(path, 'meta.json'), 'w') as meta:
+        json.dump({'taken_at': taken_at.isoformat(), 'rows': len(columns['pk']),
+                   'names': lookup_names()}, meta)
+    link = os.path.join(directory, 'current')
+    os.symlink(os.path.basename(path), link + '.new')
+    os.replace(link + '.new', link)
+    snapshots = sorted(entry for entry in os.listdir(directory)
+                       if entry not in ('current', 'current.new'))
+    for old in snapshots[:-KEEP]:
+        shutil.rmtree(os.path.join(directory, old), ignore_errors=True)
+    return path
+
+
+class Snapshot:
+    """A loaded (memory-mapped) funnel snapshot."""
+
+    def __init__(self, columns, meta):
+        self.columns = columns
+        self.meta = meta
+        self.names = meta['names']
+
+    @classmethod
+    def load(cls, directory=None):
+        """The current snapshot; raises FileNotFoundError when none was
+        taken yet."""
+        path = os.path.join(directory or settings.ANALYTICS_SNAPSHOT_DIR,
+                            'current')
+        path = os.path.realpath(path)
+        with open(os.path.join(path, 'meta.json')) as meta:
+            meta = json.load(meta)
+        columns = {entry[:-4]: np.load(os.path.join(path, entry),
+                                       mmap_mode='r')
+                   for entry in os.listdir(path) if entry.endswith('.npy')}
+        return cls(columns, meta)
+
+    def __len__(self):
+        return len(self.columns['pk'])
+
+    def __getitem__(self, column):
+        return self.columns[column]
+
+    def has(self, name, pk):
+        """Boolean array: which applications have lookup `pk` in the
+        many-to-many column `name`."""
+        bits = self.columns[name]
+        word, bit = divmod(pk, 64)
+        if word >= bits.shape[1]:
+            return np.zeros(len(self), np.bool_)
+        return (bits[:, word] >> np.uint64(bit)) & np.uint64(1) == 1
+
+    def stage(self, stage):
+        if stage == 'applied':
+            return np.ones(len(self), np.bool_)
+        if stage not in FLAGS:
+            raise ValueError('Unknown stage %r, expected one of %s.' % (
+                stage, ', '.join(STAGES)))
+        return np.asarray(self.columns[stage])
+
+    def applied_between(self, since=None, until=None):
+        """Boolean array for applied_at in [since, until)."""
+        applied = np.asarray(self.columns['applied_at'])
+        where = np.ones(len(self), np.bool_)
+        if since is not None:
+            where &= applied >= int((since - EPOCH).total_seconds())
+        if until is not None:
+            where &= applied < int((until - EPOCH).total_seconds())
+        return where
+
+    def cohorts(self, by):
+        """
+        Returns (labels, cohort) for grouping by `by`: 'week' or 'month'
+        (of applied_at), a code column or a flag give a cohort index per
+        application; a many-to-many column, where applications can be in
+        several cohorts, gives a list of boolean masks instead.
+        """
+        if by in MULTI_HOT:
+            names = self.names[by]
+            pks = sorted(int(pk) for pk in names)
+            return ([names[str(pk)] for pk in pks],
+                    [self.has(by, pk) for pk in pks])
+        if by == 'week':
+            # 1970-01-01 was a Thursday; weeks start on Monday.
+            keys, index = np.unique(
+                (np.asarray(self.columns['applied_at']) // DAY + 3) // 7,
+                return_inverse=True)
+            labels = [(EPOCH + timedelta(days=key * 7 - 3)).date()
+                      for key in keys.tolist()]
+        elif by == 'month':
+            keys, index = np.unique(
+                (np.asarray(self.columns['applied_at']) // DAY).astype(
+                    'datetime64[D]').astype('datetime64[M]'),
+                return_inverse=True)
+            labels = keys.astype('datetime64[D]').tolist()
+        elif by in CODES:
+            keys, index = np.unique(self.columns[by], return_inverse=True)
+            names = self.names[by]
+            labels = [names.get(str(key), '') for key in keys.tolist()]
+        elif by in FLAGS:
+            keys, index = np.unique(self.columns[by], return_inverse=True)
+            labels = keys.tolist()
+        else:
+            raise ValueError('Cannot group by %r.' % (by,))
+        return labels, index
+
+    def _count(self, labels, cohort, where):
+        if isinstance(cohort, list):
+            return [int((mask & where).sum()) for mask in cohort]
+        return np.bincount(cohort[where], minlength=len(labels)).tolist()
+
+    def counts(self, by, where=None):
+        """OrderedDict {cohort: applications}."""
+        if where is None:
+            where = np.ones(len(self), np.bool_)
+        labels, cohort = self.cohorts(by)
+        return OrderedDict(zip(labels, self._count(labels, cohort, where)))
+
+    def conversion(self, by, from_stage='applied', to_stage='hm_interview',
+                   where=None):
+        """
+        OrderedDict {cohort: (reached from_stage, also reached to_stage,
+        rate)}; rate is None for empty cohorts.
+        """
+        entered = self.stage(from_stage)
+        if where is not None:
+            entered = entered & where
+        converted = entered & self.stage(to_stage)
+        labels, cohort = self.cohorts(by)
+        return OrderedDict(
+            (label, (total, reached, reached / total if total else None))
+            for label, total, reached in zip(
+                labels, self._count(labels, cohort, entered),
+                self._count(labels, cohort, converted)))
@@ -1,5 +1,12 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class ApplicationsConfig(AppConfig):
     name = 'applications'
+
+    def ready(self):
+        import applications.signals
+        post_migrate.connect(applications.signals.create_archive_tables,
+                             sender=self)
+        super(ApplicationsConfig, self).ready()
@@ -0,0 +1,213 @@
+"""
+Archival of closed applications.
+
+Applications in a closed status (see ApplicationStatus.is_closed)
+applied for longer ago than settings.ARCHIVE_APPLICATIONS_AFTER_DAYS are
+moved, in chunks of one transaction each, from the live table to
+ArchivedApplication, and their status transitions to
+ArchivedStatusTransition, so the funnel and time-to-hire history
+survives. Duplicate review entries go with the live row: the dedupe job
+only compares live applications.
+
+On PostgreSQL the archive tables are partitioned by month, applications
+by applied_at and transitions by changed_at, a partition being created
+the first time a month is archived, so reports over a date range only
+touch the months they need. The live tables stay plain tables: they are
+the target of foreign keys (status transitions, duplicate reviews,
+many-to-many tables), which PostgreSQL does not allow on partitioned
+tables before version 12; archiving is what keeps them small. Elsewhere
+(SQLite) the archive tables are plain tables.
+
+Reports that need every application, or every transition, read both
+tables in one UNION ALL query:
+    all_applications('applied_at', 'current_status',
+                     applied_at__year=2017).order_by('applied_at')
+    all_transitions('changed_at', application__city_or_town=city)
+"""
+from collections import defaultdict
+from datetime import datetime
+
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.db.models import BooleanField, Value
+from django.utils import timezone
+
+from applications.models import (
+    Application,
+    ArchivedApplication,
+    ArchivedStatusTransition,
+    StatusTransition,
+)
+
+# Many-to-many field of Application: ArchivedApplication column.
+MULTI_VALUED = (
+    ('languages', 'language_ids'),
+    ('previous_call_center', 'previous_call_center_ids'),
+    ('areas_of_expertise', 'area_of_expertise_ids'),
+)
+COPIED = tuple(
+    field.attname for field in ArchivedApplication._meta.concrete_fields
+    if field.name not in dict(MULTI_VALUED).values() and
+    field.name != 'archived_at'
+)
+TRANSITION_COPIED = tuple(
+    field.attname for field in ArchivedStatusTransition._meta.concrete_fields)
+# Archive model: the column it is partitioned by on PostgreSQL.
+PARTITION_KEYS = (
+    (ArchivedApplication, 'applied_at'),
+    (ArchivedStatusTransition, 'changed_at'),
+)
+
+
+def create_archive_tables(using='default'):
+    """Creates the archive tables that are missing; returns how many it
+    created. Run after every migrate (see applications.apps)."""
+    connection = connections[using]
+    tables = connection.introspection.table_names()
+    created = 0
+    for model, partition_key in PARTITION_KEYS:
+        if model._meta.db_table not in tables:
+            _create_table(connection, model, partition_key)
+            created += 1
+    return created
+
+
+def _create_table(connection, model, partition_key):
+    with connection.schema_editor() as editor:
+        if connection.vendor == 'postgresql':
+            columns, params = [], []
+            for field in model._meta.local_concrete_fields:
+                if field.primary_key:
+                    # The primary key must include the partition key.
+                    definition = '%s NOT NULL' % (field.db_type(connection),)
+                else:
+                    definition, field_params = editor.column_sql(model, field)
+                    params.extend(field_params)
+                columns.append('%s %s' % (editor.quote_name(field.column),
+                                          definition))
+            editor.execute(
+                'CREATE TABLE %s (%s, PRIMARY KEY (id, %s)) '
+                'PARTITION BY RANGE (%s)' % (
+                    editor.quote_name(model._meta.db_table),
+                    ', '.join(columns), editor.quote_name(partition_key),
+                    editor.quote_name(partition_key)), params or None)
+        else:
+            editor.create_model(model)
+        for index in model._meta.indexes:
+            editor.add_index(model, index)
+
+
+def month_start(moment):
+    return datetime(moment.year, moment.month, 1, tzinfo=timezone.utc)
+
+
+def next_month(start):
+    if start.month == 12:
+        return start.replace(year=start.year + 1, month=1)
+    return start.replace(month=start.month + 1)
+
+
+def ensure_partitions(moments, using='default', model=ArchivedApplication):
+    """Creates the monthly partitions of `model`'s archive table covering
+    `moments`. Does nothing except on PostgreSQL."""
+    connection = connections[using]
+    if connection.vendor != 'postgresql':
+        return
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        for start in sorted(set(month_start(moment) for moment in moments)):
+            cursor.execute(
+                'CREATE TABLE IF NOT EXISTS %s PARTITION OF %s '
+                'FOR VALUES FROM (%%s) TO (%%s)' % (
+                    connection.ops.quote_name('%s_y%04dm%02d' % (
+                        table, start.year, start.month)),
+                    connection.ops.quote_name(table)),
+                [start, next_month(start)])
+
+
+def archivable(days=None):
+    """Closed applications older than `days`, by default
+    settings.ARCHIVE_APPLICATIONS_AFTER_DAYS."""
+    if days is None:
+        days = settings.ARCHIVE_APPLICATIONS_AFTER_DAYS
+    return Application.objects.filter(
+        current_status__is_closed=True,
+        applied_at__lt=timezone.now() - timezone.timedelta(days=days))
+
+
+def archive_chunk(pks):
+    """Moves the applications in `pks` and their status transitions to
+    the archive; returns how many applications moved. Run inside a
+    transaction."""
+    rows = list(Application.objects.filter(pk__in=pks).select_for_update()
+                .order_by('pk').values(*COPIED))
+    pks = [row['id'] for row in rows]
+    ids = defaultdict(dict)
+    for name, column in MULTI_VALUED:
+        field = Application._meta.get_field(name)
+        pairs = field.remote_field.through.objects.filter(**{
+            '%s__in' % (field.m2m_field_name(),): pks,
+        }).order_by('pk').values_list(
+            '%s_id' % (field.m2m_field_name(),),
+            '%s_id' % (field.m2m_reverse_field_name(),))
+        for application, lookup in pairs:
+            ids[application].setdefault(column, []).append(str(lookup))
+    archived = [ArchivedApplication(**dict(row, **{
+        column: ','.join(values)
+        for column, values in ids[row['id']].items()
+    })) for row in rows]
+    transitions = [ArchivedStatusTransition(**row) for row in
+                   StatusTransition.objects.filter(application_id__in=pks)
+                   .order_by('pk').values(*TRANSITION_COPIED)]
+    using = router.db_for_write(ArchivedApplication)
+    ensure_partitions([row['applied_at'] for row in rows], using=using)
+    ensure_partitions([row.changed_at for row in transitions], using=using,
+                      model=ArchivedStatusTransition)
+    ArchivedApplication.objects.bulk_create(archived)
+    ArchivedStatusTransition.objects.bulk_create(transitions)
+    # Cascades to the live transitions, now copied.
+    Application.objects.filter(pk__in=pks).delete()
+    return len(archived)
+
+
+def archive_closed(days=None, chunk_size=1000, progress=None):
+    """Archives every archivable application; returns how many."""
+    queryset = archivable(days).order_by('pk').values_list('pk', flat=True)
+    archived, last = 0, 0
+    while True:
+        pks = list(queryset.filter(pk__gt=last)[:chunk_size])
+        if not pks:
+            return archived
+        with transaction.atomic():
+            archived += archive_chunk(pks)
+        last = pks[-1]
+        if progress:
+            progress(archived)
+
+
+def _union(live, archived, fields, filters):
+    def values(model, is_archived):
+        return model._default_manager.filter(**filters).order_by().annotate(
+            archived=Value(is_archived, BooleanField())).values(
+                *(fields + ('archived',)))
+    return values(live, False).union(values(archived, True), all=True)
+
+
+def all_applications(*fields, **filters):
+    """
+    values(*fields) of the live and the archived applications matching
+    `filters`, as one UNION ALL queryset; every row also has `archived`.
+    Fields and filters must exist on both models, so no many-to-many.
+    """
+    return _union(Application, ArchivedApplication, fields, filters)
+
+
+def all_transitions(*fields, **filters):
+    """all_applications() for the status transitions; `application__`
+    lookups reach the live or the archived application."""
+    return _union(StatusTransition, ArchivedStatusTransition, fields, filters)
+
+
+def split_ids(value):
+    """The ids of an archived many-to-many column."""
+    return [int(pk) for pk in value.split(',') if pk]
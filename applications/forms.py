@@ -6,23 +6,32 @@ from django.forms import widgets, formset_factory, inlineformset_factory
 
 from django.utils.translation import gettext_lazy as _
 
-from applications.models import Application, CallCenter, CityTown, Language, AreaOfExpertise
+from admin_console.forms import GeoChoiceField, GeoFormMixin
+from admin_console.models import CallCenter, Language, AreaOfExpertise
+from applications.models import Application
 
 REQUIRED_ERROR = 'This field cannot be blank.'
 EIGHTEEN_YEARS_AGO = (timezone.now() - timezone.timedelta(days=((365*18)+5))
                       ).strftime('%m/%d/%Y')
 
-class ApplicationForm(forms.ModelForm):
+class ApplicationForm(GeoFormMixin, forms.ModelForm):
     prefix = 'application'
     email = forms.EmailField(validators=[validators.validate_email],
                 widget=forms.EmailInput(attrs={
                     'placeholder': 'john.doe@company.com',
                     'class': 'form-control',
                 },))
+    # Cascading dropdowns, filled from the geo endpoint.
+    country = GeoChoiceField('country', label=_('Country'), required=False)
+    region = GeoChoiceField('region', parent='country',
+                            label=_('State, province or region'),
+                            required=False)
+    city_or_town = GeoChoiceField('city', parent='region',
+                                  label=_('City or town'), required=False)
+
     def __init__(self, *args, **kwargs):
         super(ApplicationForm, self).__init__(*args, **kwargs)
         self.fields['previous_call_center'].queryset = CallCenter.objects.all().filter(display_in_form=True)
-        self.fields['city_or_town'].queryset = CityTown.objects.all().filter(display_in_form=True)
         self.fields['languages'].queryset = Language.objects.all().filter(display_in_form=True)
         self.fields['areas_of_expertise'].queryset = AreaOfExpertise.objects.all().filter(display_in_form=True)
 
@@ -88,9 +97,6 @@ class ApplicationForm(forms.ModelForm):
                 'placeholder': EIGHTEEN_YEARS_AGO,
                 'class': 'form-control datepicker',
             }),
-            'city_or_town': forms.Select(attrs={
-                'class': 'form-control dropdown',
-            }),
             'address_line_one': forms.DateInput(attrs={
                 'placeholder': '',
                 'class': 'form-control datepicker',
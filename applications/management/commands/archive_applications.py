@@ -0,0 +1,36 @@
+"""Moves old closed applications to the archive table."""
+import time
+
+from django.core.management.base import BaseCommand
+
+from applications.archive import archivable, archive_closed
+
+
+class Command(BaseCommand):
+    help = ('Moves applications in a closed status that are older than '
+            '--days (settings.ARCHIVE_APPLICATIONS_AFTER_DAYS by default) '
+            'to the archive table, one transaction per chunk.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=None)
+        parser.add_argument('--chunk-size', type=int, default=1000)
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only count what would be archived.')
+
+    def handle(self, *args, **options):
+        if options['dry_run']:
+            self.stdout.write(' %s applications would be archived' % (
+                archivable(options['days']).count(),))
+            return
+        start = time.perf_counter()
+
+        def progress(count):
+            self.stdout.write('\r %s archived...' % (count,), ending='')
+            self.stdout.flush()
+
+        archived = archive_closed(days=options['days'],
+                                  chunk_size=options['chunk_size'],
+                                  progress=progress)
+        self.stdout.write(self.style.SUCCESS(
+            '\n %s applications archived in %.1fs' % (
+                archived, time.perf_counter() - start)))
@@ -0,0 +1,23 @@
+"""Writes a columnar snapshot of the application funnel."""
+import time
+
+from django.core.management.base import BaseCommand
+
+from applications.analytics import CHUNK_SIZE, take_snapshot
+
+
+class Command(BaseCommand):
+    help = ('Writes the application funnel as memory-mappable NumPy '
+            'columns and makes it the current snapshot for '
+            'applications.analytics.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--directory', default=None,
+                            help='Default: settings.ANALYTICS_SNAPSHOT_DIR.')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        path = take_snapshot(options['directory'], options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(
+            ' %s written in %.1fs' % (path, time.perf_counter() - start)))
@@ -0,0 +1,284 @@
+"""
+Candidate-to-requisition matching.
+
+Every application is encoded as a compact feature vector, held
+column-wise in NumPy arrays:
+
+    languages, areas_of_expertise,   bitsets of lookup ids in uint64
+    previous_call_center             words (bit b of word w is id 64w+b)
+    city_or_town_id                  0 when unset
+    current_status_id                0 when unset
+    hire_iq                          NaN when unknown
+    tss, previous_call_center_xp     booleans
+
+Each process keeps one FeatureIndex. It is built with four queries and
+then kept current by re-encoding only the applications whose
+last_modified moved since the previous sync; saves and many-to-many
+changes touch it (see applications.signals). Deletions bump a version in
+the shared cache that makes every process rebuild, and so does any
+transaction that commits application writes more than SYNC_OVERLAP
+after its first one (see note_write), since a sync may already have
+moved past their last_modified.
+
+Scoring a requisition is a handful of whole-array operations, with
+applications in a closed status left out, and the top K come out of
+np.argpartition, so a shortlist over hundreds of
+thousands of applications takes milliseconds once the index is warm.
+
+e.g.:
+    for application in shortlist(requisition, k=20):
+        application.match_score
+"""
+import threading
+from uuid import uuid4
+
+import numpy as np
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.utils import timezone
+
+from admin_console.models import ApplicationStatus
+from applications.models import Application
+
+VERSION_KEY = 'matching-index-version'
+# Rows committed this long after their last_modified are still picked
+# up by the next sync; longer transactions bump the version instead.
+SYNC_OVERLAP = timezone.timedelta(seconds=5)
+
+MULTI_HOT = ('languages', 'areas_of_expertise', 'previous_call_center')
+# Requisition languages are a hard filter; everything else adds up.
+WEIGHTS = {
+    'areas_of_expertise': 2.0,  # share of the requisition's areas
+    'hire_iq': 2.0,  # hire_iq / 100
+    'call_center': 1.0,  # worked at the requisition's call center
+    'call_center_xp': 0.5,  # any call center experience
+    'city_or_town': 1.0,  # lives in the requisition's city
+    'tss': 0.5,
+}
+
+_lock = threading.Lock()
+_index = None
+_state = threading.local()
+
+
+def _through(name):
+    """Returns (through model, application column, lookup column)."""
+    field = Application._meta.get_field(name)
+    return (field.remote_field.through, field.m2m_field_name(),
+            field.m2m_reverse_field_name())
+
+
+class FeatureIndex(object):
+    """Feature vectors of every application, sorted by pk."""
+
+    def __init__(self, version):
+        self.version = version
+        self.synced_at = None
+        self.pks = np.empty(0, np.int64)
+        self.city = np.empty(0, np.int64)
+        self.status = np.empty(0, np.int64)
+        self.hire_iq = np.empty(0, np.float64)
+        self.tss = np.empty(0, np.bool_)
+        self.call_center_xp = np.empty(0, np.bool_)
+        self.bits = {name: np.zeros((0, 1), np.uint64) for name in MULTI_HOT}
+
+    def __len__(self):
+        return len(self.pks)
+
+    def load(self, **filters):
+        """(Re-)encodes the applications matching `filters`, all of them
+        by default; returns how many were loaded."""
+        started = timezone.now()
+        rows = np.array(list(Application.objects.filter(**filters).order_by(
+            'pk').values_list('pk', 'city_or_town_id', 'hire_iq', 'tss',
+                              'previous_call_center_xp', 'current_status_id')),
+            dtype=np.float64).reshape(-1, 6)
+        positions = self._insert(rows[:, 0].astype(np.int64))
+        self.city[positions] = np.nan_to_num(rows[:, 1]).astype(np.int64)
+        self.hire_iq[positions] = rows[:, 2]
+        self.tss[positions] = rows[:, 3] == 1
+        self.call_center_xp[positions] = rows[:, 4] == 1
+        self.status[positions] = np.nan_to_num(rows[:, 5]).astype(np.int64)
+        for name in MULTI_HOT:
+            through, source, target = _through(name)
+            pairs = np.array(list(through.objects.filter(**{
+                '%s__%s' % (source, key): value
+                for key, value in filters.items()
+            }).values_list('%s_id' % (source,), '%s_id' % (target,))),
+                dtype=np.int64).reshape(-1, 2)
+            self._encode(name, positions, pairs)
+        self.synced_at = started
+        return len(rows)
+
+    def sync(self):
+        return self.load(last_modified__gte=self.synced_at - SYNC_OVERLAP)
+
+    def _insert(self, pks):
+        """Makes room for new pks, keeping every column sorted by pk, and
+        returns the positions of `pks`."""
+        new = np.setdiff1d(pks, self.pks, assume_unique=True)
+        if len(new):
+            merged = np.union1d(self.pks, new)
+            old = np.searchsorted(merged, self.pks)
+            for column in ('city', 'status', 'hire_iq', 'tss',
+                           'call_center_xp'):
+                values = getattr(self, column)
+                grown = np.zeros(len(merged), values.dtype)
+                grown[old] = values
+                setattr(self, column, grown)
+            for name, bits in self.bits.items():
+                grown = np.zeros((len(merged), bits.shape[1]), np.uint64)
+                grown[old] = bits
+                self.bits[name] = grown
+            self.pks = merged
+        return np.searchsorted(self.pks, pks)
+
+    def _encode(self, name, positions, pairs):
+        bits = self.bits[name]
+        words = int(pairs[:, 1].max()) // 64 + 1 if len(pairs) else 1
+        if words > bits.shape[1]:
+            bits = np.pad(bits, ((0, 0), (0, words - bits.shape[1])),
+                          'constant')
+        bits[positions] = 0
+        rows = np.searchsorted(self.pks, pairs[:, 0])
+        # Skips applications created after the application query.
+        known = rows < len(self)
+        known[known] = self.pks[rows[known]] == pairs[known, 0]
+        rows, ids = rows[known], pairs[known, 1]
+        np.bitwise_or.at(bits, (rows, ids // 64), np.left_shift(
+            np.uint64(1), (ids % 64).astype(np.uint64)))
+        self.bits[name] = bits
+
+    def has(self, name, pk):
+        """Boolean array: which applications have lookup `pk` in `name`."""
+        bits = self.bits[name]
+        word, bit = divmod(pk, 64)
+        if word >= bits.shape[1]:
+            return np.zeros(len(self), np.bool_)
+        return (bits[:, word] >> np.uint64(bit)) & np.uint64(1) == 1
+
+    def scores(self, requisition, languages=(), areas_of_expertise=(),
+               closed_statuses=()):
+        """Match score of every application, -inf where a hard filter
+        fails."""
+        score = WEIGHTS['hire_iq'] * np.nan_to_num(self.hire_iq) / 100
+        score += WEIGHTS['call_center_xp'] * self.call_center_xp
+        score += WEIGHTS['tss'] * self.tss
+        if areas_of_expertise:
+            matched = sum(self.has('areas_of_expertise', pk).astype(np.int64)
+                          for pk in areas_of_expertise)
+            score += (WEIGHTS['areas_of_expertise'] * matched /
+                      len(areas_of_expertise))
+        if requisition.call_center_id:
+            score += WEIGHTS['call_center'] * self.has(
+                'previous_call_center', requisition.call_center_id)
+        if requisition.city_or_town_id:
+            score += WEIGHTS['city_or_town'] * (
+                self.city == requisition.city_or_town_id)
+        eligible = ~np.isin(self.status, list(closed_statuses))
+        for pk in languages:
+            eligible &= self.has('languages', pk)
+        if requisition.requires_call_center_xp:
+            eligible &= self.call_center_xp
+        if requisition.min_hire_iq is not None:
+            with np.errstate(invalid='ignore'):
+                eligible &= self.hire_iq >= requisition.min_hire_iq
+        score[~eligible] = -np.inf
+        return score
+
+    def top(self, requisition, k, languages=(), areas_of_expertise=(),
+            closed_statuses=()):
+        """Returns (pks, scores) of the k best eligible applications."""
+        score = self.scores(requisition, languages, areas_of_expertise,
+                            closed_statuses)
+        k = min(k, int(np.isfinite(score).sum()))
+        if k <= 0:
+            return self.pks[:0], score[:0]
+        best = np.argpartition(-score, k - 1)[:k]
+        best = best[np.lexsort((self.pks[best], -score[best]))]
+        return self.pks[best], score[best]
+
+
+def current_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, uuid4().hex, None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def bump_version():
+    """Makes every process rebuild its index on next use."""
+    cache.set(VERSION_KEY, uuid4().hex, None)
+
+
+class _Writer(object):
+    """Application writes of one transaction, from the first one on."""
+
+    def __init__(self, using):
+        self.using = using
+        self.started = timezone.now()
+        self.callback = self.commit
+
+    def is_pending(self):
+        """False once committed or rolled back: either way Django
+        dropped the on_commit callback."""
+        return any(callback is self.callback for _, callback in
+                   connections[self.using].run_on_commit)
+
+    def commit(self):
+        if timezone.now() - self.started > SYNC_OVERLAP:
+            bump_version()
+
+
+def note_write(using=DEFAULT_DB_ALIAS):
+    """Call before writing applications (or their last_modified). A
+    transaction committing them more than SYNC_OVERLAP later bumps the
+    version, as a sync could have skipped them in the meantime."""
+    if not transaction.get_connection(using).in_atomic_block:
+        return
+    if not hasattr(_state, 'writers'):
+        _state.writers = {}
+    writer = _state.writers.get(using)
+    if writer is None or not writer.is_pending():
+        writer = _state.writers[using] = _Writer(using)
+        transaction.on_commit(writer.callback, using=using)
+
+
+def _current_index():
+    """This process's index, rebuilt or synced. Call with _lock held."""
+    global _index
+    version = current_version()
+    if _index is None or _index.version != version:
+        _index = FeatureIndex(version)
+        _index.load()
+    else:
+        _index.sync()
+    return _index
+
+
+def rank(requisition, k=50):
+    """Returns (pks, scores) of the k best applications for
+    `requisition`, best first."""
+    languages = list(requisition.languages.values_list('pk', flat=True))
+    areas = list(requisition.areas_of_expertise.values_list('pk', flat=True))
+    closed = list(ApplicationStatus.objects.filter(
+        is_closed=True).values_list('pk', flat=True))
+    with _lock:
+        return _current_index().top(requisition, k, languages, areas, closed)
+
+
+def shortlist(requisition, k=50):
+    """The k best applications for `requisition`, best first, each with
+    a match_score."""
+    pks, scores = rank(requisition, k)
+    applications = Application.objects.select_related(
+        'city_or_town').in_bulk([int(pk) for pk in pks])
+    ranked = []
+    for pk, score in zip(pks, scores):
+        # Deleted since the last sync.
+        if int(pk) in applications:
+            application = applications[int(pk)]
+            application.match_score = float(score)
+            ranked.append(application)
+    return ranked
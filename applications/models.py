@@ -1,13 +1,15 @@
 import re
 from django.conf import settings
 from django.core.exceptions import ValidationError
-from django.db import models
+from django.db import connections, models, router, transaction
+from django.db.models import Count, Min, Q
 from django.db.models.signals import post_save
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from string import punctuation
 
-from accounts.models import Profile, User
+from accounts.models import NationalId, Profile, User, reduce_to_alphanum
+from common.validation import validate
 
 class SupportModel(models.Model):
     display_in_form = models.BooleanField(default=False, blank=False)
@@ -61,6 +63,73 @@ class AreaOfExpertise(SupportModel):
         verbose_name = _('area of experience')
         verbose_name_plural = _('areas of experience')
 
+class ApplicationQuerySet(models.QuerySet):
+
+    def stage_summary(self):
+        """
+        {status pk: (applications, oldest status_changed_at)} read off
+        the (current_status, status_changed_at) index alone.
+        """
+        rows = self.order_by().values('current_status').annotate(
+            count=Count('current_status'), since=Min('status_changed_at'))
+        return {row['current_status']: (row['count'], row['since'])
+                for row in rows if row['current_status'] is not None}
+
+    def transition(self, status, changed_by=None, declined_reason=None):
+        """
+        Moves every application in the queryset that is allowed to move
+        to `status` (see ApplicationStatus) and logs a StatusTransition
+        for each, with the time spent in the previous status. One
+        statement on PostgreSQL, two in a transaction elsewhere. Returns
+        how many applications moved.
+        """
+        allowed = Q(current_status__in=status.previous_statuses.all())
+        if status.is_initial:
+            allowed |= Q(current_status=None)
+        ids_sql, ids_params = self.filter(allowed).exclude(
+            current_status=status).order_by().values('pk').query.sql_with_params()
+        db = router.db_for_write(self.model)
+        # applications.matching imports this module.
+        from applications.matching import note_write
+        note_write(db)
+        connection = connections[db]
+        now = connection.ops.adapt_datetimefield_value(timezone.now())
+        application = self.model._meta.db_table
+        log = StatusTransition._meta.db_table
+        columns = ('application_id, from_status_id, to_status_id, '
+                   'declined_reason_id, changed_by_id, changed_at, '
+                   'time_in_previous')
+        values = [status.pk,
+                  declined_reason.pk if declined_reason else None,
+                  changed_by.pk if changed_by else None, now]
+        update = ('UPDATE %s SET current_status_id = %%s, '
+                  'status_changed_at = %%s, last_modified = %%s' % (application,))
+        with transaction.atomic(using=db), connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute(
+                    'WITH moved AS (%s FROM (SELECT id, current_status_id, '
+                    'status_changed_at FROM %s WHERE id IN (%s) FOR UPDATE) '
+                    'AS old WHERE %s.id = old.id RETURNING %s.id, '
+                    'old.current_status_id, old.status_changed_at) '
+                    'INSERT INTO %s (%s) SELECT id, current_status_id, %%s, '
+                    '%%s, %%s, %%s, %%s - status_changed_at FROM moved' % (
+                        update, application, ids_sql, application,
+                        application, log, columns),
+                    [status.pk, now, now] + list(ids_params) + values + [now])
+                return cursor.rowcount
+            # SQLite stores durations as integer microseconds.
+            cursor.execute(
+                'INSERT INTO %s (%s) SELECT id, current_status_id, %%s, %%s, '
+                '%%s, %%s, CAST(ROUND((julianday(%%s) - '
+                'julianday(status_changed_at)) * 86400000000) AS INTEGER) '
+                'FROM %s WHERE id IN (%s)' % (log, columns, application,
+                                              ids_sql),
+                values + [now] + list(ids_params))
+            cursor.execute('%s WHERE id IN (%s)' % (update, ids_sql),
+                           [status.pk, now, now] + list(ids_params))
+            return cursor.rowcount
+
+
 class Application(models.Model):
     CEDULA = 0
     PASSPORT = 1
@@ -136,6 +205,24 @@ class Application(models.Model):
         blank=True,
         null=True,
     )
+    # Also touched when the many-to-many fields change; the matching
+    # index reloads applications by it.
+    last_modified = models.DateTimeField(auto_now=True, db_index=True,
+                                         editable=False)
+    # Denormalized from the latest StatusTransition; only
+    # ApplicationQuerySet.transition() writes them.
+    current_status = models.ForeignKey(
+        'admin_console.ApplicationStatus',
+        related_name='applications',
+        on_delete=models.PROTECT,
+        blank=True,
+        null=True,
+        editable=False,
+    )
+    status_changed_at = models.DateTimeField(blank=True, null=True,
+                                             editable=False)
+
+    objects = ApplicationQuerySet.as_manager()
 
     class Meta:
         verbose_name = _('application')
@@ -145,16 +232,33 @@ class Application(models.Model):
             ('view_status', _('can view status')),
         )
         get_latest_by = 'applied_at'
+        indexes = [models.Index(fields=['current_status', 'status_changed_at'],
+                                name='application_stage_idx')]
 
     def __str__(self):
         return '%s %s (%s: %s)' % (self.first_names, self.last_names,
-                                self.person.get_natid_type_display(),
-                                self.person.natid)
+                                   self.get_national_id_type_display(),
+                                   self.national_id_number)
 
     def save(self, *args, **kwargs):
-        self.full_clean()
+        validate(self, kwargs.pop('validation', None),
+                 kwargs.get('update_fields'))
         super(Application, self).save(*args, **kwargs)
 
+    def transition(self, status, changed_by=None, declined_reason=None):
+        """Moves this application to `status`; raises ValidationError if
+        the pipeline does not allow it."""
+        moved = Application.objects.filter(pk=self.pk).transition(
+            status, changed_by, declined_reason)
+        if not moved:
+            raise ValidationError(
+                _('Cannot move from %(current)s to %(status)s.'),
+                code='invalid_transition',
+                params={'current': self.current_status, 'status': status},
+            )
+        self.refresh_from_db(fields=('current_status', 'status_changed_at',
+                                     'last_modified'))
+
     def clean(self, *args, **kwargs):
         self.create_person_if_none()
         super(Application, self).clean(*args, **kwargs)
@@ -163,21 +267,253 @@ class Application(models.Model):
         return value.strip(punctuation)
 
     def create_person_if_none(self):
-        try:
-            person = Person.objects.create(first_names=self.first_names,
-                                         last_names=self.last_names,
-                                         primary_phone=self.primary_phone,
-                                         secondary_phone=self.secondary_phone,
-                                         birth_date=self.birth_date,
-                                         natid_type=self.national_id_type,
-                                         natid=self.national_id_number,
-                                         email=self.email)
-        except ValidationError:
-            person = Person.objects.get(natid=self.national_id_number)
-            allowed_days = timezone.now() - timezone.timedelta(
-                days=settings.APP_SETTINGS['applications']['MIN_DAYS_ALLOWED'])
-            if person.applications.latest().applied_at < allowed_days:
-                return ValidationError('The minimum days allowed between'\
-                                        'subsequent applications is {} days'\
-                                        'please try again later.')
-        self.person = person
+        """
+        Links the application to the user holding the same national ID,
+        if any, and enforces the minimum days allowed between subsequent
+        applications.
+        """
+        if self.user_id is not None:
+            return
+        natid = NationalId.objects.filter(
+            id_number=reduce_to_alphanum(self.national_id_number),
+            user__isnull=False,
+        ).select_related('user').first()
+        if natid is None:
+            return
+        allowed_days = timezone.now() - timezone.timedelta(
+            days=settings.MIN_DAYS_BETWEEN_APPLICATIONS)
+        if natid.user.applications.filter(applied_at__gt=allowed_days).exists():
+            raise ValidationError(
+                _('The minimum days allowed between subsequent applications '
+                  'is %(days)s days, please try again later.'),
+                code='too_soon',
+                params={'days': settings.MIN_DAYS_BETWEEN_APPLICATIONS},
+            )
+        self.user = natid.user
+
+
+class Requisition(models.Model):
+    """
+    An opening to fill. Its required languages are a hard filter; the
+    other fields weigh in on the candidates' match score (see
+    applications.matching).
+    """
+    title = models.CharField(max_length=100, blank=False)
+    headcount = models.PositiveIntegerField(default=1)
+    is_open = models.BooleanField(default=True)
+    call_center = models.ForeignKey(
+        'admin_console.CallCenter',
+        related_name='requisitions',
+        on_delete=models.SET_NULL,
+        blank=True,
+        null=True,
+    )
+    city_or_town = models.ForeignKey(
+        'admin_console.CityTown',
+        related_name='requisitions',
+        on_delete=models.SET_NULL,
+        blank=True,
+        null=True,
+    )
+    shift = models.ForeignKey(
+        'admin_console.Shift',
+        related_name='requisitions',
+        on_delete=models.SET_NULL,
+        blank=True,
+        null=True,
+    )
+    career = models.ForeignKey(
+        'admin_console.Career',
+        related_name='requisitions',
+        on_delete=models.SET_NULL,
+        blank=True,
+        null=True,
+    )
+    languages = models.ManyToManyField(
+        'admin_console.Language',
+        related_name='requisitions',
+        blank=True,
+    )
+    areas_of_expertise = models.ManyToManyField(
+        'admin_console.AreaOfExpertise',
+        related_name='requisitions',
+        blank=True,
+    )
+    requires_call_center_xp = models.BooleanField(default=False)
+    min_hire_iq = models.IntegerField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True, editable=False)
+    created_by = models.ForeignKey(
+        'accounts.User',
+        related_name='requisitions',
+        on_delete=models.SET_NULL,
+        blank=True,
+        null=True,
+    )
+
+    class Meta:
+        verbose_name = _('requisition')
+        verbose_name_plural = _('requisitions')
+        ordering = ('-created_at',)
+
+    def __str__(self):
+        return self.title
+
+    def save(self, *args, **kwargs):
+        validate(self, kwargs.pop('validation', None),
+                 kwargs.get('update_fields'))
+        super(Requisition, self).save(*args, **kwargs)
+
+
+class StatusTransition(models.Model):
+    """One move of an application through the pipeline."""
+    application = models.ForeignKey(
+        'applications.Application',
+        related_name='status_transitions',
+        on_delete=models.CASCADE,
+    )
+    from_status = models.ForeignKey(
+        'admin_console.ApplicationStatus',
+        related_name='+',
+        on_delete=models.PROTECT,
+        blank=True,
+        null=True,
+    )
+    to_status = models.ForeignKey(
+        'admin_console.ApplicationStatus',
+        related_name='+',
+        on_delete=models.PROTECT,
+    )
+    declined_reason = models.ForeignKey(
+        'admin_console.DeclinedReason',
+        related_name='+',
+        on_delete=models.SET_NULL,
+        blank=True,
+        null=True,
+    )
+    changed_at = models.DateTimeField(default=timezone.now, db_index=True)
+    changed_by = models.ForeignKey(
+        'accounts.User',
+        related_name='+',
+        on_delete=models.SET_NULL,
+        blank=True,
+        null=True,
+    )
+    # How long the application spent in from_status.
+    time_in_previous = models.DurationField(blank=True, null=True)
+
+    class Meta:
+        verbose_name = _('status transition')
+        verbose_name_plural = _('status transitions')
+        get_latest_by = 'changed_at'
+        indexes = [models.Index(fields=['application', 'changed_at'],
+                                name='transition_application_idx')]
+
+    def __str__(self):
+        return '%s: %s -> %s' % (self.application_id, self.from_status_id,
+                                 self.to_status_id)
+
+
+def _archived_lookup(model):
+    """Archived rows keep whatever lookup id they had; no constraint, so
+    lookups can still be deleted."""
+    return models.ForeignKey(model, related_name='+', db_constraint=False,
+                             on_delete=models.DO_NOTHING, blank=True,
+                             null=True)
+
+
+class ArchivedApplication(models.Model):
+    """
+    A closed application moved out of the live table (see
+    applications.archive), with its many-to-many ids kept as
+    comma-separated lists. The table is created by
+    applications.archive.create_archive_tables; on PostgreSQL it is
+    partitioned by applied_at month.
+    """
+    # The application's own id.
+    id = models.IntegerField(primary_key=True)
+    first_names = models.CharField(max_length=100)
+    last_names = models.CharField(max_length=100)
+    primary_phone = models.CharField(max_length=15)
+    secondary_phone = models.CharField(max_length=15, blank=True, null=True)
+    email = models.EmailField()
+    lived_in_usa = models.BooleanField(default=False)
+    birth_date = models.DateField(blank=True, null=True)
+    applied_at = models.DateTimeField()
+    national_id_type = models.IntegerField(
+        choices=Application.ID_TYPE_CHOICES, default=Application.CEDULA)
+    national_id_number = models.CharField(max_length=15)
+    gender = models.IntegerField(choices=Application.GENDER_CHOICES,
+                                 default=Application.MALE)
+    address_line_one = models.CharField(max_length=150)
+    address_line_two = models.CharField(max_length=150, blank=True)
+    active_studies = models.BooleanField(default=False)
+    career = models.CharField(max_length=50, blank=True)
+    institution = models.CharField(max_length=150, blank=True)
+    currently_employed = models.BooleanField(default=False)
+    current_employer = models.CharField(max_length=50, blank=True)
+    previous_call_center_xp = models.BooleanField(default=False)
+    city_or_town = _archived_lookup('admin_console.CityTown')
+    pre_screen = models.BooleanField(default=False)
+    hire_iq = models.IntegerField(blank=True, null=True)
+    tss = models.BooleanField(default=False)
+    hm_interview = models.BooleanField(default=False)
+    user = _archived_lookup('accounts.User')
+    last_modified = models.DateTimeField()
+    current_status = _archived_lookup('admin_console.ApplicationStatus')
+    status_changed_at = models.DateTimeField(blank=True, null=True)
+    language_ids = models.TextField(blank=True)
+    previous_call_center_ids = models.TextField(blank=True)
+    area_of_expertise_ids = models.TextField(blank=True)
+    archived_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        managed = False
+        verbose_name = _('archived application')
+        verbose_name_plural = _('archived applications')
+        get_latest_by = 'applied_at'
+        indexes = [
+            models.Index(fields=['applied_at'],
+                         name='archived_applied_idx'),
+            models.Index(fields=['current_status', 'status_changed_at'],
+                         name='archived_stage_idx'),
+        ]
+
+    def __str__(self):
+        return '%s %s (%s: %s)' % (self.first_names, self.last_names,
+                                   self.get_national_id_type_display(),
+                                   self.national_id_number)
+
+
+class ArchivedStatusTransition(models.Model):
+    """
+    A StatusTransition of an archived application, moved with it (see
+    applications.archive). The table is created by
+    applications.archive.create_archive_tables; on PostgreSQL it is
+    partitioned by changed_at month.
+    """
+    # The transition's own id.
+    id = models.IntegerField(primary_key=True)
+    application = models.ForeignKey(
+        'applications.ArchivedApplication',
+        related_name='status_transitions',
+        db_constraint=False,
+        on_delete=models.DO_NOTHING,
+    )
+    from_status = _archived_lookup('admin_console.ApplicationStatus')
+    to_status = _archived_lookup('admin_console.ApplicationStatus')
+    declined_reason = _archived_lookup('admin_console.DeclinedReason')
+    changed_at = models.DateTimeField()
+    changed_by = _archived_lookup('accounts.User')
+    time_in_previous = models.DurationField(blank=True, null=True)
+
+    class Meta:
+        managed = False
+        verbose_name = _('archived status transition')
+        verbose_name_plural = _('archived status transitions')
+        get_latest_by = 'changed_at'
+        indexes = [models.Index(fields=['application', 'changed_at'],
+                                name='archived_transition_idx')]
+
+    def __str__(self):
+        return '%s: %s -> %s' % (self.application_id, self.from_status_id,
+                                 self.to_status_id)
@@ -1,23 +1,63 @@
-from django.conf import settings
-from django.core.exceptions import ValidationError
-from django.db.models.signals import post_save, pre_save
-from django.dispatch import receiver
+"""Applications signals module"""
+from django.db import router, transaction
+from django.db.models.signals import m2m_changed, post_delete, pre_save
 from django.utils import timezone
 
+from applications import archive, matching
 from applications.models import Application
-from accounts.models import Person
-
-@receiver(post_save, sender=Application)
-def assign_person_to_application(sender, instance, **kwargs):
-    try:
-        person = Person.objects.get(natid=instance.national_id_number)
-    except Person.DoesNotExist:
-        person = Person.objects.create(first_names=instance.first_names,
-                                       last_names=instance.last_names,
-                                       primary_phone=instance.primary_phone,
-                                       secondary_phone=instance.secondary_phone,
-                                       email=instance.email,
-                                       birth_date=instance.birth_date,
-                                       natid_type=instance.national_id_type,
-                                       natid=instance.national_id_number)
-    person.applications.add(instance)
+
+# @receiver(post_save, sender=Application)
+# def assign_person_to_application(sender, instance, **kwargs):
+#     try:
+#         person = Person.objects.get(natid=instance.national_id_number)
+#     except Person.DoesNotExist:
+#         person = Person.objects.create(first_names=instance.first_names,
+#                                        last_names=instance.last_names,
+#                                        primary_phone=instance.primary_phone,
+#                                        secondary_phone=instance.secondary_phone,
+#                                        email=instance.email,
+#                                        birth_date=instance.birth_date,
+#                                        natid_type=instance.national_id_type,
+#                                        natid=instance.national_id_number)
+#     person.applications.add(instance)
+
+
+#pylint: disable=W0613
+def touch_applications(sender, instance, action, reverse, pk_set, **kwargs):
+    """Moves last_modified when an application's many-to-many fields
+    change, so the matching index re-encodes it."""
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        pks = [instance.pk]
+    elif pk_set:
+        pks = pk_set
+    else:
+        # A lookup row was cleared from every application it had.
+        transaction.on_commit(matching.bump_version)
+        return
+    matching.note_write(router.db_for_write(Application))
+    Application.objects.filter(pk__in=pks).update(last_modified=timezone.now())
+
+
+def note_application_write(sender, using, **kwargs):
+    matching.note_write(using)
+
+
+def rebuild_matching_index(sender, **kwargs):
+    transaction.on_commit(matching.bump_version)
+
+
+def create_archive_tables(sender, using, **kwargs):
+    """The archive models are unmanaged (they are partitioned on
+    PostgreSQL), so their tables are created here after migrate."""
+    if router.allow_migrate(using, sender.label,
+                            model_name='archivedapplication'):
+        archive.create_archive_tables(using)
+
+
+for name in matching.MULTI_HOT:
+    m2m_changed.connect(touch_applications,
+                        sender=getattr(Application, name).through)
+pre_save.connect(note_application_write, sender=Application)
+post_delete.connect(rebuild_matching_index, sender=Application)
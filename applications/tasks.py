@@ -3,6 +3,13 @@ from django.conf import settings
 
 from ta_platform.celery_app import app
 
+from applications.analytics import take_snapshot
+
 @app.task(bind=True, default_retry_delay=60, retry_kwargs={'max_retries': 5})
 def send_user_email(self, address):
-    pass
\ No newline at end of file
+    pass
+
+@app.task(ignore_result=True)
+def snapshot_funnel():
+    """Nightly, from celery beat; see applications.analytics."""
+    take_snapshot()
@@ -0,0 +1,91 @@
+import datetime
+import os
+import shutil
+import tempfile
+
+from django.test import TestCase
+from django.utils import timezone
+
+from admin_console.models import CityTown, Language
+from applications import archive
+from applications.analytics import Snapshot, take_snapshot
+from applications.models import Application
+
+MONDAY = datetime.datetime(2018, 7, 2, 12, tzinfo=timezone.utc)
+
+
+class AnalyticsTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.english, cls.french = [Language.objects.create(name=name)
+                                   for name in ('English', 'French')]
+        cls.city = CityTown.objects.create(name='Santiago')
+        # (days after MONDAY, pre_screen, hm_interview, languages)
+        for n, (days, pre_screen, interview, languages) in enumerate((
+                (0, True, True, [cls.english]),
+                (1, True, False, [cls.english, cls.french]),
+                (6, False, False, []),
+                (7, True, True, [cls.french]),
+                (40, True, False, [cls.english]))):
+            application = Application.objects.create(
+                first_names='Ana %s' % (n,), last_names='Perez',
+                primary_phone='8095550100', email='ana%s@example.com' % (n,),
+                national_id_number=str(n), address_line_one='Calle 1',
+                pre_screen=pre_screen, hm_interview=interview,
+                city_or_town=cls.city if n % 2 else None)
+            application.languages.set(languages)
+            Application.objects.filter(pk=application.pk).update(
+                applied_at=MONDAY + datetime.timedelta(days=days))
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix='ta_platform-snapshots-')
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+
+    def snapshot(self, chunk_size=2):
+        take_snapshot(self.directory, chunk_size)
+        return Snapshot.load(self.directory)
+
+    def test_conversion_by_week(self):
+        conversion = self.snapshot().conversion('week', 'pre_screen',
+                                                'hm_interview')
+        self.assertEqual(list(conversion.items()), [
+            (datetime.date(2018, 7, 2), (2, 1, 0.5)),
+            (datetime.date(2018, 7, 9), (1, 1, 1.0)),
+            (datetime.date(2018, 8, 6), (1, 0, 0.0)),
+        ])
+
+    def test_multi_valued_cohorts_and_filters(self):
+        snapshot = self.snapshot()
+        self.assertEqual(snapshot.counts('languages'),
+                         {'English': 3, 'French': 2})
+        conversion = snapshot.conversion(
+            'month', where=snapshot.has('languages', self.french.pk))
+        self.assertEqual(conversion[datetime.date(2018, 7, 1)],
+                         (2, 1, 0.5))
+        self.assertEqual(conversion[datetime.date(2018, 8, 1)],
+                         (0, 0, None))
+        self.assertEqual(snapshot.counts('city_or_town'),
+                         {'': 3, 'Santiago': 2})
+
+    def test_archived_applications_are_included(self):
+        before = self.snapshot()
+        archive.archive_chunk([before['pk'][1], before['pk'][3]])
+        after = self.snapshot()
+        self.assertEqual(after['pk'].tolist(), before['pk'].tolist())
+        for column in ('applied_at', 'city_or_town', 'pre_screen',
+                       'languages'):
+            self.assertEqual(after[column].tolist(), before[column].tolist())
+        self.assertEqual(after.counts('languages'),
+                         {'English': 3, 'French': 2})
+
+    def test_columns_are_memory_mapped_and_swapped_atomically(self):
+        first = self.snapshot()
+        self.assertEqual(len(first), 5)
+        Application.objects.filter(pk=first['pk'][0]).delete()
+        second = self.snapshot(chunk_size=10)
+        self.assertEqual(len(second), 4)
+        self.assertEqual(len(first), 5)
+        self.assertIsNotNone(second['pre_screen'].filename)
+        self.snapshot()
+        self.assertEqual(len(os.listdir(self.directory)), 3)
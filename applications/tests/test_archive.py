@@ -0,0 +1,88 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+
+from admin_console.models import ApplicationStatus, Language
+from applications import archive
+from applications.models import (
+    Application, ArchivedApplication, ArchivedStatusTransition,
+    StatusTransition)
+
+
+class ArchiveTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        call_command('create_application_statuses', stdout=StringIO())
+        cls.status = {status.name: status
+                      for status in ApplicationStatus.objects.all()}
+        cls.english, cls.french = [Language.objects.create(name=name)
+                                   for name in ('English', 'French')]
+        cls.old_hired = cls.apply(0, days_ago=400, statuses=(
+            'Pre-screened', 'Interviewed', 'Offered', 'Hired'))
+        cls.old_declined = cls.apply(1, days_ago=500, statuses=('Declined',))
+        cls.old_open = cls.apply(2, days_ago=400)
+        cls.recent_declined = cls.apply(3, days_ago=10,
+                                        statuses=('Declined',))
+        cls.old_hired.languages.set([cls.english, cls.french])
+
+    @classmethod
+    def apply(cls, n, days_ago, statuses=()):
+        application = Application.objects.create(
+            first_names='Ana %s' % (n,), last_names='Perez',
+            primary_phone='8095550100', email='ana%s@example.com' % (n,),
+            national_id_number=str(n), address_line_one='Calle 1')
+        Application.objects.filter(pk=application.pk).update(
+            applied_at=timezone.now() - timezone.timedelta(days=days_ago))
+        application.transition(cls.status['New'])
+        for status in statuses:
+            application.transition(cls.status[status])
+        return application
+
+    def test_moves_only_old_closed_applications(self):
+        applied_at = Application.objects.get(pk=self.old_hired.pk).applied_at
+        transitions = list(StatusTransition.objects.filter(
+            application_id=self.old_hired.pk).order_by('pk').values_list(
+                'pk', 'from_status', 'to_status', 'changed_at',
+                'time_in_previous'))
+        self.assertEqual(archive.archive_closed(days=365, chunk_size=1), 2)
+        self.assertEqual(
+            set(ArchivedApplication.objects.values_list('pk', flat=True)),
+            {self.old_hired.pk, self.old_declined.pk})
+        self.assertEqual(
+            set(Application.objects.values_list('pk', flat=True)),
+            {self.old_open.pk, self.recent_declined.pk})
+        self.assertFalse(StatusTransition.objects.filter(
+            application_id=self.old_hired.pk).exists())
+        archived = ArchivedApplication.objects.get(pk=self.old_hired.pk)
+        self.assertEqual(archived.current_status, self.status['Hired'])
+        self.assertEqual(archived.applied_at, applied_at)
+        self.assertEqual(archived.language_ids, '%s,%s' % (
+            self.english.pk, self.french.pk))
+        self.assertEqual(archived.first_names, 'Ana 0')
+        self.assertEqual(list(archived.status_transitions.order_by(
+            'pk').values_list('pk', 'from_status', 'to_status', 'changed_at',
+                              'time_in_previous')), transitions)
+        self.assertEqual(len(transitions), 5)
+        self.assertEqual(set(ArchivedStatusTransition.objects.values_list(
+            'application_id', flat=True)),
+            {self.old_hired.pk, self.old_declined.pk})
+
+    def test_reads_union_both_tables(self):
+        archive.archive_closed(days=365)
+        with self.assertNumQueries(1):
+            rows = list(archive.all_applications(
+                'id', 'current_status',
+                current_status__is_closed=True).order_by('id'))
+        self.assertEqual(
+            [(row['id'], row['archived']) for row in rows],
+            [(self.old_hired.pk, True), (self.old_declined.pk, True),
+             (self.recent_declined.pk, False)])
+
+    def test_dry_run_changes_nothing(self):
+        out = StringIO()
+        call_command('archive_applications', '--dry-run', stdout=out)
+        self.assertIn('2 applications would be archived', out.getvalue())
+        self.assertFalse(ArchivedApplication.objects.exists())
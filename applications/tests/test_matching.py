@@ -0,0 +1,154 @@
+import numpy as np
+from django.core.cache import cache
+from django.db import transaction
+from django.test import TestCase, TransactionTestCase
+from django.utils import timezone
+
+from admin_console.models import (
+    ApplicationStatus, AreaOfExpertise, CallCenter, CityTown, Language)
+from applications import matching
+from applications.models import Application, Requisition
+
+
+class MatchingTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.english, cls.french = [Language.objects.create(name=name)
+                                   for name in ('English', 'French')]
+        cls.sales, cls.support = [AreaOfExpertise.objects.create(name=name)
+                                  for name in ('Sales', 'Support')]
+        cls.center = CallCenter.objects.create(name='Sitel')
+        cls.city = CityTown.objects.create(name='Santiago')
+        cls.strong = cls.apply('strong', [cls.english, cls.french],
+                               [cls.sales, cls.support], hire_iq=90, tss=True,
+                               city=cls.city, center=cls.center)
+        cls.average = cls.apply('average', [cls.english], [cls.sales],
+                                hire_iq=70)
+        cls.weak = cls.apply('weak', [cls.english], [], hire_iq=40)
+        cls.no_english = cls.apply('no-english', [cls.french],
+                                   [cls.sales, cls.support], hire_iq=99)
+        cls.requisition = Requisition.objects.create(
+            title='Bilingual sales', call_center=cls.center,
+            city_or_town=cls.city)
+        cls.requisition.languages.set([cls.english])
+        cls.requisition.areas_of_expertise.set([cls.sales, cls.support])
+
+    @classmethod
+    def apply(cls, name, languages, areas, hire_iq=None, tss=False,
+              city=None, center=None):
+        application = Application.objects.create(
+            first_names=name, last_names=name, primary_phone='8095550100',
+            email='%s@example.com' % (name,), national_id_number='1',
+            address_line_one='Calle 1', hire_iq=hire_iq, tss=tss,
+            city_or_town=city, previous_call_center_xp=center is not None)
+        application.languages.set(languages)
+        application.areas_of_expertise.set(areas)
+        if center is not None:
+            application.previous_call_center.set([center])
+        return application
+
+    def setUp(self):
+        cache.clear()
+        matching._index = None
+
+    def test_shortlist_is_best_first_and_filters_languages(self):
+        shortlist = matching.shortlist(self.requisition, k=10)
+        self.assertEqual([a.pk for a in shortlist],
+                         [self.strong.pk, self.average.pk, self.weak.pk])
+        self.assertAlmostEqual(shortlist[0].match_score,
+                               2.0 + 1.8 + 1.0 + 0.5 + 1.0 + 0.5)
+
+    def test_top_k_and_hard_filters(self):
+        pks, _ = matching.rank(self.requisition, k=1)
+        self.assertEqual(list(pks), [self.strong.pk])
+        self.requisition.min_hire_iq = 60
+        self.requisition.requires_call_center_xp = True
+        pks, _ = matching.rank(self.requisition, k=10)
+        self.assertEqual(list(pks), [self.strong.pk])
+
+    def test_saves_and_m2m_changes_are_synced(self):
+        matching.rank(self.requisition)
+        index = matching._index
+        Application.objects.filter(pk=self.weak.pk).update(
+            last_modified=timezone.now() - timezone.timedelta(hours=1))
+        index.synced_at = timezone.now()
+        with self.assertNumQueries(4):
+            self.assertEqual(index.sync(), 3)
+        self.weak.areas_of_expertise.set([self.sales, self.support])
+        self.weak.hire_iq = 95
+        self.weak.save()
+        pks, _ = matching.rank(self.requisition, k=2)
+        self.assertIs(matching._index, index)
+        self.assertEqual(list(pks), [self.strong.pk, self.weak.pk])
+
+    def test_new_applications_join_the_index(self):
+        matching.rank(self.requisition)
+        newcomer = self.apply('newcomer', [self.english],
+                              [self.sales, self.support], hire_iq=100,
+                              tss=True, city=self.city, center=self.center)
+        pks, _ = matching.rank(self.requisition, k=1)
+        self.assertEqual(list(pks), [newcomer.pk])
+
+    def test_bump_version_rebuilds(self):
+        matching.rank(self.requisition)
+        index = matching._index
+        matching.bump_version()
+        matching.rank(self.requisition)
+        self.assertIsNot(matching._index, index)
+
+    def test_lookup_ids_beyond_one_word(self):
+        index = matching.FeatureIndex('test')
+        index.load()
+        index._encode('languages', index._insert(index.pks[:1]),
+                      np.array([[index.pks[0], 130]]))
+        self.assertTrue(index.has('languages', 130)[0])
+        self.assertFalse(index.has('languages', 130)[1:].any())
+        self.assertFalse(index.has('languages', 1000).any())
+
+    def test_closed_statuses_are_left_out(self):
+        hired = ApplicationStatus.objects.create(name='Hired', is_closed=True,
+                                                 is_initial=True)
+        matching.rank(self.requisition)
+        Application.objects.filter(pk=self.strong.pk).transition(hired)
+        pks, _ = matching.rank(self.requisition, k=1)
+        self.assertEqual(list(pks), [self.average.pk])
+
+
+class LongWriterTest(TransactionTestCase):
+
+    def setUp(self):
+        cache.clear()
+        matching._index = None
+        self.english = Language.objects.create(name='English')
+        self.requisition = Requisition.objects.create(title='Sales')
+        self.requisition.languages.set([self.english])
+
+    def apply(self, name):
+        application = Application.objects.create(
+            first_names=name, last_names=name, primary_phone='8095550100',
+            email='%s@example.com' % (name,), national_id_number='1',
+            address_line_one='Calle 1')
+        application.languages.set([self.english])
+        return application
+
+    def test_long_transaction_rebuilds_on_commit(self):
+        matching.rank(self.requisition)
+        long_ago = timezone.now() - timezone.timedelta(seconds=60)
+        with transaction.atomic():
+            newcomer = self.apply('newcomer')
+            # As if it had been written a minute ago and synced past since.
+            Application.objects.filter(pk=newcomer.pk).update(
+                last_modified=long_ago)
+            matching._state.writers['default'].started = long_ago
+        pks, _ = matching.rank(self.requisition)
+        self.assertEqual(list(pks), [newcomer.pk])
+
+    def test_short_transaction_only_syncs(self):
+        matching.rank(self.requisition)
+        version = matching.current_version()
+        with transaction.atomic():
+            newcomer = self.apply('newcomer')
+        self.assertEqual(matching.current_version(), version)
+        pks, _ = matching.rank(self.requisition)
+        self.assertEqual(list(pks), [newcomer.pk])
@@ -0,0 +1,72 @@
+from io import StringIO
+
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+
+from admin_console.models import ApplicationStatus, DeclinedReason
+from applications.models import Application, StatusTransition
+
+
+class StatusTransitionTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        call_command('create_application_statuses', stdout=StringIO())
+        cls.status = {status.name: status
+                      for status in ApplicationStatus.objects.all()}
+        cls.reason = DeclinedReason.objects.create(name='No show')
+        cls.applications = [Application.objects.create(
+            first_names='Ana %s' % (n,), last_names='Perez',
+            primary_phone='8095550100', email='ana%s@example.com' % (n,),
+            national_id_number=str(n), address_line_one='Calle 1',
+        ) for n in range(3)]
+
+    def test_bulk_transition_logs_every_move(self):
+        queryset = Application.objects.filter(
+            pk__in=[a.pk for a in self.applications])
+        with self.assertNumQueries(4):
+            self.assertEqual(queryset.transition(self.status['New']), 3)
+        self.assertEqual(
+            queryset.filter(current_status=self.status['New']).count(), 3)
+        transition = StatusTransition.objects.get(
+            application=self.applications[0])
+        self.assertIsNone(transition.from_status)
+        self.assertIsNone(transition.time_in_previous)
+
+    def test_only_allowed_moves_happen(self):
+        first, second, _ = self.applications
+        Application.objects.filter(pk=first.pk).transition(self.status['New'])
+        moved = Application.objects.filter(
+            pk__in=[first.pk, second.pk]).transition(self.status['Pre-screened'])
+        self.assertEqual(moved, 1)
+        with self.assertRaises(ValidationError) as raised:
+            Application.objects.get(pk=second.pk).transition(
+                self.status['Hired'])
+        self.assertEqual(raised.exception.code, 'invalid_transition')
+
+    def test_time_in_previous_status(self):
+        application = Application.objects.get(pk=self.applications[0].pk)
+        application.transition(self.status['New'])
+        entered = timezone.now() - timezone.timedelta(days=2, hours=3)
+        Application.objects.filter(pk=application.pk).update(
+            status_changed_at=entered)
+        application.transition(self.status['Declined'],
+                               declined_reason=self.reason)
+        self.assertEqual(application.current_status, self.status['Declined'])
+        transition = application.status_transitions.latest()
+        self.assertEqual(transition.from_status, self.status['New'])
+        self.assertEqual(transition.declined_reason, self.reason)
+        self.assertAlmostEqual(
+            transition.time_in_previous.total_seconds(),
+            (transition.changed_at - entered).total_seconds(), delta=0.01)
+
+    def test_stage_summary(self):
+        first, second, _ = self.applications
+        Application.objects.filter(pk__in=[first.pk, second.pk]).transition(
+            self.status['New'])
+        with self.assertNumQueries(1):
+            summary = Application.objects.stage_summary()
+        self.assertEqual(list(summary), [self.status['New'].pk])
+        self.assertEqual(summary[self.status['New'].pk][0], 2)
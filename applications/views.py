@@ -3,6 +3,7 @@ from django.views.generic import FormView
 from django.shortcuts import render, get_object_or_404, redirect
 
 from applications.forms import ApplicationForm
+from common.validation import TRUSTED
 
 
 def create_application(request):
@@ -10,7 +11,8 @@ def create_application(request):
         form = ApplicationForm(request.POST)
         if form.is_valid():
             application = form.save(commit=False)
-            application.save()
+            # is_valid() already ran the model validation.
+            application.save(validation=TRUSTED)
     else:
         form = ApplicationForm()
     return render(request, 'applications/application_form.html', context={
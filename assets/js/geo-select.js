@@ -0,0 +1,51 @@
+// Cascading dropdowns of the geographic tree (see admin_console.geo).
+// A select with data-geo-parent only lists its bound value and the rows
+// without a parent (data-geo-orphan) when the page loads; it is filled
+// from the geo endpoint with the children of the row picked in its
+// parent, on load and whenever the parent changes, and gets the rows
+// without a parent back when the parent is cleared.
+(function($) {
+    'use strict';
+
+    function fill(select) {
+        var $select = $(select);
+        var $parent = $(select.form).find(
+            '[data-geo-field="' + $select.data('geo-parent') + '"]');
+        var selected = $select.val();
+        $select.find('option').filter(function() {
+            return this.value !== '';
+        }).remove();
+        if (!$parent.val()) {
+            $select.append($select.data('geo-orphans').clone())
+                .val(selected);
+            if ($select.val() !== selected) {
+                $select.val('');
+            }
+            $select.trigger('change');
+            return;
+        }
+        $.getJSON($select.data('geo-url') + $parent.data('geo-level') + '/' +
+                  $parent.val() + '/', function(data) {
+            $.each(data.children, function(_, child) {
+                $('<option>').val(child.id).text(child.name)
+                    .prop('selected', String(child.id) === selected)
+                    .appendTo($select);
+            });
+            $select.trigger('change');
+        });
+    }
+
+    $(function() {
+        $('select[data-geo-parent]').each(function() {
+            var select = this;
+            $(select).data('geo-orphans', $(select).find(
+                'option[data-geo-orphan]').clone().prop('selected', false));
+            $(select.form).on(
+                'change',
+                '[data-geo-field="' + $(select).data('geo-parent') + '"]',
+                function() { fill(select); });
+        });
+        // Parents fill their children in turn; start from the top.
+        $('select[data-geo-field]').not('[data-geo-parent]').trigger('change');
+    });
+})(jQuery);
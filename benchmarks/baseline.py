@@ -0,0 +1,53 @@
+"""
+Stored benchmark baseline. Results are nested as
+{suite: {case: summary}}, the same shape run_benchmarks prints.
+"""
+import json
+import os
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             'baseline.json')
+
+
+def load_baseline(path=BASELINE_PATH):
+    try:
+        with open(path) as baseline_file:
+            return json.load(baseline_file)
+    except FileNotFoundError:
+        return {}
+
+
+def save_baseline(results, path=BASELINE_PATH):
+    """Merges results into the stored baseline, suite by suite, so a
+    partial run does not drop the other suites."""
+    baseline = load_baseline(path)
+    for suite, cases in results.items():
+        baseline.setdefault(suite, {}).update(cases)
+    with open(path, 'w') as baseline_file:
+        json.dump(baseline, baseline_file, indent=2, sort_keys=True)
+        baseline_file.write('\n')
+
+
+def compare(results, baseline, tolerance=0.25):
+    """
+    Returns a list of human readable regressions. Query counts are
+    deterministic and must not grow at all; latency may drift up to
+    `tolerance` (a ratio) over the stored p95 before it is flagged.
+    """
+    regressions = []
+    for suite, cases in sorted(results.items()):
+        for case, summary in sorted(cases.items()):
+            previous = baseline.get(suite, {}).get(case)
+            if not previous:
+                continue
+            label = '%s.%s' % (suite, case)
+            if 'queries' in summary and 'queries' in previous:
+                if summary['queries'] > previous['queries']:
+                    regressions.append('%s: %s queries (baseline %s)' % (
+                        label, summary['queries'], previous['queries']))
+            if 'p95_ms' in summary and previous.get('p95_ms'):
+                limit = previous['p95_ms'] * (1 + tolerance)
+                if summary['p95_ms'] > limit:
+                    regressions.append('%s: p95 %.1fms (baseline %.1fms)' % (
+                        label, summary['p95_ms'], previous['p95_ms']))
+    return regressions
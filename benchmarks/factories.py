@@ -0,0 +1,173 @@
+"""
+Factories used to seed the benchmark database. Objects are created
+through the regular model save() paths so signals, validation and
+history behave as they do in production.
+"""
+import random
+from collections import namedtuple
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import Group
+from django.utils import timezone
+
+from accounts.models import NationalId, User
+from admin_console.models import (
+    AreaOfExpertise,
+    CallCenter,
+    CityTown,
+    Country,
+    Language,
+    StateProvinceRegion,
+)
+from applications.models import Application
+
+PASSWORD = 'benchmark-password'
+ADMIN_INDEX = 900000
+FIRST_NAMES = ('Ana', 'Luis', 'Maria', 'Jose', 'Carmen', 'Pedro', 'Rosa',
+               'Juan', 'Elena', 'Miguel', 'Sofia', 'Carlos')
+LAST_NAMES = ('Perez', 'Gomez', 'Rodriguez', 'Martinez', 'Santos',
+              'Reyes', 'Jimenez', 'Castillo', 'Almonte', 'Ferreira')
+
+LOOKUPS = {
+    CityTown: ('Santo Domingo', 'Santiago', 'La Romana', 'San Cristobal',
+               'Puerto Plata', 'La Vega', 'Bani', 'Higuey'),
+    CallCenter: ('Teleperformance', 'Convergys', 'Sitel', 'Alorica',
+                 'Startek', 'Transcom'),
+    Language: ('English', 'Spanish', 'French', 'Portuguese', 'Italian'),
+    AreaOfExpertise: ('Customer service', 'Sales', 'Technical support',
+                      'Collections', 'Retention', 'Back office'),
+}
+
+# Region of each city in LOOKUPS, so the cities are in the form's
+# geographic tree.
+COUNTRY = 'Dominican Republic'
+REGIONS = {
+    'Ozama': ('Santo Domingo',),
+    'Cibao Norte': ('Santiago', 'Puerto Plata'),
+    'Cibao Sur': ('La Vega',),
+    'Valdesia': ('San Cristobal', 'Bani'),
+    'Yuma': ('La Romana', 'Higuey'),
+}
+
+_hashed_password = None
+
+
+def hashed_password():
+    """Hashes PASSWORD once; seeding thousands of users with a fresh
+    PBKDF2 run each would dominate the seeding time."""
+    global _hashed_password
+    if _hashed_password is None:
+        _hashed_password = make_password(PASSWORD)
+    return _hashed_password
+
+
+def national_id_number(index):
+    return '%011d' % (40200000000 + index,)
+
+
+def make_lookups():
+    """Creates the curated lookup rows shown in the application form."""
+    created = {}
+    for model, names in LOOKUPS.items():
+        created[model] = [
+            model.objects.get_or_create(name=name,
+                                        defaults={'display_in_form': True})[0]
+            for name in names
+        ]
+    country = Country.objects.get_or_create(
+        name=COUNTRY, defaults={'display_in_form': True})[0]
+    cities = {city.name: city for city in created[CityTown]}
+    for name, city_names in REGIONS.items():
+        region = StateProvinceRegion.objects.get_or_create(
+            name=name, defaults={'display_in_form': True,
+                                 'country': country})[0]
+        for city_name in city_names:
+            city = cities[city_name]
+            if city.state_province_region_id != region.pk:
+                city.state_province_region = region
+                city.save()
+    return created
+
+
+def make_user(index, groups=(), is_active=True, **extra_fields):
+    """Creates a verified user with a national ID. Profile and
+    EmailAddress rows are created by the accounts signals."""
+    rng = random.Random(index)
+    user = User(
+        username='bench-user-%s' % (index,),
+        email='bench-user-%s@example.com' % (index,),
+        first_names=rng.choice(FIRST_NAMES),
+        last_names=rng.choice(LAST_NAMES),
+        birth_date=timezone.now().date() - timezone.timedelta(
+            days=365 * rng.randint(19, 55)),
+        is_active=is_active,
+        is_verified=is_active,
+        accepted_tos=True,
+        password=hashed_password(),
+        **extra_fields
+    )
+    user.save()
+    NationalId.objects.create(id_number=national_id_number(index),
+                              user=user, is_verified=is_active)
+    if groups:
+        user.groups.set(Group.objects.filter(name__in=groups))
+    return user
+
+
+def make_users(count, start=0, **kwargs):
+    return [make_user(index, **kwargs) for index in range(start, start + count)]
+
+
+def application_data(index, lookups):
+    """Returns the model field values for a realistic application."""
+    rng = random.Random(index)
+    return {
+        'first_names': rng.choice(FIRST_NAMES),
+        'last_names': rng.choice(LAST_NAMES),
+        'primary_phone': '809%07d' % (rng.randint(0, 9999999),),
+        'email': 'applicant-%s@example.com' % (index,),
+        'national_id_number': '%011d' % (10000000000 + index,),
+        'birth_date': timezone.now().date() - timezone.timedelta(
+            days=365 * rng.randint(19, 55)),
+        'address_line_one': 'Calle %s #%s' % (rng.randint(1, 90),
+                                              rng.randint(1, 300)),
+        'city_or_town': rng.choice(lookups[CityTown]),
+        'previous_call_center_xp': rng.random() < 0.4,
+        'pre_screen': rng.random() < 0.6,
+        'hire_iq': rng.randint(40, 100),
+        'tss': rng.random() < 0.3,
+        'hm_interview': rng.random() < 0.15,
+    }
+
+
+def make_application(index, lookups):
+    rng = random.Random(index)
+    application = Application(**application_data(index, lookups))
+    application.save()
+    application.languages.set(rng.sample(lookups[Language], 2))
+    application.areas_of_expertise.set(
+        rng.sample(lookups[AreaOfExpertise], 2))
+    if application.previous_call_center_xp:
+        application.previous_call_center.set(
+            rng.sample(lookups[CallCenter], 1))
+    return application
+
+
+def make_applications(count, lookups, start=0):
+    return [make_application(index, lookups)
+            for index in range(start, start + count)]
+
+
+Seed = namedtuple('Seed', ('users', 'admin', 'lookups'))
+
+
+def seed_database(users=200, applications=1000):
+    """
+    Seeds the volumes the journeys run against and returns the handles
+    they need. Run create_initial_groups first so the groups exist.
+    """
+    lookups = make_lookups()
+    admin = make_user(ADMIN_INDEX, groups=('superuser',))
+    seeded_users = make_users(users, groups=('candidate',))
+    make_applications(applications, lookups)
+    return Seed(users=seeded_users, admin=admin, lookups=lookups)
@@ -0,0 +1,208 @@
+"""
+Core user journeys driven through the Django test client. Each journey
+prepares whatever it needs outside of the measured block, then issues
+the requests a real user would.
+"""
+from django.db import close_old_connections
+from django.test import Client
+from django.urls import reverse
+from django.utils.encoding import force_bytes
+from django.utils.http import urlsafe_base64_encode
+
+from accounts.tokens import verify_token_generator
+from accounts.views import INTERNAL_VERIFICATION_URL_TOKEN
+from admin_console.models import Language
+from benchmarks import factories
+from benchmarks.stats import Sampler
+
+# Offsets keep the rows created by each journey apart from the seeded
+# ones and from each other.
+REGISTRATION_OFFSET = 1000000
+VERIFICATION_OFFSET = 2000000
+APPLICATION_OFFSET = 3000000
+
+
+class JourneyError(Exception):
+    """Raised when a journey gets a response it did not expect, which
+    would make its timings meaningless."""
+
+
+class Journey:
+    """Base journey. Subclasses implement measure() and optionally
+    setup() and prepare()."""
+    name = None
+    expected_status = (200,)
+
+    def __init__(self, seed):
+        self.seed = seed
+        self.client = Client()
+
+    def setup(self):
+        """Runs once, before any iteration."""
+
+    def prepare(self, iteration):
+        """Runs before each iteration, outside of the measured block."""
+
+    def measure(self, iteration):
+        raise NotImplementedError
+
+    def check(self, response):
+        if response.status_code not in self.expected_status:
+            form = response.context and response.context.get('form')
+            raise JourneyError('%s: unexpected status %s %s' % (
+                self.name, response.status_code,
+                form.errors.as_text() if form else ''))
+
+    def run(self, iterations, warmup=2):
+        self.setup()
+        for iteration in range(warmup):
+            self.prepare(-iteration - 1)
+            self.check(self.measure(-iteration - 1))
+        sampler = Sampler()
+        for iteration in range(iterations):
+            self.prepare(iteration)
+            with sampler.sample():
+                response = self.measure(iteration)
+            self.check(response)
+        return sampler.summary()
+
+
+class RegistrationJourney(Journey):
+    name = 'registration'
+    expected_status = (302,)
+
+    def measure(self, iteration):
+        index = REGISTRATION_OFFSET + iteration
+        return self.client.post(reverse('accounts:register'), {
+            'first_names': 'Bench',
+            'last_names': 'Registrant',
+            'username': 'registrant-%s' % (index,),
+            'email': 'registrant-%s@example.com' % (index,),
+            'birth_date': '1990-01-01',
+            'national_id_type': 0,
+            'national_id_number': factories.national_id_number(index),
+            'accepted_tos': True,
+            'password1': factories.PASSWORD,
+            'password2': factories.PASSWORD,
+        })
+
+
+class LoginJourney(Journey):
+    name = 'login'
+    expected_status = (302,)
+
+    def prepare(self, iteration):
+        self.client.logout()
+
+    def measure(self, iteration):
+        user = self.seed.users[iteration % len(self.seed.users)]
+        return self.client.post(reverse('accounts:login'), {
+            'username': user.username,
+            'password': factories.PASSWORD,
+        })
+
+
+class VerificationJourney(Journey):
+    name = 'verification'
+
+    def prepare(self, iteration):
+        index = VERIFICATION_OFFSET + iteration
+        self.user = factories.make_user(index, is_active=False)
+
+    def measure(self, iteration):
+        uidb64 = urlsafe_base64_encode(force_bytes(self.user.pk)).decode()
+        response = self.client.get(reverse('accounts:register_verify', kwargs={
+            'uidb64': uidb64,
+            'token': verify_token_generator.make_token(self.user),
+        }))
+        if response.status_code != 302:
+            return response
+        return self.client.get(reverse('accounts:register_verify', kwargs={
+            'uidb64': uidb64,
+            'token': INTERNAL_VERIFICATION_URL_TOKEN,
+        }))
+
+
+class ApplicationJourney(Journey):
+    name = 'application'
+
+    def check(self, response):
+        super(ApplicationJourney, self).check(response)
+        if response.context['form'].errors:
+            raise JourneyError('%s: form rejected: %s' % (
+                self.name, response.context['form'].errors.as_text()))
+
+    def measure(self, iteration):
+        index = APPLICATION_OFFSET + iteration
+        data = factories.application_data(index, self.seed.lookups)
+        post = {
+            'application-%s' % (key,): value
+            for key, value in data.items()
+            if key in ('first_names', 'last_names', 'primary_phone', 'email',
+                       'national_id_number', 'birth_date', 'address_line_one')
+        }
+        post['application-national_id_type'] = 0
+        post['application-gender'] = 0
+        region = data['city_or_town'].state_province_region
+        post['application-country'] = region.country_id
+        post['application-region'] = region.pk
+        post['application-city_or_town'] = data['city_or_town'].pk
+        post['application-languages'] = [
+            language.pk for language in self.seed.lookups[Language][:2]]
+        return self.client.post(reverse('applications:apply'), post)
+
+
+class AdminJourney(Journey):
+    """Base for admin console pages, browsed as a superuser."""
+    url_name = None
+
+    def setup(self):
+        self.client.force_login(self.seed.admin)
+
+    def measure(self, iteration):
+        return self.client.get(reverse(self.url_name))
+
+
+class AdminUserListJourney(AdminJourney):
+    name = 'admin_user_list'
+    url_name = 'admin_console:user-list'
+
+
+class AdminGroupListJourney(AdminJourney):
+    name = 'admin_group_list'
+    url_name = 'admin_console:group-list'
+
+
+class PasswordResetJourney(Journey):
+    """A session write followed by a read and a pop: the reset request
+    grants access to the done page once."""
+    name = 'password_reset'
+
+    def measure(self, iteration):
+        response = self.client.post(reverse('accounts:password_reset'), {
+            'email_or_username': 'nobody-%s@example.com' % (iteration,)})
+        if response.status_code != 302:
+            return response
+        return self.client.get(reverse('accounts:password_reset_done'))
+
+
+class HealthCheckJourney(Journey):
+    """Not a user journey: the cheapest request that touches the
+    database, used to isolate connection setup cost."""
+    name = 'health_check'
+
+    def measure(self, iteration):
+        # The test client keeps connections open across requests; do
+        # what the request_started handler does in a real server.
+        close_old_connections()
+        return self.client.get(reverse('health'))
+
+
+JOURNEYS = (
+    RegistrationJourney,
+    LoginJourney,
+    VerificationJourney,
+    ApplicationJourney,
+    AdminUserListJourney,
+    AdminGroupListJourney,
+)
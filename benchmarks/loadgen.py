@@ -0,0 +1,90 @@
+"""
+Minimal asyncio HTTP load generator. It only depends on the standard
+library so it can point at runserver, daphne or a staging host alike.
+"""
+import asyncio
+import time
+from urllib.parse import urlsplit
+
+from benchmarks.stats import summarize
+
+
+class LoadResult:
+    """Latencies and failures collected for one path."""
+    def __init__(self, path):
+        self.path = path
+        self.latencies = []
+        self.statuses = {}
+        self.errors = 0
+
+    def summary(self):
+        summary = summarize(self.latencies)
+        summary['errors'] = self.errors
+        summary['statuses'] = {str(k): v for k, v in sorted(self.statuses.items())}
+        return summary
+
+
+async def fetch(host, port, path, headers=None, timeout=30):
+    """
+    Issues a single GET and returns (status, latency). The connection
+    is closed after each request, matching what the development servers
+    support.
+    """
+    start = time.perf_counter()
+    reader, writer = await asyncio.wait_for(
+        asyncio.open_connection(host, port), timeout)
+    lines = ['GET %s HTTP/1.1' % (path,),
+             'Host: %s:%s' % (host, port),
+             'Connection: close']
+    lines.extend('%s: %s' % item for item in (headers or {}).items())
+    writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1'))
+    status_line = await asyncio.wait_for(reader.readline(), timeout)
+    await asyncio.wait_for(reader.read(), timeout)
+    writer.close()
+    return int(status_line.split()[1]), time.perf_counter() - start
+
+
+async def _worker(queue, host, port, results, headers):
+    while True:
+        try:
+            path = queue.get_nowait()
+        except asyncio.QueueEmpty:
+            return
+        result = results[path]
+        try:
+            status, latency = await fetch(host, port, path, headers)
+        except (OSError, asyncio.TimeoutError, IndexError, ValueError):
+            result.errors += 1
+            continue
+        result.statuses[status] = result.statuses.get(status, 0) + 1
+        if status < 400:
+            result.latencies.append(latency)
+        else:
+            result.errors += 1
+
+
+async def _run(base_url, paths, requests, concurrency, headers):
+    parts = urlsplit(base_url)
+    host, port = parts.hostname, parts.port or 80
+    results = {path: LoadResult(path) for path in paths}
+    queue = asyncio.Queue()
+    for index in range(requests):
+        queue.put_nowait(paths[index % len(paths)])
+    await asyncio.gather(*(
+        _worker(queue, host, port, results, headers)
+        for _ in range(concurrency)))
+    return results
+
+
+def run_load(base_url, paths, requests=200, concurrency=10, headers=None):
+    """
+    Spreads `requests` GETs over `paths` using `concurrency` concurrent
+    connections and returns a {path: summary} dict.
+    """
+    loop = asyncio.new_event_loop()
+    try:
+        results = loop.run_until_complete(
+            _run(base_url, list(paths), requests, concurrency, headers))
+    finally:
+        loop.close()
+    return {path: result.summary() for path, result in results.items()}
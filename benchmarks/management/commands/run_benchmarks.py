@@ -0,0 +1,98 @@
+"""Seeds a throwaway database, runs the benchmark suites and compares
+them against the stored baseline."""
+import json
+from io import StringIO
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.test import override_settings
+from django.test.utils import (
+    setup_databases,
+    setup_test_environment,
+    teardown_databases,
+    teardown_test_environment,
+)
+
+from benchmarks.baseline import (
+    BASELINE_PATH,
+    compare,
+    load_baseline,
+    save_baseline,
+)
+from benchmarks.factories import seed_database
+from benchmarks.suites import SUITES
+
+
+class Command(BaseCommand):
+    help = ('Runs the benchmark suites against a freshly seeded test '
+            'database and compares them against the stored baseline.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('suites', nargs='*',
+                            help='Suites to run (default: all). One of: %s.'
+                                 % (', '.join(SUITES),))
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--applications', type=int, default=1000)
+        parser.add_argument('--iterations', type=int, default=30)
+        parser.add_argument('--journey', dest='journeys', action='append',
+                            help='Restrict the journeys suite to this '
+                                 'journey; may be repeated.')
+        parser.add_argument('--url', help='Base URL for the load generator. '
+                            'A live server is started when omitted.')
+        parser.add_argument('--requests', type=int, default=400)
+        parser.add_argument('--concurrency', type=int, default=10)
+        parser.add_argument('--baseline', default=BASELINE_PATH)
+        parser.add_argument('--save-baseline', action='store_true',
+                            help='Store these results as the new baseline.')
+        parser.add_argument('--tolerance', type=float, default=0.25,
+                            help='Allowed p95 latency growth ratio.')
+        parser.add_argument('--output', help='Also write results as JSON here.')
+
+    def handle(self, *args, **options):
+        suites = options['suites'] or list(SUITES)
+        unknown = set(suites) - set(SUITES)
+        if unknown:
+            raise CommandError('Unknown suites: %s' % (', '.join(sorted(unknown)),))
+        setup_test_environment()
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            call_command('create_initial_groups', stdout=StringIO())
+            self.stdout.write('Seeding %(users)s users and %(applications)s '
+                              'applications...' % options)
+            seed = seed_database(options['users'], options['applications'])
+            results = {}
+            with override_settings(DEBUG=False):
+                for name in suites:
+                    self.stdout.write('Running %s...' % (name,))
+                    results[name] = SUITES[name](options, seed)
+        finally:
+            teardown_databases(old_config, verbosity=0)
+            teardown_test_environment()
+
+        self.report(results)
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(results, output, indent=2, sort_keys=True)
+        if options['save_baseline']:
+            save_baseline(results, options['baseline'])
+            self.stdout.write(self.style.SUCCESS(
+                'Baseline saved to %s' % (options['baseline'],)))
+            return
+        regressions = compare(results, load_baseline(options['baseline']),
+                              options['tolerance'])
+        if regressions:
+            raise CommandError('Regressions against baseline:\n  ' +
+                               '\n  '.join(regressions))
+        self.stdout.write(self.style.SUCCESS('No regressions against baseline.'))
+
+    def report(self, results):
+        row = '  %-28s %8s %10s %10s %10s %8s'
+        for suite, cases in results.items():
+            self.stdout.write('\n%s' % (suite,))
+            self.stdout.write(row % ('case', 'count', 'p50 ms', 'p95 ms',
+                                     'p99 ms', 'queries'))
+            for case, summary in cases.items():
+                self.stdout.write(row % (
+                    case, summary['count'], summary['p50_ms'],
+                    summary['p95_ms'], summary['p99_ms'],
+                    summary.get('queries', '-')))
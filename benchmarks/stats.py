@@ -0,0 +1,79 @@
+"""Latency and query-count bookkeeping for the benchmark suite."""
+import math
+import time
+
+from django.db import connections
+from django.test.utils import CaptureQueriesContext
+
+
+def percentile(values, pct):
+    """
+    Returns the pct-th percentile of values using nearest-rank, which
+    is stable for the small sample sizes used in review runs.
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(int(math.ceil(pct / 100.0 * len(ordered))), 1)
+    return ordered[rank - 1]
+
+
+def summarize(latencies, queries=None):
+    """
+    Reduces raw samples to the figures stored in the baseline. Latencies
+    are expected in seconds and reported in milliseconds.
+    """
+    millis = [l * 1000.0 for l in latencies]
+    summary = {
+        'count': len(millis),
+        'mean_ms': round(sum(millis) / len(millis), 3) if millis else 0.0,
+        'p50_ms': round(percentile(millis, 50), 3),
+        'p95_ms': round(percentile(millis, 95), 3),
+        'p99_ms': round(percentile(millis, 99), 3),
+    }
+    if queries is not None:
+        summary['queries'] = max(queries) if queries else 0
+    return summary
+
+
+class Sampler:
+    """
+    Collects wall-clock latency and executed query count for each
+    measured call.
+    e.g.
+        sampler = Sampler()
+        with sampler.sample():
+            client.get(url)
+        sampler.summary()
+    """
+    def __init__(self, using='default'):
+        self.using = using
+        self.latencies = []
+        self.queries = []
+
+    def sample(self):
+        return _Sample(self)
+
+    def summary(self):
+        return summarize(self.latencies, self.queries)
+
+
+class _Sample:
+    def __init__(self, sampler):
+        self.sampler = sampler
+        self.context = CaptureQueriesContext(connections[sampler.using])
+
+    def __enter__(self):
+        # CaptureQueriesContext counts by the length of queries_log, which
+        # stops growing once the bounded log is full (seeding fills it).
+        self.context.connection.queries_log.clear()
+        self.context.__enter__()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        elapsed = time.perf_counter() - self.start
+        self.context.__exit__(exc_type, exc_value, traceback)
+        if exc_type is None:
+            self.sampler.latencies.append(elapsed)
+            self.sampler.queries.append(len(self.context))
@@ -0,0 +1,632 @@
+"""
+Benchmark suites known to run_benchmarks. Each suite takes the command
+options and the seeded data and returns {case: summary}.
+"""
+import itertools
+import math
+import random
+import shutil
+import tempfile
+import tracemalloc
+from collections import OrderedDict
+
+import numpy as np
+
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.models import Group, Permission
+from django.contrib.contenttypes.models import ContentType
+from django.contrib.staticfiles.handlers import StaticFilesHandler
+from django.db import (
+    DEFAULT_DB_ALIAS,
+    connections as db_connections,
+    transaction,
+)
+from django.test import RequestFactory, override_settings
+from django.test.testcases import LiveServerThread
+from django.urls import reverse
+
+from accounts import permission_bits
+from accounts.models import (
+    AreaCode,
+    EmailAddress,
+    ModGroup,
+    NationalId,
+    PhoneNumber,
+    Profile,
+    User,
+)
+from admin_console.access_matrix import PER_PAGE, AccessMatrix
+from admin_console.distance import (
+    EARTH_RADIUS_KM,
+    haversine_km,
+    rank_by_distance,
+)
+from admin_console.exports import ApplicationExport, csv_lines, write_xlsx
+from admin_console.models import (
+    Address,
+    AreaOfExpertise,
+    CallCenter,
+    CityTown,
+    Language,
+)
+from admin_console.views import AccessMatrixView
+from applications import analytics, matching
+from applications.models import Application, Requisition
+from benchmarks.journeys import (
+    JOURNEYS,
+    HealthCheckJourney,
+    PasswordResetJourney,
+)
+from benchmarks.factories import make_users
+from benchmarks.loadgen import run_load
+from benchmarks.stats import Sampler
+from benchmarks.synthetic import LATITUDES, LONGITUDES
+from common.validation import POLICIES, RAW, validation_policy
+
+
+def journeys(options, seed):
+    selected = options.get('journeys') or [j.name for j in JOURNEYS]
+    results = OrderedDict()
+    for journey_class in JOURNEYS:
+        if journey_class.name in selected:
+            journey = journey_class(seed)
+            results[journey.name] = journey.run(options['iterations'])
+    return results
+
+
+def load(options, seed):
+    """
+    Drives the anonymous entry pages with concurrent connections. When
+    no --url is given a live server is started on the benchmark database.
+    """
+    paths = [reverse('home'), reverse('accounts:login'),
+             reverse('accounts:register'), reverse('applications:apply')]
+    if options.get('url'):
+        return run_load(options['url'], paths, options['requests'],
+                        options['concurrency'])
+    with override_settings(ALLOWED_HOSTS=['*']):
+        server = LiveServerThread('localhost', StaticFilesHandler)
+        server.daemon = True
+        server.start()
+        server.is_ready.wait()
+        if server.error:
+            raise server.error
+        try:
+            return run_load('http://localhost:%s' % (server.port,), paths,
+                            options['requests'], options['concurrency'])
+        finally:
+            server.terminate()
+
+
+def connections(options, seed):
+    """
+    Times the health check endpoint with a connection opened for every
+    request (CONN_MAX_AGE=0, the old behaviour) and with a persistent
+    one, so the difference is the connection setup cost.
+    """
+    connection = db_connections[DEFAULT_DB_ALIAS]
+    original = connection.settings_dict['CONN_MAX_AGE']
+    results = OrderedDict()
+    try:
+        for case, max_age in (('per_request', 0), ('persistent', 600)):
+            connection.close()
+            connection.settings_dict['CONN_MAX_AGE'] = max_age
+            results[case] = HealthCheckJourney(seed).run(options['iterations'])
+    finally:
+        connection.close()
+        connection.settings_dict['CONN_MAX_AGE'] = original
+    return results
+
+
+SESSION_ENGINES = OrderedDict((
+    ('db', 'django.contrib.sessions.backends.db'),
+    ('cached_db', 'django.contrib.sessions.backends.cached_db'),
+    ('signed_cookies', 'django.contrib.sessions.backends.signed_cookies'),
+))
+
+
+def sessions(options, seed):
+    """
+    Runs the password reset journey, which writes, reads and pops a
+    session flag, under each session engine. Session table churn shows
+    up as the difference in queries between the engines.
+    """
+    results = OrderedDict()
+    for case, engine in SESSION_ENGINES.items():
+        with override_settings(SESSION_ENGINE=engine):
+            results[case] = PasswordResetJourney(seed).run(
+                options['iterations'])
+    return results
+
+
+def validation(options, seed):
+    """
+    Re-saves existing rows of every model with a validating save() under
+    each validation policy; the difference between 'full' and the others
+    is what full_clean() costs per save.
+    """
+    count = min(options['iterations'], len(seed.users))
+    users = seed.users[:count]
+    area_code = AreaCode.objects.get_or_create(
+        code='809', defaults={'name': '809', 'display_in_form': True})[0]
+    phones = [PhoneNumber.objects.get_or_create(user=user, defaults={
+        'phone_number': '8095550100', 'area_code': area_code})[0]
+        for user in users]
+    addresses = [Address.objects.get_or_create(user=user, defaults={
+        'name': 'Home', 'associated_name': 'Home',
+        'address_line_one': 'Calle 1 #1', 'phone_number': phone})[0]
+        for user, phone in zip(users, phones)]
+    languages = seed.lookups[Language]
+    rows = OrderedDict((
+        ('User', users),
+        ('EmailAddress', list(EmailAddress.objects.filter(user__in=users))),
+        ('PhoneNumber', phones),
+        ('NationalId', list(NationalId.objects.filter(user__in=users))),
+        ('AreaCode', [area_code] * count),
+        ('Language', [languages[i % len(languages)] for i in range(count)]),
+        ('Address', addresses),
+        ('Application', list(Application.objects.order_by('pk')[:count])),
+    ))
+    results = OrderedDict()
+    for label, objs in rows.items():
+        # Loads the related objects save() touches outside the samples.
+        for obj in objs:
+            obj.save(validation=RAW)
+        for policy in POLICIES:
+            sampler = Sampler()
+            for obj in objs:
+                with sampler.sample():
+                    obj.save(validation=policy)
+            results['%s.%s' % (label, policy)] = sampler.summary()
+    return results
+
+
+HISTORY_MODES = OrderedDict((
+    ('sync', {'HISTORY_RECORDING': 'sync'}),
+    ('commit', {'HISTORY_RECORDING': 'commit'}),
+    ('commit_changed_only', {'HISTORY_RECORDING': 'commit',
+                             'HISTORY_CHANGED_ONLY': True}),
+))
+HISTORY_MODELS = (User, Profile, EmailAddress, NationalId, AreaCode)
+BULK_EDIT_ROWS = 20
+
+
+def history_rows():
+    return sum(model.history.count() for model in HISTORY_MODELS)
+
+
+def history(options, seed):
+    """
+    Write amplification of history recording under each mode of
+    common.history. profile_edit saves a user whose name changed with
+    its profile, email address and national ID unchanged, as an edit
+    form does; bulk_edit renames BULK_EDIT_ROWS area codes in one
+    transaction. Summaries add the history rows written per iteration.
+    """
+    users = seed.users[:options['iterations']]
+    codes = [AreaCode.objects.get_or_create(
+        code='%s' % (900 + index,), defaults={'name': 'Bench %s' % (index,)})[0]
+             for index in range(BULK_EDIT_ROWS)]
+    edits = itertools.count()
+
+    def profile_edit(iteration, sampler):
+        user = User.objects.get(pk=users[iteration % len(users)].pk)
+        related = [Profile.objects.get(user=user),
+                   EmailAddress.objects.get(user=user, is_primary=True),
+                   NationalId.objects.get(user=user)]
+        with sampler.sample(), transaction.atomic():
+            user.first_names = 'Edited %s' % (next(edits),)
+            user.save()
+            for obj in related:
+                obj.save()
+
+    def bulk_edit(iteration, sampler):
+        rows = list(AreaCode.objects.filter(pk__in=[c.pk for c in codes]))
+        with sampler.sample(), transaction.atomic():
+            for row in rows:
+                row.name = 'Bench %s' % (next(edits),)
+                row.save()
+
+    results = OrderedDict()
+    for workload in (profile_edit, bulk_edit):
+        for mode, overrides in HISTORY_MODES.items():
+            sampler = Sampler()
+            before = history_rows()
+            with override_settings(**overrides), validation_policy(RAW):
+                for iteration in range(options['iterations']):
+                    workload(iteration, sampler)
+            case = '%s.%s' % (workload.__name__, mode)
+            results[case] = sampler.summary()
+            results[case]['history_rows'] = round(
+                (history_rows() - before) / options['iterations'], 1)
+    return results
+
+
+CANDIDATES = 50000
+
+
+def python_haversine_km(lat, lng, points):
+    """The per-row version haversine_km replaces, for comparison."""
+    lat, lng = math.radians(lat), math.radians(lng)
+    distances = []
+    for other_lat, other_lng in points:
+        other_lat, other_lng = math.radians(other_lat), math.radians(other_lng)
+        a = (math.sin((other_lat - lat) / 2) ** 2 + math.cos(lat) *
+             math.cos(other_lat) * math.sin((other_lng - lng) / 2) ** 2)
+        distances.append(2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a)))
+    return sorted(distances)
+
+
+def distance(options, seed):
+    """
+    Ranks CANDIDATES random points against a site with the NumPy scorer
+    and with a per-row Python loop, then runs the whole ranking, queries
+    included, over the seeded applications.
+    """
+    rng = random.Random(0)
+    site = CallCenter.objects.create(name='Benchmark site',
+                                     latitude=18.4861, longitude=-69.9312)
+    for city in seed.lookups[CityTown]:
+        city.latitude = rng.uniform(*LATITUDES)
+        city.longitude = rng.uniform(*LONGITUDES)
+        city.save()
+    points = [(rng.uniform(*LATITUDES), rng.uniform(*LONGITUDES))
+              for _ in range(CANDIDATES)]
+    lats, lngs = np.array(points).T
+    results = OrderedDict()
+    cases = (
+        ('numpy_%s' % (CANDIDATES,), lambda: np.sort(haversine_km(
+            site.latitude, site.longitude, lats, lngs))),
+        ('python_%s' % (CANDIDATES,), lambda: python_haversine_km(
+            site.latitude, site.longitude, points)),
+        ('ranking', lambda: rank_by_distance(Application.objects.all(),
+                                             site)),
+    )
+    for case, run in cases:
+        sampler = Sampler()
+        for _ in range(options['iterations']):
+            with sampler.sample():
+                run()
+        results[case] = sampler.summary()
+    return results
+
+
+def synthetic_index(count, rng):
+    """A FeatureIndex of `count` random applications, built in memory."""
+    index = matching.FeatureIndex('benchmark')
+    index.pks = np.arange(1, count + 1, dtype=np.int64)
+    index.city = rng.randint(1, 11, count)
+    index.hire_iq = rng.uniform(40, 100, count)
+    index.tss = rng.random_sample(count) < 0.3
+    index.call_center_xp = rng.random_sample(count) < 0.4
+    for name in matching.MULTI_HOT:
+        index.bits[name] = rng.randint(0, 2 ** 12, (count, 1)).astype(np.uint64)
+    # 0 (no status) to 6; 5 and 6 stand for the closed statuses.
+    index.status = rng.randint(0, 7, count)
+    return index
+
+
+def matching_suite(options, seed):
+    """
+    Scores a requisition against CANDIDATES * 6 synthetic feature
+    vectors, and runs the full shortlist (index sync, requisition and
+    application queries) over the seeded applications.
+    """
+    index = synthetic_index(CANDIDATES * 6, np.random.RandomState(0))
+    requisition = Requisition.objects.create(
+        title='Benchmark', call_center=seed.lookups[CallCenter][0],
+        city_or_town=seed.lookups[CityTown][0], min_hire_iq=50)
+    requisition.languages.set(seed.lookups[Language][:1])
+    requisition.areas_of_expertise.set(seed.lookups[AreaOfExpertise][:2])
+    languages = [language.pk for language in seed.lookups[Language][:1]]
+    areas = [area.pk for area in seed.lookups[AreaOfExpertise][:2]]
+    matching.shortlist(requisition)  # builds the index
+    cases = (
+        ('top50_of_%s' % (len(index),),
+         lambda: index.top(requisition, 50, languages, areas, (5, 6))),
+        ('shortlist', lambda: matching.shortlist(requisition)),
+    )
+    results = OrderedDict()
+    for case, run in cases:
+        sampler = Sampler()
+        for _ in range(options['iterations']):
+            with sampler.sample():
+                run()
+        results[case] = sampler.summary()
+    return results
+
+
+SNAPSHOT_ROWS = 1000000
+
+
+def synthetic_snapshot(count, rng):
+    """An analytics.Snapshot of `count` random applications over two
+    years, built in memory."""
+    start = int((analytics.EPOCH.replace(year=2017) -
+                 analytics.EPOCH).total_seconds())
+    columns = {
+        'pk': np.arange(1, count + 1, dtype=np.int64),
+        'applied_at': np.sort(rng.randint(start, start + 730 * 86400,
+                                          count)).astype(np.int64),
+        'city_or_town': rng.randint(1, 11, count).astype(np.int32),
+        'pre_screen': rng.random_sample(count) < 0.6,
+        'hm_interview': rng.random_sample(count) < 0.3,
+        'previous_call_center_xp': rng.random_sample(count) < 0.4,
+        'languages': rng.randint(0, 2 ** 7, (count, 1)).astype(np.uint64),
+    }
+    names = {'city_or_town': {str(pk): 'City %s' % (pk,)
+                              for pk in range(1, 11)},
+             'languages': {str(pk): 'Language %s' % (pk,)
+                           for pk in range(1, 7)}}
+    return analytics.Snapshot(columns, {'names': names})
+
+
+def analytics_suite(options, seed):
+    """
+    Cohort conversion over SNAPSHOT_ROWS synthetic applications, and a
+    snapshot of the seeded ones (queries grow with chunks only).
+    """
+    snapshot = synthetic_snapshot(SNAPSHOT_ROWS, np.random.RandomState(0))
+    directory = tempfile.mkdtemp(prefix='ta_platform-benchmark-')
+    english = snapshot.has('languages', 1)
+    cases = (
+        ('weekly_conversion_%s' % (SNAPSHOT_ROWS,),
+         lambda: snapshot.conversion('week', 'pre_screen', 'hm_interview')),
+        ('language_cohorts_%s' % (SNAPSHOT_ROWS,),
+         lambda: snapshot.conversion('languages', 'pre_screen',
+                                     'hm_interview')),
+        ('xp_conversion_english_%s' % (SNAPSHOT_ROWS,),
+         lambda: snapshot.conversion('previous_call_center_xp', 'pre_screen',
+                                     'hm_interview', where=english)),
+        ('take_snapshot', lambda: analytics.take_snapshot(directory, 500)),
+    )
+    results = OrderedDict()
+    try:
+        for case, run in cases:
+            sampler = Sampler()
+            for _ in range(options['iterations']):
+                with sampler.sample():
+                    run()
+            results[case] = sampler.summary()
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    return results
+
+
+EXPORT_CHUNK = 200
+
+
+def exports(options, seed):
+    """
+    Exports every seeded application as CSV and as XLSX in chunks of
+    EXPORT_CHUNK rows. Each summary also has the peak Python memory in
+    KB, which should not grow with the number of applications.
+    """
+    def export_csv():
+        for _ in csv_lines(ApplicationExport(), EXPORT_CHUNK):
+            pass
+
+    def export_xlsx():
+        with tempfile.TemporaryFile() as output:
+            write_xlsx(ApplicationExport(), output, EXPORT_CHUNK)
+
+    results = OrderedDict()
+    for case, run in (('csv', export_csv), ('xlsx', export_xlsx)):
+        sampler, peaks = Sampler(), []
+        for _ in range(max(options['iterations'] // 10, 1)):
+            tracemalloc.start()
+            with sampler.sample():
+                run()
+            peaks.append(tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+        results[case] = sampler.summary()
+        results[case]['peak_kb'] = max(peaks) // 1024
+    return results
+
+
+ROLE_PERMISSIONS = 40
+PERMISSION_CHECKS = 25
+PERMISSION_USERS_START = 800000
+
+
+def uncompiled_has_perm(user, perm, backend=ModelBackend()):
+    """has_perm as it was before accounts.permission_bits: a superuser
+    group query per check, then ModelBackend's per-instance cache."""
+    if 'superuser' in user.groups.values_list('name', flat=True):
+        return True
+    if not hasattr(user, '_uncompiled_perms'):
+        user._uncompiled_perms = {
+            '%s.%s' % (app_label, codename)
+            for perms in (backend._get_user_permissions(user),
+                          backend._get_group_permissions(user))
+            for app_label, codename in perms.values_list(
+                'content_type__app_label', 'codename')}
+    return perm in user._uncompiled_perms
+
+
+def permissions(options, seed):
+    """
+    A request's worth of permission checks, PERMISSION_CHECKS has_perm
+    calls on a freshly loaded user, for users holding one or two of the
+    initial roles (ROLE_PERMISSIONS permissions each) and up to two
+    direct permissions:
+
+        uncompiled  as django.contrib.auth resolved them before
+        bits_cold   every bitset stale, compiled from the database
+        bits_warm   the bitsets read from the cache
+    """
+    rng = random.Random(0)
+    perms = list(Permission.objects.order_by('pk'))
+    codes = ['%s.%s' % (perm.content_type.app_label, perm.codename)
+             for perm in perms]
+    roles = list(Group.objects.exclude(name__in=('superuser', 'candidate')))
+    for role in roles:
+        role.permissions.set(rng.sample(perms, ROLE_PERMISSIONS))
+    users = make_users(options['iterations'], start=PERMISSION_USERS_START)
+    for user in users:
+        user.groups.set(rng.sample(roles, rng.randint(1, 2)))
+        user.user_permissions.set(rng.sample(perms, rng.randint(0, 2)))
+    checks = [rng.sample(codes, PERMISSION_CHECKS) for _ in users]
+
+    def uncompiled(user, perms):
+        return [uncompiled_has_perm(user, perm) for perm in perms]
+
+    def bits(user, perms):
+        return [user.has_perm(perm) for perm in perms]
+
+    def stale(user):
+        permission_bits.bump_version()
+
+    def warm(user):
+        permission_bits.load_bits(user.pk)
+
+    results = OrderedDict()
+    for case, check, prepare in (('uncompiled', uncompiled, None),
+                                 ('bits_cold', bits, stale),
+                                 ('bits_warm', bits, warm)):
+        sampler = Sampler()
+        for user, perms in zip(users, checks):
+            if prepare is not None:
+                prepare(user)
+            user = User.objects.get(pk=user.pk)
+            with sampler.sample():
+                check(user, perms)
+        results[case] = sampler.summary()
+    return results
+
+
+MATRIX_USERS = 10000
+MATRIX_PERMISSIONS = 500
+MATRIX_ROLES = 20
+MATRIX_CHUNK = 2000
+
+
+def uncompiled_permissions(user, codes, backend=ModelBackend()):
+    """The permission codes of `user` read as django.contrib.auth did
+    before accounts.permission_bits, all of `codes` for superusers;
+    three queries."""
+    if 'superuser' in user.groups.values_list('name', flat=True):
+        return set(codes)
+    return {'%s.%s' % (app_label, codename)
+            for perms in (backend._get_user_permissions(user),
+                          backend._get_group_permissions(user))
+            for app_label, codename in perms.values_list(
+                'content_type__app_label', 'codename')}
+
+
+def seed_access(rng):
+    """Pads the permissions to MATRIX_PERMISSIONS and adds MATRIX_USERS
+    users in one or two of MATRIX_ROLES roles (ROLE_PERMISSIONS
+    permissions each) with up to two direct permissions, in bulk."""
+    content_type, _ = ContentType.objects.get_or_create(
+        app_label='benchmarks', model='accessmatrix')
+    missing = MATRIX_PERMISSIONS - Permission.objects.count()
+    Permission.objects.bulk_create([
+        Permission(content_type=content_type, name='Matrix %s' % (n,),
+                   codename='matrix_%s' % (n,)) for n in range(missing)])
+    perm_pks = list(Permission.objects.values_list('pk', flat=True))
+    Group.objects.bulk_create([Group(name='matrix-role-%s' % (n,))
+                               for n in range(MATRIX_ROLES)])
+    role_pks = list(Group.objects.filter(
+        name__startswith='matrix-role-').values_list('pk', flat=True))
+    Group.permissions.through.objects.bulk_create([
+        Group.permissions.through(group_id=role, permission_id=perm)
+        for role in role_pks
+        for perm in rng.sample(perm_pks, ROLE_PERMISSIONS)])
+    User.objects.bulk_create([
+        User(username='matrix-user-%s' % (n,),
+             email='matrix-user-%s@example.com' % (n,), password='!')
+        for n in range(MATRIX_USERS)])
+    user_pks = list(User.objects.filter(
+        username__startswith='matrix-user-').values_list('pk', flat=True))
+    User.groups.through.objects.bulk_create([
+        User.groups.through(user_id=user, group_id=role)
+        for user in user_pks
+        for role in rng.sample(role_pks, rng.randint(1, 2))])
+    User.user_permissions.through.objects.bulk_create([
+        User.user_permissions.through(user_id=user, permission_id=perm)
+        for user in user_pks
+        for perm in rng.sample(perm_pks, rng.randint(0, 2))])
+    admin = User.objects.create(username='matrix-admin',
+                                email='matrix-admin@example.com',
+                                password='!', is_active=True)
+    admin.groups.add(ModGroup.objects.create(name='matrix-admins',
+                                             is_admin=True))
+    return admin
+
+
+def access_matrix_suite(options, seed):
+    """
+    The users by permissions access matrix for MATRIX_USERS more users
+    and MATRIX_PERMISSIONS permissions (see seed_access):
+
+        per_user  a page of PER_PAGE users, each user's permissions read
+                  as django.contrib.auth did, then checked per column
+        page      a page of PER_PAGE users from AccessMatrix
+        view      the page rendered by AccessMatrixView
+        grid      the grid of MATRIX_CHUNK users
+        csv       the whole matrix streamed as CSV
+    """
+    admin = seed_access(random.Random(0))
+    matrix = AccessMatrix()
+    codes = matrix.headers[2:]
+    pages = matrix.page()[0].paginator.num_pages
+    user_pks = list(User.objects.order_by('pk').values_list(
+        'pk', flat=True)[:MATRIX_CHUNK])
+    factory = RequestFactory()
+    view = AccessMatrixView.as_view()
+    numbers = itertools.cycle(range(1, pages + 1))
+
+    def per_user():
+        number = next(numbers)
+        rows = []
+        for user in User.objects.order_by('pk')[
+                (number - 1) * PER_PAGE:number * PER_PAGE]:
+            held = uncompiled_permissions(user, codes)
+            rows.append([code in held for code in codes])
+        return rows
+
+    def page():
+        AccessMatrix().page(next(numbers))
+
+    def render():
+        request = factory.get('/', {'page': next(numbers)})
+        request.user = admin
+        view(request).render()
+
+    def grid():
+        matrix.grid(user_pks)
+
+    def export_csv():
+        for _ in csv_lines(AccessMatrix()):
+            pass
+
+    results = OrderedDict()
+    for case, run, times in (
+            ('per_user', per_user, options['iterations']),
+            ('page', page, options['iterations']),
+            ('view', render, options['iterations']),
+            ('grid', grid, options['iterations']),
+            ('csv', export_csv, max(options['iterations'] // 10, 1))):
+        sampler = Sampler()
+        for _ in range(times):
+            with sampler.sample():
+                run()
+        results[case] = sampler.summary()
+    return results
+
+
+SUITES = OrderedDict((
+    ('journeys', journeys),
+    ('load', load),
+    ('connections', connections),
+    ('sessions', sessions),
+    ('validation', validation),
+    ('distance', distance),
+    ('matching', matching_suite),
+    ('exports', exports),
+    ('analytics', analytics_suite),
+    ('history', history),
+    ('permissions', permissions),
+    ('access_matrix', access_matrix_suite),
+))
@@ -0,0 +1,366 @@
+"""
+Deterministic synthetic data at production scale.
+
+Rows are generated in fixed-size chunks. Every chunk draws from its own
+random.Random seeded with (seed, kind, chunk), and primary keys are
+assigned up front, so the same seed and starting state always produce
+the same rows no matter how many processes run. Many-to-many through
+rows get their ids from the database, so they only line up when chunks
+are written in order, which run_plan does when the parent writes.
+Writes go through bulk_create and never call save(), so full_clean(),
+signals and history are skipped; every derived column (slug, primary
+flags, formatted address) is filled in here instead.
+"""
+import random
+from collections import OrderedDict, namedtuple
+from contextlib import contextmanager
+from multiprocessing import Pool
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.color import no_style
+from django.db import connections, transaction
+from django.db.models import Max
+from django.utils import timezone
+from django.utils.text import slugify
+
+from accounts.models import (
+    AreaCode,
+    EmailAddress,
+    NationalId,
+    PhoneNumber,
+    Profile,
+    User,
+)
+from admin_console.models import (
+    Address,
+    ApplicationStatus,
+    AreaOfExpertise,
+    CallCenter,
+    CitySector,
+    CityTown,
+    Country,
+    DeclinedReason,
+    Language,
+    StateProvinceRegion,
+)
+from applications.models import Application
+from benchmarks.factories import FIRST_NAMES, LAST_NAMES, PASSWORD
+
+USER_MODELS = (User, Profile, EmailAddress, PhoneNumber, NationalId, Address)
+APPLICATION_M2M = ('languages', 'areas_of_expertise', 'previous_call_center')
+BATCH_SIZE = 2000
+
+LOOKUPS = OrderedDict((
+    (Country, ('Dominican Republic', 'United States', 'Puerto Rico')),
+    (StateProvinceRegion, ('Distrito Nacional', 'Santo Domingo',
+                           'Santiago', 'La Altagracia', 'Puerto Plata',
+                           'La Romana', 'La Vega', 'Peravia')),
+    (CityTown, ('Santo Domingo', 'Santiago', 'La Romana', 'San Cristobal',
+                'Puerto Plata', 'La Vega', 'Bani', 'Higuey', 'Moca',
+                'San Pedro de Macoris')),
+    (CitySector, ('Piantini', 'Naco', 'Gazcue', 'Los Prados', 'Bella Vista',
+                  'Evaristo Morales', 'Arroyo Hondo', 'Los Jardines',
+                  'Villa Olga', 'Cerros de Gurabo')),
+    (CallCenter, ('Teleperformance', 'Convergys', 'Sitel', 'Alorica',
+                  'Startek', 'Transcom', 'Qualfon', 'Advanced Call Center')),
+    (Language, ('English', 'Spanish', 'French', 'Portuguese', 'Italian',
+                'German')),
+    (AreaOfExpertise, ('Customer service', 'Sales', 'Technical support',
+                       'Collections', 'Retention', 'Back office',
+                       'Chat support')),
+    (ApplicationStatus, ('New', 'Pre-screened', 'Interviewed', 'Offered',
+                         'Hired', 'Declined')),
+    (DeclinedReason, ('No show', 'Failed assessment', 'Language level',
+                      'Salary expectations', 'Withdrew')),
+))
+AREA_CODES = ('809', '829', '849')
+# Roughly the Dominican Republic.
+LATITUDES = (17.6, 19.9)
+LONGITUDES = (-71.9, -68.4)
+
+Plan = namedtuple('Plan', (
+    'seed', 'chunk_size', 'users', 'applications', 'user_start',
+    'application_start', 'end_date', 'password', 'lookups', 'names',
+    'area_codes', 'write_in_workers',
+))
+
+
+def lookup_rows(model):
+    """Returns {pk: name} for the seeded rows of a lookup model."""
+    return OrderedDict(model.objects.filter(name__in=LOOKUPS[model])
+                       .order_by('pk').values_list('pk', 'name'))
+
+
+def coordinates(model, name):
+    """Stable coordinates inside the Dominican Republic for lookups
+    that have them, so distance ranking has something to work with."""
+    if not hasattr(model, 'latitude'):
+        return {}
+    rng = random.Random('%s:%s' % (model._meta.label, name))
+    return {'latitude': round(rng.uniform(*LATITUDES), 6),
+            'longitude': round(rng.uniform(*LONGITUDES), 6)}
+
+
+def ensure_lookups():
+    """Creates missing lookup rows. Small enough to use the regular
+    save() path, so they get history like hand-entered rows."""
+    for model, names in LOOKUPS.items():
+        existing = set(model.objects.filter(name__in=names)
+                       .values_list('name', flat=True))
+        for name in names:
+            if name not in existing:
+                model(name=name, display_in_form=True,
+                      **coordinates(model, name)).save()
+    for code in AREA_CODES:
+        if not AreaCode.objects.filter(code=code).exists():
+            AreaCode(code=code, name=code, display_in_form=True).save()
+
+
+def next_id(*models):
+    """First free primary key across models that share id ranges."""
+    return max((model.objects.aggregate(top=Max('pk'))['top'] or 0)
+               for model in models) + 1
+
+
+def make_plan(seed=0, users=1000, applications=4000, chunk_size=10000,
+              end_date=None, write_in_workers=True):
+    ensure_lookups()
+    return Plan(
+        seed=seed,
+        chunk_size=chunk_size,
+        users=users,
+        applications=applications,
+        user_start=next_id(*USER_MODELS),
+        application_start=next_id(Application),
+        end_date=end_date or timezone.now().replace(
+            hour=0, minute=0, second=0, microsecond=0),
+        password=make_password(PASSWORD, salt='synthetic%s' % (seed,)),
+        lookups={model._meta.label: list(lookup_rows(model))
+                 for model in LOOKUPS},
+        names={model._meta.label: lookup_rows(model) for model in LOOKUPS},
+        area_codes=list(AreaCode.objects.filter(code__in=AREA_CODES)
+                        .order_by('pk').values_list('pk', flat=True)),
+        write_in_workers=write_in_workers,
+    )
+
+
+def chunk_random(plan, kind, chunk):
+    return random.Random('%s:%s:%s' % (plan.seed, kind, chunk))
+
+
+def chunks(plan, kind):
+    total = plan.users if kind == 'users' else plan.applications
+    return [(kind, index) for index in range(
+        (total + plan.chunk_size - 1) // plan.chunk_size)]
+
+
+def _ids(plan, kind, chunk):
+    if kind == 'users':
+        start, total = plan.user_start, plan.users
+    else:
+        start, total = plan.application_start, plan.applications
+    first = chunk * plan.chunk_size
+    return range(start + first, start + min(first + plan.chunk_size, total))
+
+
+def _pick(rng, lookups, label):
+    return rng.choice(lookups[label])
+
+
+def generate_users(plan, chunk):
+    """Returns {model label: [field dicts]} for one chunk of users."""
+    rng = chunk_random(plan, 'users', chunk)
+    lookups = plan.lookups
+    rows = OrderedDict((model._meta.label, []) for model in USER_MODELS)
+    for pk in _ids(plan, 'users', chunk):
+        username = 'scale-%s' % (pk,)
+        email = '%s@example.com' % (username,)
+        joined = plan.end_date - timezone.timedelta(
+            minutes=rng.randint(0, 60 * 24 * 730))
+        rows['accounts.User'].append({
+            'id': pk, 'username': username, 'slug': slugify(username),
+            'email': email, 'password': plan.password,
+            'first_names': rng.choice(FIRST_NAMES),
+            'last_names': rng.choice(LAST_NAMES),
+            'birth_date': (joined - timezone.timedelta(
+                days=365 * rng.randint(18, 60))).date(),
+            'is_active': True, 'is_verified': True, 'accepted_tos': True,
+            'employee_status': rng.choice((User.NEVER_EMPLOYED,) * 8 + (
+                User.ACTIVE, User.TERMED)),
+        })
+        rows['accounts.Profile'].append({
+            'id': pk, 'user_id': pk, 'gender': rng.randint(0, 1)})
+        rows['accounts.EmailAddress'].append({
+            'id': pk, 'user_id': pk, 'email': email, 'is_primary': True,
+            'is_verified': True, 'created_at': joined, 'last_modified': joined})
+        phone = '%07d' % (rng.randint(0, 9999999),)
+        rows['accounts.PhoneNumber'].append({
+            'id': pk, 'user_id': pk, 'phone_number': phone,
+            'is_primary': True, 'area_code_id': rng.choice(plan.area_codes)})
+        rows['accounts.NationalId'].append({
+            'id': pk, 'user_id': pk, 'id_type': NationalId.CEDULA,
+            'id_number': '%011d' % (pk,), 'is_verified': True})
+        line = 'Calle %s #%s' % (rng.randint(1, 90), rng.randint(1, 300))
+        parts = OrderedDict((
+            ('sector_id', _pick(rng, lookups, 'admin_console.CitySector')),
+            ('city_id', _pick(rng, lookups, 'admin_console.CityTown')),
+            ('state_province_region_id',
+             _pick(rng, lookups, 'admin_console.StateProvinceRegion')),
+            ('country_id', _pick(rng, lookups, 'admin_console.Country')),
+        ))
+        names = [plan.names[label][pk_] for label, pk_ in zip(
+            ('admin_console.CitySector', 'admin_console.CityTown',
+             'admin_console.StateProvinceRegion', 'admin_console.Country'),
+            parts.values())]
+        rows['admin_console.Address'].append(dict(
+            parts, id=pk, user_id=pk, phone_number_id=pk, name='Home',
+            associated_name='Home', address_line_one=line, is_primary=True,
+            formatted_name=', '.join([line] + names),
+            created_at=joined, last_modified=joined))
+    return rows
+
+
+def generate_applications(plan, chunk):
+    """Returns {model label: [field dicts]} for one chunk of
+    applications, including their many-to-many through rows."""
+    rng = chunk_random(plan, 'applications', chunk)
+    lookups = plan.lookups
+    rows = OrderedDict((('applications.Application', []),) + tuple(
+        (name, []) for name in APPLICATION_M2M))
+    languages = lookups['admin_console.Language']
+    expertise = lookups['admin_console.AreaOfExpertise']
+    call_centers = lookups['admin_console.CallCenter']
+    for pk in _ids(plan, 'applications', chunk):
+        # About a third of applications come from registered users.
+        user_id = None
+        if plan.users and rng.random() < 0.33:
+            user_id = plan.user_start + rng.randrange(plan.users)
+        xp = rng.random() < 0.4
+        pre_screen = rng.random() < 0.6
+        tss = pre_screen and rng.random() < 0.5
+        application = {
+            'id': pk, 'user_id': user_id,
+            'first_names': rng.choice(FIRST_NAMES),
+            'last_names': rng.choice(LAST_NAMES),
+            'primary_phone': '809%07d' % (rng.randint(0, 9999999),),
+            'email': 'applicant-%s@example.com' % (pk,),
+            'national_id_type': Application.CEDULA,
+            'national_id_number': '%011d' % (
+                user_id if user_id else 50000000000 + pk,),
+            'gender': rng.randint(0, 2),
+            'birth_date': (plan.end_date - timezone.timedelta(
+                days=365 * rng.randint(18, 60))).date(),
+            'applied_at': plan.end_date - timezone.timedelta(
+                minutes=rng.randint(0, 60 * 24 * 730)),
+            'address_line_one': 'Calle %s #%s' % (rng.randint(1, 90),
+                                                  rng.randint(1, 300)),
+            'city_or_town_id': _pick(rng, lookups, 'admin_console.CityTown'),
+            'lived_in_usa': rng.random() < 0.1,
+            'previous_call_center_xp': xp,
+            'pre_screen': pre_screen,
+            'hire_iq': rng.randint(40, 100) if pre_screen else None,
+            'tss': tss,
+            'hm_interview': tss and rng.random() < 0.5,
+        }
+        application['last_modified'] = application['applied_at']
+        rows['applications.Application'].append(application)
+        for language_id in rng.sample(languages, rng.randint(1, 3)):
+            rows['languages'].append({'application_id': pk,
+                                      'language_id': language_id})
+        for expertise_id in rng.sample(expertise, rng.randint(1, 3)):
+            rows['areas_of_expertise'].append({
+                'application_id': pk, 'areaofexpertise_id': expertise_id})
+        if xp:
+            for call_center_id in rng.sample(call_centers, rng.randint(1, 2)):
+                rows['previous_call_center'].append({
+                    'application_id': pk, 'callcenter_id': call_center_id})
+    return rows
+
+
+def _model_for(label):
+    if label in APPLICATION_M2M:
+        return getattr(Application, label).through
+    for model in USER_MODELS + (Application,):
+        if model._meta.label == label:
+            return model
+    raise LookupError(label)
+
+
+@contextmanager
+def preserve_timestamps(*models):
+    """bulk_create runs pre_save(), which would overwrite the generated
+    auto_now/auto_now_add values; switch them off for the duration."""
+    switched = []
+    for model in models:
+        for field in model._meta.concrete_fields:
+            if getattr(field, 'auto_now', False) or getattr(
+                    field, 'auto_now_add', False):
+                switched.append((field, field.auto_now, field.auto_now_add))
+                field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in switched:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+def write_rows(rows):
+    """Inserts one generated chunk in a single transaction."""
+    models = [_model_for(label) for label in rows]
+    ops = connections['default'].ops
+    written = 0
+    with preserve_timestamps(*models), transaction.atomic():
+        for model, objs in zip(models, rows.values()):
+            objs = [model(**obj) for obj in objs]
+            # SQLite caps the number of variables per statement.
+            batch_size = min(BATCH_SIZE, max(ops.bulk_batch_size(
+                model._meta.concrete_fields, objs), 1))
+            model.objects.bulk_create(objs, batch_size=batch_size)
+            written += len(objs)
+    return written
+
+
+_worker_plan = None
+
+
+def _init_worker(plan):
+    global _worker_plan
+    _worker_plan = plan
+
+
+def _run_chunk(task):
+    kind, chunk = task
+    generate = generate_users if kind == 'users' else generate_applications
+    rows = generate(_worker_plan, chunk)
+    if _worker_plan.write_in_workers:
+        return write_rows(rows)
+    return rows
+
+
+def run_plan(plan, processes=None, progress=None):
+    """
+    Generates every chunk across `processes` worker processes. Users go
+    first since applications reference them. When the plan does not
+    write in workers (SQLite allows a single writer), workers only
+    generate and this process inserts, in chunk order.
+    """
+    written = 0
+    connections.close_all()
+    with Pool(processes, initializer=_init_worker, initargs=(plan,)) as pool:
+        for kind in ('users', 'applications'):
+            for result in pool.imap(_run_chunk, chunks(plan, kind)):
+                written += result if plan.write_in_workers else write_rows(result)
+                if progress:
+                    progress(kind, written)
+    reset_sequences()
+    return written
+
+
+def reset_sequences():
+    """Explicit primary keys leave Postgres sequences behind."""
+    connection = connections['default']
+    models = list(USER_MODELS) + [Application] + [
+        _model_for(name) for name in APPLICATION_M2M]
+    with connection.cursor() as cursor:
+        for statement in connection.ops.sequence_reset_sql(no_style(), models):
+            cursor.execute(statement)
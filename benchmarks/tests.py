@@ -0,0 +1,119 @@
+from datetime import datetime
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase, TransactionTestCase
+from django.utils import timezone
+
+from accounts.models import User
+from applications.models import Application
+from benchmarks.baseline import compare
+from benchmarks.factories import seed_database
+from benchmarks.journeys import JOURNEYS
+from benchmarks.stats import percentile, summarize
+from benchmarks.synthetic import (
+    generate_applications,
+    generate_users,
+    make_plan,
+    write_rows,
+)
+
+
+class StatsTest(TestCase):
+
+    def test_percentile_uses_nearest_rank(self):
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 95), 95)
+        self.assertEqual(percentile(values, 99), 99)
+
+    def test_percentile_of_empty_is_zero(self):
+        self.assertEqual(percentile([], 95), 0.0)
+
+    def test_summarize_reports_milliseconds_and_max_queries(self):
+        summary = summarize([0.001, 0.002, 0.003], [4, 5, 4])
+        self.assertEqual(summary['p50_ms'], 2.0)
+        self.assertEqual(summary['queries'], 5)
+
+
+class CompareTest(TestCase):
+    BASELINE = {'journeys': {'login': {'p95_ms': 10.0, 'queries': 5}}}
+
+    def test_extra_queries_are_a_regression(self):
+        results = {'journeys': {'login': {'p95_ms': 10.0, 'queries': 6}}}
+        self.assertEqual(len(compare(results, self.BASELINE)), 1)
+
+    def test_latency_within_tolerance_is_not_a_regression(self):
+        results = {'journeys': {'login': {'p95_ms': 12.0, 'queries': 5}}}
+        self.assertEqual(compare(results, self.BASELINE, tolerance=0.25), [])
+
+    def test_latency_over_tolerance_is_a_regression(self):
+        results = {'journeys': {'login': {'p95_ms': 13.0, 'queries': 5}}}
+        self.assertEqual(len(compare(results, self.BASELINE, tolerance=0.25)), 1)
+
+    def test_unknown_cases_are_ignored(self):
+        results = {'load': {'/en/': {'p95_ms': 100.0}}}
+        self.assertEqual(compare(results, self.BASELINE), [])
+
+
+class JourneyTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        call_command('create_initial_groups', stdout=StringIO())
+        cls.seed = seed_database(users=3, applications=3)
+
+    def test_every_journey_completes(self):
+        for journey_class in JOURNEYS:
+            summary = journey_class(self.seed).run(iterations=2, warmup=0)
+            self.assertEqual(summary['count'], 2, journey_class.name)
+            self.assertGreater(summary['queries'], 0, journey_class.name)
+
+
+class SyntheticDataTest(TestCase):
+
+    def setUp(self):
+        self.plan = make_plan(seed=7, users=5, applications=12, chunk_size=5,
+                              end_date=timezone.now())
+
+    def test_same_seed_generates_same_rows(self):
+        self.assertEqual(generate_applications(self.plan, 1),
+                         generate_applications(self.plan, 1))
+        other = self.plan._replace(seed=8)
+        self.assertNotEqual(generate_users(self.plan, 0),
+                            generate_users(other, 0))
+
+    def test_last_chunk_is_short(self):
+        rows = generate_applications(self.plan, 2)
+        self.assertEqual(len(rows['applications.Application']), 2)
+
+    def test_written_rows_are_consistent(self):
+        write_rows(generate_users(self.plan, 0))
+        for chunk in range(3):
+            write_rows(generate_applications(self.plan, chunk))
+        self.assertEqual(User.objects.filter(
+            email_addresses__is_primary=True, phone_numbers__is_primary=True).count(), 5)
+        self.assertEqual(Application.objects.count(), 12)
+        self.assertFalse(Application.objects.filter(languages=None).exists())
+
+
+class SeedScaleDataTest(TransactionTestCase):
+
+    def test_two_processes_write_the_planned_rows(self):
+        end_date = timezone.make_aware(datetime(2026, 1, 1))
+        plan = make_plan(seed=3, users=6, applications=10, chunk_size=5,
+                         end_date=end_date, write_in_workers=False)
+        users = [row['email'] for chunk in range(2)
+                 for row in generate_users(plan, chunk)['accounts.User']]
+        applications = [
+            row['email'] for chunk in range(2) for row in
+            generate_applications(plan, chunk)['applications.Application']]
+        call_command('seed_scale_data', '--seed', '3', '--users', '6',
+                     '--applications', '10', '--chunk-size', '5',
+                     '--processes', '2', '--end-date', '2026-01-01',
+                     stdout=StringIO())
+        self.assertEqual(list(User.objects.filter(
+            username__startswith='scale-').order_by('pk').values_list(
+                'email', flat=True)), users)
+        self.assertEqual(list(Application.objects.order_by('pk').values_list(
+            'email', flat=True)), applications)
@@ -0,0 +1,28 @@
+"""
+Cache key layout. Several brands and tenants (sites) may share one Redis
+instance, so every key carries both ahead of the version:
+
+    <KEY_PREFIX>:<brand>:<site id>:<version>:<key>
+
+Sessions stored through the cache (cached_db) are namespaced the same way.
+"""
+from functools import lru_cache
+
+from django.conf import settings
+from django.utils.text import slugify
+
+
+@lru_cache(maxsize=None)
+def _namespace(company_name, site_id):
+    return '%s:%s' % (slugify(company_name) or 'default', site_id)
+
+
+def namespace():
+    """Returns '<brand>:<site id>' for the current settings."""
+    return _namespace(settings.BRAND_DICT['COMPANY_NAME'],
+                      getattr(settings, 'SITE_ID', 1))
+
+
+def make_key(key, key_prefix, version):
+    """KEY_FUNCTION for every configured cache."""
+    return '%s:%s:%s:%s' % (key_prefix, namespace(), version, key)
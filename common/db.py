@@ -0,0 +1,223 @@
+"""
+Database connection helpers shared by every app.
+
+Django (as of 2.1) only drops a persistent connection once it is older
+than CONN_MAX_AGE or after an error was raised on it, so a connection
+the server closed while idle (a restart, a failover, PgBouncer
+recycling it) fails the first request that uses it. The middleware
+below pings such connections before the view runs.
+
+Read replicas are listed in settings.DATABASE_REPLICAS. Reads are only
+sent to them inside use_replica() (admin console pages, reporting) and
+for history tables; everything else stays on the primary. Once a thread
+writes, its reads go back to the primary (history tables included),
+and the request middleware keeps the session there for
+REPLICA_PIN_SECONDS so users see their own changes while replicas
+catch up. Writes that name their database, as Celery tasks writing
+history do, call note_write() to the same effect.
+"""
+import random
+import threading
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+REPLICA_PIN_SESSION_KEY = '_replica_pinned_until'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+_state = threading.local()
+
+
+def check_connection(alias=DEFAULT_DB_ALIAS):
+    """
+    Runs a trivial query on `alias` and returns a dict describing the
+    outcome, suitable for a health endpoint.
+    """
+    connection = connections[alias]
+    start = time.perf_counter()
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+            cursor.fetchone()
+    except Exception as error:
+        return {'alias': alias, 'vendor': connection.vendor, 'ok': False,
+                'error': error.__class__.__name__}
+    return {'alias': alias, 'vendor': connection.vendor, 'ok': True,
+            'latency_ms': round((time.perf_counter() - start) * 1000, 3)}
+
+
+def close_if_unhealthy(connection, interval=None):
+    """
+    Closes a persistent connection that no longer answers, so the next
+    query reconnects instead of failing. Connections are checked at most
+    once per `interval` seconds. Returns True if it was closed.
+    """
+    if interval is None:
+        interval = getattr(settings, 'DATABASE_HEALTH_CHECK_INTERVAL', 30)
+    if connection.connection is None or not connection.settings_dict.get(
+            'CONN_MAX_AGE'):
+        return False
+    if connection.in_atomic_block:
+        return False
+    now = time.monotonic()
+    if now - getattr(connection, 'health_checked_at', 0) < interval:
+        return False
+    connection.health_checked_at = now
+    if connection.is_usable():
+        return False
+    connection.close()
+    return True
+
+
+class DatabaseHealthCheckMiddleware:
+    """
+    Checks the persistent connections this thread holds before handing
+    the request on. Place it first so the session and authentication
+    middleware get a working connection.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        for connection in connections.all():
+            close_if_unhealthy(connection)
+        return self.get_response(request)
+
+
+def replicas():
+    return list(getattr(settings, 'DATABASE_REPLICAS', ()))
+
+
+def pin_to_primary():
+    """Sends the rest of this thread's reads to the primary."""
+    _state.pinned = True
+
+
+def note_write():
+    """Records that this thread wrote, for writes that name their
+    database and so bypass the router (e.g. Celery tasks)."""
+    _state.wrote = True
+    pin_to_primary()
+
+
+def is_pinned():
+    return getattr(_state, 'pinned', False)
+
+
+def reset_routing(pinned=False):
+    _state.pinned = pinned
+    _state.wrote = False
+    _state.replica_depth = 0
+
+
+class use_replica:
+    """
+    Context manager and decorator: reads inside it go to a replica
+    unless this thread already wrote or the session is pinned.
+    e.g.
+        with use_replica():
+            rows = list(Application.objects.filter(...))
+    """
+    def __enter__(self):
+        _state.replica_depth = getattr(_state, 'replica_depth', 0) + 1
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _state.replica_depth -= 1
+        return False
+
+    def __call__(self, func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with use_replica():
+                return func(*args, **kwargs)
+        return wrapper
+
+
+def is_history_model(model):
+    # simple_history builds Historical<Model> classes with this marker.
+    return hasattr(model, 'instance_type')
+
+
+class ReplicaRouter:
+    """Splits reads between the primary and settings.DATABASE_REPLICAS."""
+
+    def db_for_read(self, model, **hints):
+        aliases = replicas()
+        if not aliases or is_pinned() or getattr(_state, 'wrote', False):
+            return DEFAULT_DB_ALIAS if aliases else None
+        if getattr(_state, 'replica_depth', 0) or is_history_model(model):
+            return random.choice(aliases)
+        return None
+
+    def db_for_write(self, model, **hints):
+        if not replicas():
+            return None
+        # Also covers rows that were read from a replica.
+        note_write()
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        aliases = {DEFAULT_DB_ALIAS} | set(replicas())
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+
+class ReplicaReadMixin:
+    """
+    For read-only class based views: safe requests run, template
+    rendering included, inside use_replica().
+    """
+    def dispatch(self, request, *args, **kwargs):
+        if request.method not in SAFE_METHODS:
+            return super(ReplicaReadMixin, self).dispatch(
+                request, *args, **kwargs)
+        with use_replica():
+            response = super(ReplicaReadMixin, self).dispatch(
+                request, *args, **kwargs)
+            if hasattr(response, 'render') and not response.is_rendered:
+                response.render()
+        return response
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Resets routing state per request, pins sessions that wrote recently
+    to the primary, and sends safe requests from the read-only groups
+    (settings.REPLICA_READ_GROUPS) to a replica. Must come after the
+    session and authentication middleware.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not replicas():
+            return self.get_response(request)
+        pinned_until = request.session.get(REPLICA_PIN_SESSION_KEY, 0)
+        reset_routing(pinned=pinned_until > time.time())
+        try:
+            if self.reads_from_replica(request):
+                with use_replica():
+                    response = self.get_response(request)
+            else:
+                response = self.get_response(request)
+            if _state.wrote:
+                request.session[REPLICA_PIN_SESSION_KEY] = (
+                    time.time() + getattr(settings, 'REPLICA_PIN_SECONDS', 10))
+        finally:
+            reset_routing()
+        return response
+
+    def reads_from_replica(self, request):
+        groups = getattr(settings, 'REPLICA_READ_GROUPS', ())
+        if request.method not in SAFE_METHODS or not groups:
+            return False
+        user = request.user
+        # The cached permission bits carry the user's group names. Not
+        # imported at the top: common must not depend on accounts.
+        from accounts.permission_bits import permission_bits
+        return user.is_authenticated and not permission_bits(
+            user).groups.isdisjoint(groups)
@@ -0,0 +1,215 @@
+"""
+History recording for simple_history models.
+
+HistoricalRecords writes one history row per save, in the same request,
+one INSERT each. BufferedHistoricalRecords, which every history-tracked
+model here uses, records according to settings.HISTORY_RECORDING:
+
+    'sync'    as simple_history does (the default)
+    'commit'  rows written inside a transaction are kept in memory and
+              bulk inserted when it commits (dropped if it rolls back,
+              savepoints included); outside transactions nothing
+              changes
+    'worker'  as 'commit', but the rows are handed to the
+              record_history Celery task; if it cannot be queued they
+              are written in place
+
+A transaction never holds more than settings.HISTORY_BUFFER_SIZE rows:
+a full buffer is written at once, inside the transaction.
+
+With settings.HISTORY_CHANGED_ONLY, saves that change no tracked field
+(compared to the values loaded or last saved, auto_now timestamps
+aside) record nothing. Rows are always complete copies, so as_of(),
+diff_against() and the admin history views keep working.
+
+e.g.:
+    history = BufferedHistoricalRecords()
+    register(Group, records_class=BufferedHistoricalRecords)
+"""
+import logging
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core import serializers
+from django.db import connections, models, router, transaction
+from django.db.models.signals import post_init
+from django.utils.timezone import now
+from simple_history.models import HistoricalRecords
+
+from common.db import note_write
+from ta_platform.celery_app import app
+
+logger = logging.getLogger(__name__)
+
+SYNC, COMMIT, WORKER = 'sync', 'commit', 'worker'
+MODES = (SYNC, COMMIT, WORKER)
+
+_state = threading.local()
+
+
+def recording_mode():
+    mode = getattr(settings, 'HISTORY_RECORDING', SYNC)
+    if mode not in MODES:
+        raise ValueError('HISTORY_RECORDING must be one of %s, not %r.' % (
+            ', '.join(MODES), mode))
+    return mode
+
+
+def changed_only():
+    return getattr(settings, 'HISTORY_CHANGED_ONLY', False)
+
+
+def write_rows(rows, using):
+    """Bulk inserts history rows, one query per history model, in one
+    transaction."""
+    note_write()
+    by_model = OrderedDict()
+    for row in rows:
+        by_model.setdefault(type(row), []).append(row)
+    with transaction.atomic(using=using, savepoint=False):
+        for model, model_rows in by_model.items():
+            model._default_manager.using(using).bulk_create(model_rows)
+
+
+@app.task
+def record_history(using, payload):
+    """Writes the history rows serialized by Buffer.flush()."""
+    write_rows([obj.object for obj in serializers.deserialize(
+        'json', payload, using=using)], using)
+
+
+class Buffer:
+    """History rows waiting for the (sub)transaction they belong to."""
+
+    def __init__(self, key):
+        self.key = key
+        self.using = key[0]
+        self.rows = []
+        self.callback = self.flush
+
+    def is_pending(self):
+        """False once flushed or rolled back: either way Django dropped
+        the on_commit callback."""
+        return any(callback is self.callback for _, callback in
+                   connections[self.using].run_on_commit)
+
+    def add(self, row):
+        self.rows.append(row)
+        if len(self.rows) >= getattr(settings, 'HISTORY_BUFFER_SIZE', 500):
+            self.write()
+
+    def write(self):
+        rows, self.rows = self.rows, []
+        write_rows(rows, self.using)
+
+    def flush(self):
+        _buffers().pop(self.key, None)
+        if not self.rows:
+            return
+        if recording_mode() != WORKER:
+            return self.write()
+        rows, self.rows = self.rows, []
+        try:
+            record_history.delay(self.using, serializers.serialize(
+                'json', rows))
+        except Exception:  #pylint: disable=W0703
+            logger.warning('Could not queue %s history rows, writing them '
+                           'now', len(rows), exc_info=True)
+            write_rows(rows, self.using)
+
+    @classmethod
+    def current(cls, using):
+        """The buffer of the innermost savepoint of `using`."""
+        connection = connections[using]
+        buffers = _buffers()
+        key = (using, tuple(connection.savepoint_ids))
+        buffer = buffers.get(key)
+        if buffer is None or not buffer.is_pending():
+            for stale in [other for other, value in buffers.items()
+                          if other[0] == using and not value.is_pending()]:
+                del buffers[stale]
+            buffer = buffers[key] = cls(key)
+            transaction.on_commit(buffer.callback, using=using)
+        return buffer
+
+
+def _buffers():
+    if not hasattr(_state, 'buffers'):
+        _state.buffers = {}
+    return _state.buffers
+
+
+def record(row, using):
+    """Buffers a history row when `using` is in a transaction, writes
+    it otherwise."""
+    if not connections[using].in_atomic_block:
+        row.save(using=using)
+    else:
+        Buffer.current(using).add(row)
+
+
+class BufferedHistoricalRecords(HistoricalRecords):
+    """HistoricalRecords honouring HISTORY_RECORDING and
+    HISTORY_CHANGED_ONLY."""
+
+    def get_meta_options(self, model):
+        options = super(BufferedHistoricalRecords,
+                        self).get_meta_options(model)
+        # The versions of one object, by date: audit pages and
+        # common.retention read history this way.
+        options['indexes'] = [models.Index(fields=['id', 'history_date'])]
+        return options
+
+    def finalize(self, sender, **kwargs):
+        super(BufferedHistoricalRecords, self).finalize(sender, **kwargs)
+        if self.cls is sender or (self.inherit and
+                                  issubclass(sender, self.cls)):
+            post_init.connect(self.post_init, sender=sender, weak=False)
+
+    def post_init(self, instance, **kwargs):
+        if changed_only():
+            self.remember(instance)
+
+    def remember(self, instance):
+        """Keeps the tracked values to compare the next save with."""
+        instance._history_saved_values = {
+            field.attname: instance.__dict__[field.attname]
+            for field in self.fields_included(instance)
+            if field.attname in instance.__dict__}
+
+    def has_changed(self, instance):
+        """Whether a tracked field changed; auto_now timestamps, which
+        every save bumps, are not compared."""
+        saved = getattr(instance, '_history_saved_values', None)
+        if saved is None:
+            return True
+        return any(
+            field.attname in instance.__dict__ and (
+                field.attname not in saved or
+                saved[field.attname] != instance.__dict__[field.attname])
+            for field in self.fields_included(instance)
+            if not getattr(field, 'auto_now', False))
+
+    def post_save(self, instance, created, **kwargs):
+        if changed_only() and not created and not self.has_changed(instance):
+            return
+        super(BufferedHistoricalRecords, self).post_save(instance, created,
+                                                         **kwargs)
+        if changed_only():
+            self.remember(instance)
+
+    def create_historical_record(self, instance, history_type):
+        if recording_mode() == SYNC:
+            return super(BufferedHistoricalRecords,
+                         self).create_historical_record(instance, history_type)
+        manager = getattr(instance, self.manager_name)
+        attrs = {field.attname: getattr(instance, field.attname)
+                 for field in self.fields_included(instance)}
+        row = manager.model(
+            history_date=getattr(instance, '_history_date', now()),
+            history_type=history_type,
+            history_user=self.get_history_user(instance),
+            history_change_reason=getattr(instance, 'changeReason', None),
+            **attrs)
+        record(row, router.db_for_write(manager.model, instance=instance))
@@ -0,0 +1,162 @@
+"""
+Retention of simple_history rows.
+
+settings.HISTORY_RETENTION maps a tracked model ('app_label.Model', or
+'*' for the models not listed) to its policy; models without one, or
+with an empty one, keep all their history. A version is kept when any
+rule of the policy keeps it:
+
+    versions  the newest N versions of each object (at least 1, so the
+              current state is always there)
+    days      versions recorded in the last N days
+    monthly   the last version of each object in each calendar month,
+              which compacts older history to monthly checkpoints
+
+Pruning walks the history table by object id, loading only (id,
+history_id, history_date) of settings.HISTORY_PRUNE_CHUNK_SIZE objects
+at a time (the (id, history_date) index added by
+common.history.BufferedHistoricalRecords serves it), and deletes in
+batches of that size, each batch its own short transaction.
+
+e.g.:
+    for report in prune(dry_run=True):
+        print(report.label, report.deleted, report.reclaimed_bytes)
+"""
+import itertools
+import time
+from collections import namedtuple
+
+from django.apps import apps
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connections, router
+from django.utils import timezone
+
+from common.db import is_history_model
+
+POLICY_KEYS = ('versions', 'days', 'monthly')
+
+Report = namedtuple('Report', ('label', 'rows', 'deleted', 'reclaimed_bytes'))
+
+
+def history_models():
+    return [model for model in apps.get_models() if is_history_model(model)]
+
+
+def policy_for(model):
+    """The policy of the history model `model`, or None."""
+    retention = getattr(settings, 'HISTORY_RETENTION', {})
+    policy = retention.get(model.instance_type._meta.label,
+                           retention.get('*'))
+    if policy is None:
+        return None
+    unknown = set(policy) - set(POLICY_KEYS)
+    if unknown:
+        raise ImproperlyConfigured(
+            'Unknown HISTORY_RETENTION keys for %s: %s.' % (
+                model.instance_type._meta.label, ', '.join(sorted(unknown))))
+    if not policy.get('versions') and not policy.get('days') and not \
+            policy.get('monthly'):
+        return None
+    return policy
+
+
+def expendable(versions, policy, cutoff):
+    """history_ids among `versions`, the (history_id, history_date) of
+    one object newest first, that `policy` does not keep."""
+    keep = max(policy.get('versions') or 0, 1)
+    months = set()
+    for index, (history_id, history_date) in enumerate(versions):
+        month = (history_date.year, history_date.month)
+        checkpoint = policy.get('monthly') and month not in months
+        months.add(month)
+        if index < keep or checkpoint or (
+                cutoff is not None and history_date >= cutoff):
+            continue
+        yield history_id
+
+
+def plan(model, policy, chunk_size=None, now=None):
+    """Yields lists of at most `chunk_size` history_ids to delete."""
+    chunk_size = chunk_size or settings.HISTORY_PRUNE_CHUNK_SIZE
+    cutoff = None
+    if policy.get('days'):
+        cutoff = (now or timezone.now()) - timezone.timedelta(
+            days=policy['days'])
+    queryset = model._default_manager.using(router.db_for_write(model))
+    objects = queryset.order_by('id').values_list('id', flat=True).distinct()
+    pending, last = [], None
+    while True:
+        page = objects if last is None else objects.filter(id__gt=last)
+        ids = list(page[:chunk_size])
+        if not ids:
+            break
+        last = ids[-1]
+        rows = queryset.filter(id__gte=ids[0], id__lte=last).order_by(
+            'id', '-history_date', '-history_id').values_list(
+                'id', 'history_id', 'history_date')
+        for _, versions in itertools.groupby(rows, key=lambda row: row[0]):
+            pending.extend(expendable(
+                [(history_id, date) for _, history_id, date in versions],
+                policy, cutoff))
+            while len(pending) >= chunk_size:
+                yield pending[:chunk_size]
+                pending = pending[chunk_size:]
+    if pending:
+        yield pending
+
+
+def table_bytes(model):
+    """On-disk size of the table of `model` with its indexes, or None
+    when the backend cannot tell."""
+    using = router.db_for_write(model)
+    connection = connections[using]
+    table = model._meta.db_table
+    if connection.vendor == 'postgresql':
+        sql, params = 'SELECT pg_total_relation_size(%s)', [table]
+    elif connection.vendor == 'sqlite':
+        sql = ('SELECT SUM(pgsize) FROM dbstat WHERE name IN '
+               '(SELECT name FROM sqlite_master WHERE tbl_name = %s)')
+        params = [table]
+    else:
+        return None
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.fetchone()[0]
+    except Exception:  #pylint: disable=W0703
+        # SQLite builds without the dbstat table.
+        return None
+
+
+def prune_model(model, policy, dry_run=False, chunk_size=None, pause=0,
+                now=None):
+    """Prunes the history of one model; returns its Report. The space
+    is estimated from the average row size (indexes included), and is
+    reused by the database rather than returned to the filesystem."""
+    queryset = model._default_manager.using(router.db_for_write(model))
+    rows = queryset.count()
+    size = table_bytes(model) if rows else 0
+    deleted = 0
+    for batch in plan(model, policy, chunk_size, now):
+        if not dry_run:
+            queryset.filter(history_id__in=batch).delete()
+            if pause:
+                time.sleep(pause)
+        deleted += len(batch)
+    reclaimed = None if size is None else (
+        size * deleted // rows if rows else 0)
+    return Report(model._meta.label, rows, deleted, reclaimed)
+
+
+def prune(dry_run=False, labels=None, chunk_size=None, pause=0, now=None):
+    """Prunes every history model with a policy (only those whose
+    tracked model label is in `labels`, when given); yields a Report
+    per model."""
+    for model in history_models():
+        label = model.instance_type._meta.label
+        if labels and label not in labels:
+            continue
+        policy = policy_for(model)
+        if policy is not None:
+            yield prune_model(model, policy, dry_run, chunk_size, pause, now)
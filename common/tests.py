@@ -0,0 +1,381 @@
+from datetime import datetime
+from io import StringIO
+from unittest.mock import patch
+
+from django.contrib.auth.models import Group
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured, ValidationError
+from django.core.management import call_command
+from django.db import OperationalError, connection, transaction
+from django.test import (
+    RequestFactory,
+    SimpleTestCase,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+)
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from accounts.models import AreaCode, Profile, User
+from accounts.permission_bits import load_bits
+from admin_console.models import Country, Language
+from common.cache import make_key
+from common.db import (
+    check_connection,
+    ReplicaRoutingMiddleware,
+    close_if_unhealthy,
+    reset_routing,
+    use_replica,
+)
+from common.history import record_history, write_rows
+from common.retention import prune
+from common.validation import (
+    FULL,
+    RAW,
+    TRUSTED,
+    current_policy,
+    validation_policy,
+)
+
+
+class FakeConnection:
+    """Just the parts of a connection wrapper close_if_unhealthy uses."""
+    in_atomic_block = False
+
+    def __init__(self, max_age=600, usable=True):
+        self.connection = object()
+        self.settings_dict = {'CONN_MAX_AGE': max_age}
+        self.usable = usable
+        self.closed = False
+
+    def is_usable(self):
+        return self.usable
+
+    def close(self):
+        self.closed = True
+        self.connection = None
+
+
+class CacheKeyTest(SimpleTestCase):
+
+    def tearDown(self):
+        cache.clear()
+
+    @override_settings(BRAND_DICT={'COMPANY_NAME': 'Acme Staffing'}, SITE_ID=3)
+    def test_key_carries_brand_and_site(self):
+        self.assertEqual(make_key('flag', 'ta_platform', 1),
+                         'ta_platform:acme-staffing:3:1:flag')
+
+    def test_brands_do_not_share_keys(self):
+        with override_settings(BRAND_DICT={'COMPANY_NAME': 'Brand A'}):
+            cache.set('shared', 'a')
+        with override_settings(BRAND_DICT={'COMPANY_NAME': 'Brand B'}):
+            self.assertIsNone(cache.get('shared'))
+            cache.set('shared', 'b')
+        with override_settings(BRAND_DICT={'COMPANY_NAME': 'Brand A'}):
+            self.assertEqual(cache.get('shared'), 'a')
+
+
+class CloseIfUnhealthyTest(SimpleTestCase):
+
+    def test_closes_unusable_persistent_connection(self):
+        fake = FakeConnection(usable=False)
+        self.assertTrue(close_if_unhealthy(fake, interval=0))
+        self.assertTrue(fake.closed)
+
+    def test_keeps_usable_connection(self):
+        fake = FakeConnection()
+        self.assertFalse(close_if_unhealthy(fake, interval=0))
+        self.assertFalse(fake.closed)
+
+    def test_ignores_per_request_connections(self):
+        fake = FakeConnection(max_age=0, usable=False)
+        self.assertFalse(close_if_unhealthy(fake, interval=0))
+
+    def test_checks_at_most_once_per_interval(self):
+        fake = FakeConnection()
+        close_if_unhealthy(fake, interval=60)
+        fake.usable = False
+        self.assertFalse(close_if_unhealthy(fake, interval=60))
+        self.assertFalse(fake.closed)
+
+
+class HealthCheckTest(TestCase):
+
+    def test_healthy_database(self):
+        response = self.client.get(reverse('health'))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()['databases'][0]['ok'])
+
+    def test_failing_database(self):
+        with patch.object(connection, 'cursor', side_effect=OperationalError):
+            self.assertFalse(check_connection()['ok'])
+            response = self.client.get(reverse('health'))
+        self.assertEqual(response.status_code, 503)
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaRouterTest(TestCase):
+    """The test settings define 'replica' as a separate SQLite database
+    that nothing replicates to, so rows written to the primary are only
+    visible when a read is routed there."""
+    multi_db = True
+
+    def setUp(self):
+        reset_routing()
+        Country.objects.using('default').create(name='Primary only')
+        reset_routing()
+
+    def tearDown(self):
+        reset_routing()
+
+    def test_reads_default_to_primary(self):
+        self.assertTrue(Country.objects.filter(name='Primary only').exists())
+
+    def test_use_replica_reads_from_replica(self):
+        with use_replica():
+            self.assertFalse(
+                Country.objects.filter(name='Primary only').exists())
+
+    def test_use_replica_as_decorator(self):
+        @use_replica()
+        def count():
+            return Country.objects.filter(name='Primary only').count()
+        self.assertEqual(count(), 0)
+
+    def test_reads_after_a_write_stay_on_primary(self):
+        with use_replica():
+            Country.objects.create(name='Written')
+            self.assertTrue(Country.objects.filter(name='Written').exists())
+
+    def test_history_reads_from_replica(self):
+        self.assertFalse(Group.history.exists())
+
+    def test_history_reads_after_a_task_wrote_stay_on_primary(self):
+        # record_history names its database, so the router never sees it.
+        write_rows([Group.history.model(
+            id=1, name='Task', history_date=timezone.now(),
+            history_type='+')], 'default')
+        self.assertTrue(Group.history.filter(name='Task').exists())
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaStickinessTest(TestCase):
+    multi_db = True
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='sticky', email='sticky@example.com',
+            password='sticky-password')
+        User.objects.filter(pk=self.user.pk).update(is_active=True,
+                                                    is_verified=True)
+        self.profile = Profile.objects.get_or_create(user=self.user)[0]
+        reset_routing()
+        self.url = reverse('admin_console:user-detail',
+                           kwargs={'pk': self.profile.pk})
+
+    def test_read_groups_come_from_cached_permission_bits(self):
+        cache.clear()
+        self.user.groups.add(Group.objects.create(name='reporting'))
+        load_bits(self.user.pk)
+        request = RequestFactory().get(self.url)
+        request.user = User.objects.get(pk=self.user.pk)
+        reset_routing()
+        with self.assertNumQueries(0):
+            self.assertTrue(
+                ReplicaRoutingMiddleware(None).reads_from_replica(request))
+
+    def test_detail_view_reads_from_replica(self):
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+    def test_session_reads_its_writes(self):
+        # Logging in writes last_login, which pins the session.
+        response = self.client.post(reverse('accounts:login'), {
+            'username': 'sticky', 'password': 'sticky-password'})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+
+
+class ValidationPolicyTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='policy', email='policy@example.com', password='x')
+
+    def test_full_validation_is_the_default(self):
+        self.assertEqual(current_policy(), FULL)
+        with self.assertRaises(ValidationError):
+            Language(name='').save()
+
+    def test_trusted_skips_field_checks_but_runs_clean(self):
+        self.user.username = 'Renamed User'
+        self.user.email = 'not an email'
+        self.user.save(validation=TRUSTED)
+        self.assertEqual(self.user.slug, 'renamed-user')
+
+    def test_raw_skips_clean(self):
+        self.user.username = 'Raw User'
+        self.user.save(validation=RAW)
+        self.assertEqual(self.user.slug, 'policy')
+
+    def test_context_manager_nests(self):
+        with validation_policy(TRUSTED):
+            with validation_policy(RAW):
+                self.assertEqual(current_policy(), RAW)
+            self.assertEqual(current_policy(), TRUSTED)
+            Language(name='').save()
+        self.assertEqual(current_policy(), FULL)
+
+    def test_update_fields_only_validates_those_fields(self):
+        self.user.email = 'not an email'
+        self.user.first_names = 'Ana'
+        self.user.save(update_fields=['first_names'])
+        self.assertEqual(User.objects.get(pk=self.user.pk).first_names, 'Ana')
+
+    def test_unknown_policy(self):
+        with self.assertRaises(ValueError):
+            validation_policy('lenient')
+
+
+@override_settings(HISTORY_RECORDING='commit')
+class HistoryRecordingTest(TransactionTestCase):
+    """on_commit callbacks only run outside TestCase's transaction."""
+
+    def history(self):
+        return list(AreaCode.history.order_by('history_id').values_list(
+            'code', 'history_type'))
+
+    def test_rows_are_written_on_commit_in_one_query(self):
+        table = AreaCode.history.model._meta.db_table
+        with CaptureQueriesContext(connection) as queries:
+            with transaction.atomic():
+                for code in ('809', '829', '849'):
+                    AreaCode.objects.create(code=code)
+                self.assertEqual(self.history(), [])
+        self.assertEqual(len([query for query in queries.captured_queries
+                              if 'INSERT INTO "%s"' % (table,)
+                              in query['sql']]), 1)
+        self.assertEqual(self.history(), [('809', '+'), ('829', '+'),
+                                          ('849', '+')])
+
+    def test_rolled_back_rows_are_dropped(self):
+        with transaction.atomic():
+            AreaCode.objects.create(code='809')
+            try:
+                with transaction.atomic():
+                    AreaCode.objects.create(code='829')
+                    raise ValueError
+            except ValueError:
+                pass
+            AreaCode.objects.create(code='849')
+        self.assertEqual(self.history(), [('809', '+'), ('849', '+')])
+
+    @override_settings(HISTORY_BUFFER_SIZE=2)
+    def test_full_buffer_is_written_early(self):
+        with transaction.atomic():
+            for code in ('809', '829', '849'):
+                AreaCode.objects.create(code=code)
+            self.assertEqual(len(self.history()), 2)
+        self.assertEqual(len(self.history()), 3)
+
+    def test_outside_transactions_rows_are_written_at_once(self):
+        AreaCode.objects.create(code='809')
+        self.assertEqual(self.history(), [('809', '+')])
+
+    @override_settings(HISTORY_CHANGED_ONLY=True)
+    def test_changed_only_skips_saves_without_changes(self):
+        area_code = AreaCode.objects.create(code='809')
+        area_code.save()
+        area_code = AreaCode.objects.get(pk=area_code.pk)
+        area_code.save()
+        area_code.code = '829'
+        area_code.save()
+        self.assertEqual(self.history(), [('809', '+'), ('829', '~')])
+
+    @override_settings(HISTORY_RECORDING='worker')
+    def test_worker_mode_hands_rows_to_the_task(self):
+        with patch.object(record_history, 'delay',
+                          side_effect=record_history) as delay:
+            with transaction.atomic():
+                AreaCode.objects.create(code='809')
+                AreaCode.objects.create(code='829')
+        self.assertEqual(delay.call_count, 1)
+        self.assertEqual(self.history(), [('809', '+'), ('829', '+')])
+
+    @override_settings(HISTORY_RECORDING='worker')
+    def test_worker_mode_falls_back_to_writing(self):
+        with patch.object(record_history, 'delay', side_effect=OSError):
+            with transaction.atomic():
+                AreaCode.objects.create(code='809')
+        self.assertEqual(self.history(), [('809', '+')])
+
+
+NOW = datetime(2018, 6, 15, tzinfo=timezone.utc)
+DATES = [datetime(2018, month, day, tzinfo=timezone.utc) for month, day in (
+    (1, 5), (1, 20), (2, 10), (2, 25), (6, 1), (6, 10))]
+
+
+@override_settings(HISTORY_RETENTION={
+    '*': {'versions': 2, 'days': 30, 'monthly': True}})
+class HistoryRetentionTest(TestCase):
+
+    def setUp(self):
+        self.area_codes = []
+        for code in ('809', '829'):
+            area_code = AreaCode(code=code)
+            for date in DATES:
+                area_code._history_date = date
+                area_code.save()
+            self.area_codes.append(area_code)
+
+    def dates(self, area_code):
+        return [row.history_date for row in area_code.history.order_by(
+            'history_date')]
+
+    def reports(self, now=NOW, **kwargs):
+        return {report.label: report for report in prune(
+            labels=['accounts.AreaCode'], now=now, **kwargs)}
+
+    def test_keeps_newest_recent_and_monthly_checkpoints(self):
+        report = self.reports()['accounts.HistoricalAreaCode']
+        self.assertEqual((report.rows, report.deleted), (12, 4))
+        for area_code in self.area_codes:
+            self.assertEqual(self.dates(area_code), [
+                DATES[1], DATES[3], DATES[4], DATES[5]])
+
+    def test_chunks_give_the_same_result(self):
+        self.assertEqual(
+            self.reports(chunk_size=1)['accounts.HistoricalAreaCode'].deleted,
+            4)
+        self.assertEqual(self.dates(self.area_codes[0]), [
+            DATES[1], DATES[3], DATES[4], DATES[5]])
+
+    @override_settings(HISTORY_RETENTION={'accounts.AreaCode': {'days': 30}})
+    def test_newest_version_is_always_kept(self):
+        self.reports(now=datetime(2019, 1, 1, tzinfo=timezone.utc))
+        self.assertEqual(self.dates(self.area_codes[0]), [DATES[5]])
+
+    def test_dry_run_reports_without_deleting(self):
+        report = self.reports(dry_run=True)['accounts.HistoricalAreaCode']
+        self.assertEqual(report.deleted, 4)
+        self.assertIsNotNone(report.reclaimed_bytes)
+        self.assertEqual(len(self.dates(self.area_codes[0])), 6)
+
+    @override_settings(HISTORY_RETENTION={})
+    def test_models_without_policy_keep_everything(self):
+        self.assertEqual(self.reports(), {})
+
+    @override_settings(HISTORY_RETENTION={'*': {'weeks': 4}})
+    def test_unknown_policy_keys(self):
+        with self.assertRaises(ImproperlyConfigured):
+            self.reports()
+
+    def test_command_dry_run(self):
+        out = StringIO()
+        call_command('prune_history', 'accounts.AreaCode', '--dry-run',
+                     stdout=out)
+        self.assertIn('accounts.HistoricalAreaCode: 4 of 12 rows would be '
+                      'deleted', out.getvalue())
+        self.assertEqual(len(self.dates(self.area_codes[0])), 6)
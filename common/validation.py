@@ -0,0 +1,86 @@
+"""
+Validation policies for model saves.
+
+Every model save() in the project validates through validate() below,
+according to the policy in effect:
+
+FULL     full_clean(): field validation, clean() and the uniqueness
+         checks (one query per unique field). The default, and what
+         anything handling user input should keep.
+TRUSTED  clean() only. Derived values (slugs, normalized numbers,
+         formatted addresses) and business rules in clean() still
+         apply; field and uniqueness checks are left to the database
+         constraints. For service code saving values it produced or
+         that a form already validated.
+RAW      No validation at all. For batch imports that supply final
+         values; database constraints are the only check.
+
+A policy is chosen per call with save(validation=TRUSTED) or for a block
+of code (and everything it calls, signals included) with
+    with validation_policy(TRUSTED):
+        ...
+Saves restricted with update_fields only validate those fields.
+"""
+import threading
+from functools import wraps
+
+FULL = 'full'
+TRUSTED = 'trusted'
+RAW = 'raw'
+POLICIES = (FULL, TRUSTED, RAW)
+
+_state = threading.local()
+
+
+def current_policy():
+    stack = getattr(_state, 'stack', None)
+    return stack[-1] if stack else FULL
+
+
+class validation_policy:
+    """Context manager and decorator setting the policy for saves made
+    in this thread while it is active."""
+    def __init__(self, policy):
+        if policy not in POLICIES:
+            raise ValueError('Unknown validation policy %r' % (policy,))
+        self.policy = policy
+
+    def __enter__(self):
+        if not hasattr(_state, 'stack'):
+            _state.stack = []
+        _state.stack.append(self.policy)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _state.stack.pop()
+        return False
+
+    def __call__(self, func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with validation_policy(self.policy):
+                return func(*args, **kwargs)
+        return wrapper
+
+
+def validate(instance, policy=None, update_fields=None):
+    """
+    Validates instance before it is saved. `policy` overrides the
+    current one; `update_fields` limits full validation to the fields
+    being written.
+    """
+    policy = policy or current_policy()
+    if policy not in POLICIES:
+        raise ValueError('Unknown validation policy %r' % (policy,))
+    if policy == RAW:
+        return
+    if policy == TRUSTED:
+        instance.clean()
+        return
+    exclude = None
+    if update_fields is not None:
+        update_fields = set(update_fields)
+        exclude = [field.name for field in instance._meta.concrete_fields
+                   if field.name not in update_fields and
+                   field.attname not in update_fields]
+    instance.full_clean(exclude=exclude)
@@ -4,17 +4,27 @@ from django.views.generic import TemplateView
 
 from urllib.parse import unquote
 
-from django.http import HttpResponse, HttpResponseRedirect
+from django.http import HttpResponse, HttpResponseRedirect, JsonResponse
 from django.urls import reverse, translate_url
 from django.utils.http import is_safe_url
 from django.utils.translation import (
     LANGUAGE_SESSION_KEY, check_for_language,
 )
 
+from common.db import check_connection
+
 LANGUAGE_QUERY_PARAMETER = 'language'
 class HomeView(TemplateView):
     template_name = 'home.html'
 
+
+def health_check(request):
+    """For load balancers and orchestrators: 200 when every configured
+    database answers, 503 otherwise."""
+    databases = [check_connection(alias) for alias in settings.DATABASES]
+    status = 200 if all(database['ok'] for database in databases) else 503
+    return JsonResponse({'databases': databases}, status=status)
+
 # def set_language(request):
 #     """
 #     Redirect to a given URL while setting the chosen language in the session
@@ -1,13 +1,15 @@
 # mysite/routing.py
 from channels.auth import AuthMiddlewareStack
 from channels.routing import ProtocolTypeRouter, URLRouter
+import admin_console.routing
 import issue_tracker.routing
 
 application = ProtocolTypeRouter({
     # (http->django views is added by default)
     'websocket': AuthMiddlewareStack(
         URLRouter(
-            issue_tracker.routing.websocket_urlpatterns
+            issue_tracker.routing.websocket_urlpatterns +
+            admin_console.routing.websocket_urlpatterns
         )
     ),
 })
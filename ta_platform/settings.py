@@ -12,6 +12,9 @@ https://docs.djangoproject.com/en/2.0/ref/settings/
 
 import os
 import sys
+from datetime import timedelta
+
+from celery.schedules import crontab
 from django.urls import reverse_lazy
 from django.utils.translation import gettext_lazy as _
 
@@ -72,6 +75,7 @@ INSTALLED_APPS = [
     'admin_console',
     'accounts',
     'applications',
+    'benchmarks',
 ]
 
 SITE_ID = 1
@@ -85,12 +89,14 @@ AUTHENTICATION_BACKENDS = (
 ANONYMOUS_USER_NAME = None
 
 MIDDLEWARE = [
+    'common.db.DatabaseHealthCheckMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.locale.LocaleMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'common.db.ReplicaRoutingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'simple_history.middleware.HistoryRequestMiddleware',
@@ -124,18 +130,109 @@ WSGI_APPLICATION = 'ta_platform.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/2.0/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
-        'TEST': {
+# TA_PLATFORM_DATABASE=postgres selects the production profile; anything
+# else keeps the local SQLite database.
+DATABASE_PROFILE = os.environ.get('TA_PLATFORM_DATABASE', 'sqlite')
+# Behind PgBouncer in transaction pooling mode, consecutive transactions
+# may run on different server connections: server-side cursors would be
+# lost and startup options are rejected, so set statement_timeout on the
+# database role instead (ALTER ROLE ... SET statement_timeout = ...).
+PGBOUNCER = os.environ.get('TA_PLATFORM_PGBOUNCER') == '1'
+DATABASE_STATEMENT_TIMEOUT = 30000 # milliseconds
+DATABASE_HEALTH_CHECK_INTERVAL = 30 # seconds, see common.db
+# Aliases of read replicas; see common.db.ReplicaRouter for what reads them.
+DATABASE_REPLICAS = []
+DATABASE_ROUTERS = ['common.db.ReplicaRouter']
+REPLICA_PIN_SECONDS = 10 # sessions read from the primary after writing
+REPLICA_READ_GROUPS = ['reporting']
+
+if DATABASE_PROFILE == 'postgres':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('TA_PLATFORM_DB_NAME', 'ta_platform'),
+            'USER': os.environ.get('TA_PLATFORM_DB_USER', 'ta_platform'),
+            'PASSWORD': POSTGRES_PASSWD,
+            'HOST': os.environ.get('TA_PLATFORM_DB_HOST', '127.0.0.1'),
+            'PORT': os.environ.get('TA_PLATFORM_DB_PORT',
+                                   '6432' if PGBOUNCER else '5432'),
+            'CONN_MAX_AGE': int(os.environ.get('TA_PLATFORM_CONN_MAX_AGE', 600)),
+            'DISABLE_SERVER_SIDE_CURSORS': PGBOUNCER,
+            'OPTIONS': {
+                'connect_timeout': 5,
+            },
+        }
+    }
+    if not PGBOUNCER:
+        DATABASES['default']['OPTIONS']['options'] = (
+            '-c statement_timeout=%d' % (DATABASE_STATEMENT_TIMEOUT,))
+    # Comma separated hosts of streaming replicas of the same database.
+    replica_hosts = os.environ.get('TA_PLATFORM_DB_REPLICA_HOSTS', '')
+    for index, host in enumerate(filter(None, replica_hosts.split(','))):
+        alias = 'replica_%d' % (index + 1,)
+        DATABASES[alias] = dict(DATABASES['default'], HOST=host.strip(),
+                                TEST={'MIRROR': 'default'})
+        DATABASE_REPLICAS.append(alias)
+else:
+    DATABASES = {
+        'default': {
             'ENGINE': 'django.db.backends.sqlite3',
-            'NAME': os.path.join(BASE_DIR, 'testdb.sqlite3'),
+            'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+            'TEST': {
+                'ENGINE': 'django.db.backends.sqlite3',
+                'NAME': os.path.join(BASE_DIR, 'testdb.sqlite3'),
+            }
         }
     }
-}
-if 'test' in sys.argv and '--keepdb' in sys.argv:
-    DATABASES['default']['TEST']['NAME'] = '/dev/shm/ta_platform.test.db.sqlite3'
+    if 'test' in sys.argv:
+        # A second, independent database for the replica routing tests;
+        # they enable it with override_settings(DATABASE_REPLICAS=...).
+        DATABASES['replica'] = {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.path.join(BASE_DIR, 'db.replica.sqlite3'),
+            'TEST': {
+                'ENGINE': 'django.db.backends.sqlite3',
+                'NAME': os.path.join(BASE_DIR, 'testdb.replica.sqlite3'),
+            }
+        }
+    if 'test' in sys.argv and '--keepdb' in sys.argv:
+        DATABASES['default']['TEST']['NAME'] = '/dev/shm/ta_platform.test.db.sqlite3'
+        DATABASES['replica']['TEST']['NAME'] = '/dev/shm/ta_platform.test.replica.sqlite3'
+
+# Cache and sessions
+# TA_PLATFORM_CACHE=locmem runs without Redis (single process only); tests
+# always use locmem.
+CACHE_PROFILE = os.environ.get('TA_PLATFORM_CACHE', 'redis')
+
+if CACHE_PROFILE == 'redis' and 'test' not in sys.argv:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django_redis.cache.RedisCache',
+            'LOCATION': os.environ.get('TA_PLATFORM_REDIS_URL',
+                                       'redis://127.0.0.1:6379/1'),
+            'KEY_PREFIX': 'ta_platform',
+            'KEY_FUNCTION': 'common.cache.make_key',
+            'OPTIONS': {
+                'CLIENT_CLASS': 'django_redis.client.DefaultClient',
+                'SOCKET_CONNECT_TIMEOUT': 1, # seconds
+                'SOCKET_TIMEOUT': 1,
+            },
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'ta_platform',
+            'KEY_PREFIX': 'ta_platform',
+            'KEY_FUNCTION': 'common.cache.make_key',
+        }
+    }
+
+# Reads come from the cache and only writes reach the database. Signed
+# cookies would avoid the table entirely, but the verification token is
+# kept in the session and must not travel to the browser.
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
 
 # Password validation
 # https://docs.djangoproject.com/en/2.0/ref/settings/#auth-password-validators
@@ -211,11 +308,56 @@ INTERNAL_IPS = ['127.0.0.1']
 # General Application settings
 ENFORCE_MIN_AGE = True
 MINIMUM_AGE_ALLOWED = 18 # ignored if ENFORCE_MIN_AGE is False
+MIN_DAYS_BETWEEN_APPLICATIONS = 30
+# Closed applications older than this move to the archive table
+# (manage.py archive_applications).
+ARCHIVE_APPLICATIONS_AFTER_DAYS = 365
+# Report artifacts are served to identical requests for this long;
+# queued or running report jobs older than REPORT_JOB_TIMEOUT are
+# considered lost.
+REPORT_ARTIFACT_TTL = timedelta(hours=6)
+REPORT_JOB_TIMEOUT = timedelta(hours=1)
+# Funnel snapshots for applications.analytics (manage.py snapshot_funnel).
+ANALYTICS_SNAPSHOT_DIR = os.path.join(BASE_DIR, 'snapshots')
+# How history rows are written, see common.history: 'sync', 'commit'
+# (bulk, when the transaction commits) or 'worker' (by Celery).
+HISTORY_RECORDING = os.environ.get('TA_PLATFORM_HISTORY_RECORDING', 'sync')
+HISTORY_CHANGED_ONLY = False
+HISTORY_BUFFER_SIZE = 500
+# History kept per tracked model ('app_label.Model', '*' for the rest),
+# see common.retention; pruned nightly and by manage.py prune_history.
+# accounts.audit.as_of() replays users, groups and permissions from
+# their history, so theirs is all kept (an empty policy).
+HISTORY_RETENTION = {
+    'accounts.User': {},
+    'auth.Group': {},
+    'auth.Permission': {},
+    '*': {'versions': 20, 'days': 365, 'monthly': True},
+}
+HISTORY_PRUNE_CHUNK_SIZE = 1000
 
 CELERY_BROKER_URL = 'redis://127.0.0.1:6379'
 CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
+CELERY_BEAT_SCHEDULE = {
+    'snapshot-funnel': {
+        'task': 'applications.tasks.snapshot_funnel',
+        'schedule': crontab(hour=3, minute=0),
+    },
+    'prune-history': {
+        'task': 'accounts.tasks.prune_history',
+        'schedule': crontab(hour=4, minute=0),
+    },
+    'checkpoint-memberships': {
+        'task': 'accounts.tasks.checkpoint_memberships',
+        'schedule': crontab(hour=2, minute=0, day_of_week='sunday'),
+    },
+    'purge-report-artifacts': {
+        'task': 'admin_console.tasks.purge_report_artifacts',
+        'schedule': timedelta(hours=1),
+    },
+}
 
 
 # Django-channels settings
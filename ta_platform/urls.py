@@ -21,13 +21,14 @@ from django.utils.translation import gettext_lazy as _
 from django.conf.urls.static import static
 from django.views.i18n import JavaScriptCatalog
 
-from common.views import HomeView
+from common.views import HomeView, health_check
 
 admin.site.site_header = "{} administration".format(settings.BRAND_DICT['COMPANY_NAME'])
 
 urlpatterns = [
     # path('its/', include('issue_tracker.urls', namespace='its')),
     path('i18n/', include('django.conf.urls.i18n')),
+    path('health/', health_check, name='health'),
 ] + static(settings.STATIC_URL, document_root=settings.STATIC_ROOT) + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
 
 urlpatterns += i18n_patterns(